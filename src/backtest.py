@@ -1,47 +1,269 @@
 #!/usr/bin/python
+"""Backtests a buy-below-the-SMA, sell-at-a-profit-target strategy over OHLC bars.
 
+The strategy buys with all funds at the open of a bar whose open is at or below the simple moving
+average of the last window opens, then sells the whole position at the high of the first later
+bar that clears the dollar profit target. A position still open at the end is valued at the last
+close. Run with:
+
+    python -m src.backtest < bars.csv
+    python -m src.backtest --sma 5 10 20 --target 50 100 --funds 10000 --workers 4 < bars.csv
+
+Bars are timestamp,open,high,low,close rows. --save-binary converts them to a .npy file that later
+runs memory-map with --binary, so workers share the bars instead of each parsing or pickling them.
+One combination prints its trades; several are swept in one batched pass and ranked.
+"""
+import argparse
+import itertools
 import sys
-import csv
-import pydash
-import pandas as pd
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
-import matplotlib.pyplot as plt
-from datetime import timedelta
-
-starting_funds = 10000
-
-funds = starting_funds
-cb = []
-
-ohlc = csv.reader(sys.stdin)
-ticks = pydash.arrays.unzip(ohlc)
-timestamps = np.asarray(list(map(int, ticks[0])))
-opens, highs, lows, closes = (np.asarray(list(map(float, e))) for e in ticks[1:5])
-
-sma = pd.Series(opens).rolling(10).mean()
-
-for tick in range(len(timestamps)):
-  price = opens[tick]
-  if sma[tick] >= price and funds > 0 and not cb:
-    # Buy
-    qty = funds / price
-    funds = 0
-    print(f"{timestamps[tick]}: Bought {qty} BTC at ${price:.2f}, funds = ${funds:.2f}")
-    cb.append((timestamps[tick], qty, price))
-  elif cb and highs[tick] > cb[0][2] + 100 / cb[0][1]:
-    # Sell
-    bought, qty, cost_basis = cb.pop()
-    profit = qty * (highs[tick] - cost_basis)
-    funds += qty * highs[tick]
-    held = int((timestamps[tick] - bought) / 60)
-    print(f"+{held}m: Sold {qty} BTC at ${highs[tick]:.2f}, cb = ${cost_basis:.2f}, profit = ${profit:.2f}, funds = ${funds:.2f}")
-  
-for _, qty, _ in cb:
-  funds += qty * closes[-1]
-
-print(f"Ended with {funds:.2f}")
-print(f"Holding would have ended with {starting_funds / opens[0] * closes[-1]:.2f}")
-
-#plt.plot(opens)
-#plt.plot(sma)
-#plt.show()
+
+OHLC = namedtuple("OHLC", ["timestamps", "opens", "highs", "lows", "closes"])
+
+# Parameters and outcome of every combination in a sweep, as arrays in the same order.
+Sweep = namedtuple("Sweep", ["windows", "targets", "funds", "final", "trades"])
+
+# One buy or sell of a single combination: the bar it happened on, quantity, price, funds after.
+Fill = namedtuple("Fill", ["side", "tick", "qty", "price", "funds"])
+
+
+def load_csv(source):
+    """Reads timestamp,open,high,low,close rows from a path or file into an OHLC of arrays."""
+    bars = np.loadtxt(source, delimiter=",", usecols=range(5), dtype=np.float64, ndmin=2)
+    return from_array(bars.T)
+
+
+def from_array(bars):
+    return OHLC(bars[0].astype(np.int64), bars[1], bars[2], bars[3], bars[4])
+
+
+def save_binary(ohlc, path):
+    """Writes bars as a (5, bars) float64 .npy file that load_binary can memory-map."""
+    np.save(path, np.stack([np.asarray(column, dtype=np.float64) for column in ohlc]))
+
+
+def load_binary(path):
+    bars = np.load(path, mmap_mode="r")
+    return OHLC(bars[0].astype(np.int64), bars[1], bars[2], bars[3], bars[4])
+
+
+def sma(values, window):
+    """Returns the simple moving average of the last window values, NaN before the first."""
+    sums = np.cumsum(np.concatenate(([0.0], values)))
+    average = np.full(len(values), np.nan)
+    average[window - 1:] = (sums[window:] - sums[:-window]) / window
+    return average
+
+
+class RunningMaxima:
+    """Finds the first bar at or after a start whose value clears a threshold, for many at once.
+
+    Values are grouped into blocks with a sparse table of block maxima, so each query scans at
+    most two blocks and jumps over the rest in log(blocks) vectorized steps.
+    """
+
+    def __init__(self, values, block=64):
+        self.size = len(values)
+        self.block = block
+        blocks = -(-self.size // block) or 1
+        self.values = np.full(blocks * block, -np.inf)
+        self.values[:self.size] = values
+        self.levels = [self.values.reshape(blocks, block).max(axis=1)]
+        while 2 ** len(self.levels) <= blocks:
+            previous = self.levels[-1]
+            step = 2 ** (len(self.levels) - 1)
+            level = previous.copy()
+            level[:-step] = np.maximum(previous[:-step], previous[step:])
+            self.levels.append(level)
+
+    def _scan(self, blocks, starts, thresholds):
+        ticks = blocks[:, None] * self.block + np.arange(self.block)
+        hits = (self.values[ticks] > thresholds[:, None]) & (ticks >= starts[:, None])
+        return hits.any(axis=1), ticks[:, 0] + hits.argmax(axis=1)
+
+    def first_above(self, starts, thresholds):
+        """Returns the first index >= each start whose value is > its threshold, or size."""
+        starts = np.asarray(starts, dtype=np.int64)
+        thresholds = np.asarray(thresholds, dtype=np.float64)
+        result = np.full(len(starts), self.size, dtype=np.int64)
+        inside = starts < self.size
+        starts, thresholds = starts[inside], thresholds[inside]
+
+        block = starts // self.block
+        found, ticks = self._scan(block, starts, thresholds)
+
+        # Skip whole blocks whose maximum doesn't clear the threshold, largest jumps first.
+        count = len(self.levels[0])
+        block = block + 1
+        for size, level in reversed(list(enumerate(self.levels))):
+            index = np.minimum(block, count - 1)
+            skip = (block < count) & (level[index] <= thresholds)
+            block = np.where(skip, block + 2 ** size, block)
+        later = ~found & (block < count)
+        _, later_ticks = self._scan(np.minimum(block, count - 1), starts, thresholds)
+        ticks = np.where(found, ticks, np.where(later, later_ticks, self.size))
+        result[inside] = ticks
+        return result
+
+
+def run(ohlc, windows, targets, funds, fills=None):
+    """Backtests every combination of window, target and starting funds, given as arrays.
+
+    All combinations advance together, one buy or sell each per round, so a round costs a few
+    NumPy operations however many combinations there are and the number of rounds is the most
+    trades any one of them makes. Returns final funds and completed trades per combination.
+    If fills is a list, (combination, Fill) pairs are appended to it as they happen.
+    """
+    opens = np.asarray(ohlc.opens, dtype=np.float64)
+    highs = np.asarray(ohlc.highs, dtype=np.float64)
+    closes = np.asarray(ohlc.closes, dtype=np.float64)
+    windows = np.asarray(windows, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.float64)
+    cash = np.array(funds, dtype=np.float64)
+    bars = len(opens)
+    combos = len(windows)
+
+    # Every window's signal bars in one sorted array, keyed by window index * (bars + 1) + bar.
+    unique, window_index = np.unique(windows, return_inverse=True)
+    stride = bars + 1
+    signals = np.concatenate([np.flatnonzero(sma(opens, window) >= opens) + index * stride
+                              for index, window in enumerate(unique)] or [np.empty(0, np.int64)])
+    maxima = RunningMaxima(highs)
+
+    qty = np.zeros(combos)
+    entry = np.zeros(combos)
+    cursor = np.zeros(combos, dtype=np.int64)
+    holding = np.zeros(combos, dtype=bool)
+    trades = np.zeros(combos, dtype=np.int64)
+    active = np.arange(combos)
+
+    while active.size:
+        flat = active[~holding[active]]
+        keys = window_index[flat] * stride + cursor[flat]
+        position = np.searchsorted(signals, keys)
+        key = signals[np.minimum(position, len(signals) - 1)] if len(signals) else keys - 1
+        enter = (position < len(signals)) & (key // stride == window_index[flat]) & (cash[flat] > 0)
+        buyers = flat[enter]
+        ticks = key[enter] % stride
+        entry[buyers] = opens[ticks]
+        qty[buyers] = cash[buyers] / opens[ticks]
+        cash[buyers] = 0
+        holding[buyers] = True
+        cursor[buyers] = ticks + 1
+        if fills is not None:
+            _record(fills, "buy", buyers, ticks, qty[buyers], entry[buyers], cash[buyers])
+
+        sellers = active[holding[active]]
+        targets_at = entry[sellers] + targets[sellers] / qty[sellers]
+        ticks = maxima.first_above(cursor[sellers], targets_at)
+        sold = ticks < bars
+        sellers, ticks = sellers[sold], ticks[sold]
+        cash[sellers] = qty[sellers] * highs[ticks]
+        if fills is not None:
+            _record(fills, "sell", sellers, ticks, qty[sellers], highs[ticks], cash[sellers])
+        qty[sellers] = 0
+        holding[sellers] = False
+        trades[sellers] += 1
+        cursor[sellers] = ticks + 1
+
+        # Flat combinations that found no signal and positions that never sold are finished.
+        progressed = np.zeros(combos, dtype=bool)
+        progressed[buyers] = True
+        progressed[sellers] = True
+        active = active[progressed[active] & (cursor[active] < bars)]
+
+    if bars:
+        cash += qty * closes[-1]
+    return cash, trades
+
+
+def _record(fills, side, combos, ticks, qty, prices, funds):
+    for combo, *fill in zip(combos.tolist(), ticks.tolist(), qty.tolist(), prices.tolist(),
+                            funds.tolist()):
+        fills.append((combo, Fill(side, *fill)))
+
+
+def grid(windows, targets, funds):
+    """Returns every combination of the given windows, targets and starting funds as arrays."""
+    combos = np.array(list(itertools.product(windows, targets, funds)), dtype=np.float64)
+    combos = combos.reshape(-1, 3)
+    return combos[:, 0].astype(np.int64), combos[:, 1], combos[:, 2]
+
+
+def _run_chunk(source, windows, targets, funds):
+    ohlc = load_binary(source) if isinstance(source, str) else source
+    return run(ohlc, windows, targets, funds)
+
+
+def sweep(source, windows, targets, funds, workers=None):
+    """Backtests the grid of windows x targets x funds over an OHLC or a .npy path of bars.
+
+    With workers, the grid is split across a process pool. Passing a path lets every worker
+    memory-map the bars rather than receive a pickled copy.
+    """
+    windows, targets, funds = grid(windows, targets, funds)
+    if not workers or workers <= 1 or len(windows) < 2:
+        final, trades = _run_chunk(source, windows, targets, funds)
+    else:
+        chunks = np.array_split(np.arange(len(windows)), min(workers, len(windows)))
+        with ProcessPoolExecutor(len(chunks)) as executor:
+            results = list(executor.map(_run_chunk, itertools.repeat(source),
+                                        *zip(*[(windows[c], targets[c], funds[c])
+                                               for c in chunks])))
+        final = np.concatenate([result[0] for result in results])
+        trades = np.concatenate([result[1] for result in results])
+    return Sweep(windows, targets, funds, final, trades)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sma", type=int, nargs="+", default=[10])
+    parser.add_argument("--target", type=float, nargs="+", default=[100])
+    parser.add_argument("--funds", type=float, nargs="+", default=[10000])
+    parser.add_argument("--binary", help="memory-map bars from this .npy file instead of stdin")
+    parser.add_argument("--save-binary", help="write the bars read from stdin to this .npy file")
+    parser.add_argument("--workers", type=int, help="sweep in this many processes")
+    parser.add_argument("--top", type=int, default=10, help="how many combinations to list")
+    args = parser.parse_args(argv)
+
+    ohlc = load_binary(args.binary) if args.binary else load_csv(sys.stdin)
+    if args.save_binary:
+        save_binary(ohlc, args.save_binary)
+    if not len(ohlc.opens):
+        print("No bars")
+        return
+
+    holding = ohlc.closes[-1] / ohlc.opens[0]
+    if len(args.sma) * len(args.target) * len(args.funds) == 1:
+        fills = []
+        final, _ = run(ohlc, args.sma, args.target, args.funds, fills)
+        bought = None
+        for _, fill in fills:
+            timestamp = ohlc.timestamps[fill.tick]
+            if fill.side == "buy":
+                bought = fill
+                print(f"{timestamp}: Bought {fill.qty} BTC at ${fill.price:.2f}, funds = $0.00")
+            else:
+                held = int((timestamp - ohlc.timestamps[bought.tick]) / 60)
+                profit = fill.qty * (fill.price - bought.price)
+                print(f"+{held}m: Sold {fill.qty} BTC at ${fill.price:.2f}, "
+                      f"cb = ${bought.price:.2f}, profit = ${profit:.2f}, "
+                      f"funds = ${fill.funds:.2f}")
+        print(f"Ended with {final[0]:.2f}")
+        print(f"Holding would have ended with {args.funds[0] * holding:.2f}")
+        return
+
+    result = sweep(args.binary or ohlc, args.sma, args.target, args.funds, args.workers)
+    returns = result.final / result.funds - 1
+    print(f"{len(returns)} combinations, holding returned {(holding - 1) * 100:.2f}%")
+    for index in np.argsort(-returns, kind="stable")[:args.top]:
+        print(f"SMA {result.windows[index]:>4}, target ${result.targets[index]:.2f}, "
+              f"funds ${result.funds[index]:.2f}: ended with ${result.final[index]:.2f} "
+              f"({returns[index] * 100:.2f}%) after {result.trades[index]} trades")
+
+
+if __name__ == "__main__":
+    main()
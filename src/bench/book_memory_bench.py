@@ -0,0 +1,63 @@
+"""Memory of a RateTable's books against the lists of (price, volume) tuples they replaced.
+
+Run with: python -m src.bench.book_memory_bench [--coins 40 --exchanges 8]
+
+Each depth is measured once the books are stored and again after a search has priced them,
+since array sides build their cumulative depth on first use.
+"""
+import argparse
+import gc
+import tracemalloc
+
+from src.bench.market import generate_market, load_table
+from src.rate_table import RateTable
+
+
+def list_table(market):
+    """Stores every book the way RateTable did before BookSide: bids and inverted asks."""
+    table = {}
+    for exchange, books in market.books.items():
+        marginal = table.setdefault(exchange, {})
+        for pair, book in books.items():
+            coin1, coin2 = pair.split("/")
+            marginal.setdefault(coin1, {})[coin2] = [(bid, volume)
+                                                     for bid, volume in book["bids"]]
+            marginal.setdefault(coin2, {})[coin1] = [(1 / ask, ask * volume)
+                                                     for ask, volume in book["asks"]]
+    return table
+
+
+def traced(func):
+    gc.collect()
+    tracemalloc.start()
+    result = func()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--coins", type=int, default=40)
+    parser.add_argument("--exchanges", type=int, default=8)
+    parser.add_argument("--depths", type=int, nargs="+", default=[1, 5, 20])
+    args = parser.parse_args()
+
+    for depth in args.depths:
+        market = generate_market(seed=0, coins=args.coins, exchanges=args.exchanges, depth=depth)
+        markets = sum(len(books) for books in market.books.values())
+        lists, list_size = traced(lambda: list_table(market))
+        del lists
+        table, side_size = traced(lambda: load_table(RateTable(), market))
+
+        tracemalloc.start()
+        table.best_roundtrips("C0", 0.01, max_steps=2)
+        searched_size = side_size + tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"depth {depth:>3}, {markets} markets: lists {list_size / 2 ** 20:6.2f} MiB, "
+              f"books {side_size / 2 ** 20:6.2f} MiB, "
+              f"after a search {searched_size / 2 ** 20:6.2f} MiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Seeded synthetic markets for benchmarks: many coins on many exchanges, with planted arbitrage.
+
+Every coin gets a reference value, and each exchange quotes every listed pair around the ratio of
+the two values with a spread wider than its noise, so a market without planted cycles has no
+profitable roundtrips. A planted cycle lifts the bids along a loop of coins so it pays out.
+"""
+import random
+from collections import namedtuple
+
+Market = namedtuple("Market", ["books", "cycles"])
+
+
+def generate_market(seed=0, coins=20, exchanges=4, depth=20, density=0.5, cycles=3,
+                    cycle_length=3, edge=0.05, spread=0.004, noise=0.001):
+    """Returns a Market of ccxt-style books and the arbitrage cycles planted in them.
+
+    books maps exchange name -> pair like "C1/C0" -> {"bids": [...], "asks": [...]}.
+    cycles lists each planted loop as (exchange, [coin, ...]), starting and ending at coin 0,
+    each of which pays about (1 + edge) ** cycle_length - 1 on small amounts.
+    """
+    rng = random.Random(seed)
+    names = [f"C{index}" for index in range(coins)]
+    values = {name: rng.uniform(0.01, 100) for name in names}
+    exchange_names = [f"Exchange{index}" for index in range(exchanges)]
+
+    books = {exchange: {} for exchange in exchange_names}
+    for exchange in exchange_names:
+        for base_index, base in enumerate(names):
+            for quote in names[:base_index]:
+                if quote != names[0] and rng.random() > density:
+                    continue
+                mid = values[base] / values[quote] * rng.uniform(1 - noise, 1 + noise)
+                books[exchange][f"{base}/{quote}"] = _book(rng, mid, depth, spread)
+
+    planted = []
+    for _ in range(cycles if coins > cycle_length else 0):
+        exchange = rng.choice(exchange_names)
+        path = [names[0]] + rng.sample(names[1:], cycle_length - 1) + [names[0]]
+        for from_cur, to_cur in zip(path, path[1:]):
+            _plant(rng, books[exchange], from_cur, to_cur, values, depth, spread, edge)
+        planted.append((exchange, path))
+    return Market(books, planted)
+
+
+def _book(rng, mid, depth, spread):
+    bids = [[mid * (1 - spread / 2) * (1 - 0.001 * level), rng.uniform(1, 50)]
+            for level in range(depth)]
+    asks = [[mid * (1 + spread / 2) * (1 + 0.001 * level), rng.uniform(1, 50)]
+            for level in range(depth)]
+    return {"bids": bids, "asks": asks}
+
+
+def _plant(rng, books, from_cur, to_cur, values, depth, spread, edge):
+    # Shift the whole book so the top rate from from_cur to to_cur beats the reference by edge.
+    # Selling base for quote fills at the bid, buying base with quote at 1 / the ask.
+    rate = values[from_cur] / values[to_cur] * (1 + edge)
+    if f"{from_cur}/{to_cur}" in books or f"{to_cur}/{from_cur}" not in books:
+        books[f"{from_cur}/{to_cur}"] = _book(rng, rate / (1 - spread / 2), depth, spread)
+    else:
+        books[f"{to_cur}/{from_cur}"] = _book(rng, 1 / rate / (1 + spread / 2), depth, spread)
+
+
+def load_table(table, market):
+    """Stores every book in a market into a RateTable."""
+    for exchange, books in market.books.items():
+        table.set_books(exchange, {pair: (book["bids"], book["asks"])
+                                   for pair, book in books.items()})
+    return table
+
+
+def mock_exchanges(market):
+    """Returns a MockExchange per exchange in a market, holding its books."""
+    from src.test.mock_exchange import MockExchange
+
+    exchanges = []
+    for name, books in market.books.items():
+        exchange = MockExchange({"name": name})
+        for pair, book in books.items():
+            for price, volume in book["bids"]:
+                exchange.add_bid(pair, price, volume)
+            for price, volume in book["asks"]:
+                exchange.add_ask(pair, price, volume)
+        exchanges.append(exchange)
+    return exchanges
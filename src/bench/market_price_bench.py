@@ -0,0 +1,53 @@
+"""Microbenchmark for RateTable.get_market_price, the innermost loop of best_roundtrips.
+
+Run with: python -m src.bench.market_price_bench
+"""
+import random
+import timeit
+
+import numpy as np
+
+from src.order_book import BookSide
+from src.rate_table import RateTable
+
+DEPTH = 55
+BOOKS = 200
+AMOUNTS = 50
+
+
+def make_books(seed=0):
+    rng = random.Random(seed)
+    books = []
+    for _ in range(BOOKS):
+        prices = sorted((rng.uniform(0.5, 2.0) for _ in range(DEPTH)), reverse=True)
+        books.append(BookSide.from_orders([(price, rng.uniform(0.1, 10)) for price in prices]))
+    return books
+
+
+def main():
+    books = make_books()
+    lists = [list(book) for book in books]
+    amounts = np.linspace(0.5, DEPTH * 5, AMOUNTS)
+    calls = BOOKS * AMOUNTS
+
+    def walk():
+        for book in lists:
+            for amount in amounts:
+                RateTable.get_market_price(book, amount)
+
+    def lookup():
+        for book in books:
+            for amount in amounts:
+                RateTable.get_market_price(book, amount)
+
+    def batched():
+        RateTable.get_market_prices(books, np.tile(amounts, (BOOKS, 1)))
+
+    lookup()  # Build the cumulative depth arrays up front.
+    for name, func in (("level walk", walk), ("searchsorted", lookup), ("batched", batched)):
+        seconds = min(timeit.repeat(func, number=1, repeat=5))
+        print(f"{name:>12}: {seconds * 1e3:8.2f} ms, {seconds / calls * 1e9:8.1f} ns per price")
+
+
+if __name__ == "__main__":
+    main()
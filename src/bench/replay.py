@@ -0,0 +1,94 @@
+"""Replays a capture file and times the roundtrip search after every record it stores.
+
+Run with: python -m src.bench.replay capture.bin --currency ETH --amount 10 [--speed 10]
+
+Captures are recorded by Sharpshooter(capture=path). By default records are replayed back to back,
+so the run is deterministic and measures only the search; --speed keeps their original spacing,
+scaled. The report is JSON like src.bench.suite's, with percentiles over every search.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+
+from src.capture import replay
+from src.rate_table import RateTable
+from src.roundtrip_tracker import RoundtripTracker
+
+
+def run(args):
+    table = RateTable()
+    tracker = RoundtripTracker(table, args.currency, args.amount, max_steps=args.max_steps,
+                               min_profit=args.min_profit)
+    timings = []
+    found = []
+
+    def search(table, at):
+        started = time.perf_counter()
+        if args.full:
+            roundtrips = table.best_roundtrips(args.currency, args.amount,
+                                               max_steps=args.max_steps,
+                                               min_profit=args.min_profit)
+        else:
+            roundtrips = tracker.update()
+        timings.append(time.perf_counter() - started)
+        found.append(len(roundtrips))
+
+    loop = asyncio.new_event_loop()
+    try:
+        started = time.perf_counter()
+        records = loop.run_until_complete(replay(args.capture, table, speed=args.speed,
+                                                 on_record=search))
+        elapsed = time.perf_counter() - started
+    finally:
+        loop.close()
+
+    timings.sort()
+    return {
+        "created": time.time(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "capture": args.capture,
+        "params": {"currency": args.currency, "amount": args.amount,
+                   "max_steps": args.max_steps, "min_profit": args.min_profit,
+                   "engine": "full" if args.full else "incremental", "speed": args.speed},
+        "records": records,
+        "elapsed_s": elapsed,
+        "search": {
+            "total_s": sum(timings),
+            "median_s": statistics.median(timings) if timings else None,
+            "p99_s": timings[int(len(timings) * 0.99)] if timings else None,
+            "max_s": timings[-1] if timings else None,
+        },
+        "roundtrips_found": found,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("capture")
+    parser.add_argument("--currency", default="ETH")
+    parser.add_argument("--amount", type=float, default=10)
+    parser.add_argument("--max-steps", type=int, default=3)
+    parser.add_argument("--min-profit", type=float, default=None)
+    parser.add_argument("--full", action="store_true",
+                        help="run best_roundtrips from scratch instead of incremental updates")
+    parser.add_argument("--speed", type=float, default=None,
+                        help="replay at this multiple of the original speed")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Times populate, the roundtrip and spread searches and get_market_price on a synthetic market.
+
+Run with: python -m src.bench.suite [--coins 12 --exchanges 3 ...] [--output results.json]
+
+Results are written as JSON, one entry per benchmark with the best and median of several runs,
+so numbers from different versions can be compared.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+
+import numpy as np
+
+from src.bench.market import generate_market, load_table, mock_exchanges
+from src.rate_table import RateTable
+
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return {"best_s": min(timings), "median_s": statistics.median(timings), "runs": repeat}
+
+
+def bench_populate(market, repeat):
+    exchanges = mock_exchanges(market)
+    loop = asyncio.new_event_loop()
+
+    def populate():
+        table = RateTable()
+        loop.run_until_complete(asyncio.gather(*[table.populate(exchange)
+                                                 for exchange in exchanges]))
+
+    try:
+        return measure(populate, repeat)
+    finally:
+        loop.close()
+
+
+def run(args):
+    market = generate_market(seed=args.seed, coins=args.coins, exchanges=args.exchanges,
+                             depth=args.depth, density=args.density, cycles=args.cycles)
+    table = load_table(RateTable(), market)
+    results = []
+
+    def record(name, timing, **params):
+        results.append(dict(name=name, params=params, **timing))
+        print(f"{name:>16} {json.dumps(params):<40} {timing['best_s'] * 1e3:10.2f} ms",
+              file=sys.stderr)
+
+    if not args.skip_populate:
+        record("populate", bench_populate(market, args.repeat))
+
+    record("set_books", measure(lambda: load_table(RateTable(), market), args.repeat))
+
+    for steps in range(2, args.max_steps + 1):
+        for min_profit in (None, 0.025):
+            record("best_roundtrips", measure(
+                lambda: table.best_roundtrips("C0", args.amount, max_steps=steps,
+                                              min_profit=min_profit), args.repeat),
+                steps=steps, min_profit=min_profit)
+
+    record("pairwise_diffs", measure(lambda: table.pairwise_diffs("C1", "C0"), args.repeat))
+    for size in (None, args.amount):
+        record("best_spreads", measure(lambda: table.best_spreads(size), args.repeat), size=size)
+
+    books = [book for exchange in table.values() for row in exchange.values()
+             for book in row.values()]
+    amounts = np.linspace(0.1, 50, 20)
+
+    def market_price():
+        for book in books:
+            for amount in amounts:
+                RateTable.get_market_price(book, amount)
+
+    market_price()  # Build the cumulative depth arrays up front.
+    record("get_market_price", measure(market_price, args.repeat), calls=len(books) * 20)
+
+    return {
+        "created": time.time(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "market": {"seed": args.seed, "coins": args.coins, "exchanges": args.exchanges,
+                   "depth": args.depth, "density": args.density, "cycles": args.cycles,
+                   "books": len(books) // 2},
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--coins", type=int, default=12)
+    parser.add_argument("--exchanges", type=int, default=3)
+    parser.add_argument("--depth", type=int, default=20)
+    parser.add_argument("--density", type=float, default=0.3)
+    parser.add_argument("--cycles", type=int, default=3)
+    parser.add_argument("--amount", type=float, default=0.5)
+    parser.add_argument("--max-steps", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--skip-populate", action="store_true",
+                        help="skip the populate benchmark, which needs a working ccxt")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args(argv)
+
+    report = run(args)
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Memory and throughput of the tuple-backed Trade and Chain against the UserDict Trade.
+
+Run with: python -m src.bench.trade_bench
+"""
+import timeit
+import tracemalloc
+from collections import UserDict
+
+from src.trade import Chain, Trade
+
+CHAINS = 20000
+STEPS = 4
+COINS = [f"C{step}" for step in range(STEPS + 1)]
+
+
+class DictTrade(UserDict):
+    """The UserDict Trade that Trade replaced."""
+
+    def __init__(self, exchange, from_cur, next_cur, amount, limit, value):
+        super(DictTrade, self).__init__(
+            exchange=exchange,
+            from_cur=from_cur,
+            next_cur=next_cur,
+            amount=amount,
+            limit=limit,
+            value=value
+        )
+
+    def get_unique(self):
+        return self["exchange"], self["from_cur"], self["next_cur"]
+
+    def get_unique_inv(self):
+        return self["exchange"], self["next_cur"], self["from_cur"]
+
+
+def dict_chains():
+    chains = []
+    for index in range(CHAINS):
+        trades = []
+        for step in range(STEPS):
+            trade = DictTrade("Mock", COINS[step], COINS[step + 1], index, 1.0, 1.001)
+            pairs = set(t.get_unique() for t in trades)
+            if trade.get_unique() in pairs or trade.get_unique_inv() in pairs:
+                continue
+            trades = trades + [trade]
+        profit = 1.0
+        for trade in trades:
+            profit *= trade["value"]
+        chains.append(trades)
+    return chains
+
+
+def tuple_chains():
+    chains = []
+    for index in range(CHAINS):
+        chain = Chain()
+        for step in range(STEPS):
+            trade = Trade("Mock", COINS[step], COINS[step + 1], index, 1.0, 1.001)
+            if chain.uses(trade.get_unique()):
+                continue
+            chain = chain.then(trade)
+        Trade.profitability(chain)
+        chains.append(chain)
+    return chains
+
+
+def main():
+    for name, func in (("UserDict", dict_chains), ("tuple", tuple_chains)):
+        seconds = min(timeit.repeat(func, number=1, repeat=5))
+        tracemalloc.start()
+        chains = func()
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del chains
+        print(f"{name:>9}: {seconds * 1e3:8.2f} ms, {size / CHAINS:8.0f} bytes per "
+              f"{STEPS}-step chain")
+
+
+if __name__ == "__main__":
+    main()
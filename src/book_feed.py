@@ -0,0 +1,114 @@
+import json
+import logging
+
+import aiohttp
+
+
+class BookFeed:
+    """Pushes order book snapshot and diff messages for one exchange.
+
+    Messages are dicts like {"type": "snapshot" or "diff", "symbol": "ETH/BTC", "sequence": 7,
+    "bids": [[price, volume], ...], "asks": [...]}. A diff level with zero volume removes that
+    price. Each symbol's sequence numbers count up by one per message, so a skipped number means
+    a diff was lost and the book has to be snapshotted again.
+    """
+
+    async def subscribe(self, symbols):
+        raise NotImplementedError
+
+    async def resnapshot(self, symbol):
+        """Asks for a fresh snapshot of a symbol, which arrives later through messages()."""
+        raise NotImplementedError
+
+    def messages(self):
+        """Returns an async iterator over incoming messages that ends when the feed closes."""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class WebSocketFeed(BookFeed):
+    """BookFeed over a WebSocket speaking JSON {"op": "subscribe" or "snapshot", ...} requests."""
+
+    def __init__(self, url, session=None):
+        self.url = url
+        self._session = session
+        self._owns_session = session is None
+        self._socket = None
+
+    async def connect(self):
+        if self._socket is None:
+            if self._session is None:
+                self._session = aiohttp.ClientSession()
+            self._socket = await self._session.ws_connect(self.url)
+        return self._socket
+
+    async def subscribe(self, symbols):
+        socket = await self.connect()
+        await socket.send_str(json.dumps({"op": "subscribe", "symbols": list(symbols)}))
+
+    async def resnapshot(self, symbol):
+        socket = await self.connect()
+        await socket.send_str(json.dumps({"op": "snapshot", "symbol": symbol}))
+
+    async def messages(self):
+        socket = await self.connect()
+        async for message in socket:
+            if message.type == aiohttp.WSMsgType.TEXT:
+                yield json.loads(message.data)
+            elif message.type == aiohttp.WSMsgType.ERROR:
+                logging.warning(f"WebSocket error from {self.url}: {socket.exception()}")
+                break
+
+    async def close(self):
+        if self._socket is not None:
+            await self._socket.close()
+            self._socket = None
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class L2Book:
+    """Price-level order book for one symbol, kept current from feed messages."""
+
+    def __init__(self):
+        self.bids = {}
+        self.asks = {}
+        self.sequence = None
+        self.synced = False
+
+    def apply(self, message):
+        """Applies a snapshot or diff. Returns False if a diff doesn't follow the last message."""
+        sequence = message.get("sequence")
+        if message["type"] == "snapshot":
+            self.bids = {price: volume for price, volume in message["bids"] if volume}
+            self.asks = {price: volume for price, volume in message["asks"] if volume}
+            self.sequence = sequence
+            self.synced = True
+            return True
+
+        if not self.synced:
+            return False
+        if sequence is not None and self.sequence is not None:
+            if sequence <= self.sequence:
+                return True  # Already covered by a later snapshot.
+            if sequence != self.sequence + 1:
+                return False
+
+        for levels, updates in ((self.bids, message.get("bids", ())),
+                                (self.asks, message.get("asks", ()))):
+            for price, volume in updates:
+                if volume:
+                    levels[price] = volume
+                else:
+                    levels.pop(price, None)
+        if sequence is not None:
+            self.sequence = sequence
+        return True
+
+    def orders(self):
+        """Returns ccxt-style bids and asks, best price first."""
+        return (sorted(([price, volume] for price, volume in self.bids.items()), reverse=True),
+                sorted([price, volume] for price, volume in self.asks.items()))
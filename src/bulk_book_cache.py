@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import time
+
+
+class BulkBookCache:
+    """Mixin for exchanges that can fetch every order book in one bulk request.
+
+    The host class implements fetch_order_books(params), returning raw books by symbol. Callers
+    read through cached_order_books(), which serves the current generation of books and, once it
+    is older than REFRESH_SECONDS, starts fetching the next one in the background without waiting
+    for it. Concurrent refreshes share one in-flight request. start_refreshing() keeps the cache
+    warm on its own so callers rarely see a stale generation at all.
+    """
+    REFRESH_SECONDS = 2
+
+    def __init__(self, *args, **kwargs):
+        super(BulkBookCache, self).__init__(*args, **kwargs)
+        self._order_books = None
+        self._fetched_at = {}
+        self._last_fetch = 0
+        self._in_flight = None
+        self._refresher = None
+
+    async def cached_order_books(self, params={}):
+        """Returns raw books by symbol, only waiting on the network if none were fetched yet."""
+        if self._order_books is None:
+            return await asyncio.shield(self.refresh_order_books(params))
+        if time.time() > self._last_fetch + self.REFRESH_SECONDS:
+            self.refresh_order_books(params)
+        return self._order_books
+
+    def refresh_order_books(self, params={}):
+        """Starts fetching a new generation of books, or joins the fetch already running."""
+        if self._in_flight is None or self._in_flight.done():
+            self._in_flight = asyncio.ensure_future(self._fetch_generation(params))
+        return self._in_flight
+
+    async def _fetch_generation(self, params):
+        try:
+            books = await self.fetch_order_books(params)
+        except Exception as e:
+            if self._order_books is None:
+                raise
+            logging.warning(f"Keeping books from {time.time() - self._last_fetch:.1f}s ago at "
+                            f"{self}: {e!r}")
+            return self._order_books
+
+        now = time.time()
+        self._fetched_at.update((symbol, now) for symbol in books)
+        self._order_books = books
+        self._last_fetch = now
+        return books
+
+    def book_timestamp(self, symbol):
+        """Returns when a symbol's book was fetched, in milliseconds like ccxt timestamps."""
+        fetched_at = self._fetched_at.get(symbol)
+        return int(fetched_at * 1000) if fetched_at is not None else None
+
+    def start_refreshing(self, params={}):
+        """Refreshes the books every REFRESH_SECONDS in a background task until stopped."""
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.ensure_future(self._refresh_forever(params))
+        return self._refresher
+
+    def stop_refreshing(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+
+    async def _refresh_forever(self, params):
+        while True:
+            try:
+                await asyncio.shield(self.refresh_order_books(params))
+            except Exception as e:
+                logging.warning(f"Failed to fetch books at {self}: {e!r}")
+            await asyncio.sleep(self.REFRESH_SECONDS)
@@ -0,0 +1,257 @@
+"""Append-only binary capture of the books stored in a RateTable, and replay of it.
+
+A capture file starts with MAGIC and is a sequence of records, each starting with a one-byte kind:
+
+    NAME:  id (u32), length (u16), UTF-8 bytes. Names an exchange or pair the first time it's used.
+    BOOKS: time (f64), exchange id (u32), book count (u32), then for each book its pair id (u32),
+           bid and ask counts (u32 each, REMOVED for a removed book) and the bid then ask levels
+           as little-endian [price, volume] float64s.
+    FEES:  time (f64), exchange id (u32), then taker fees and withdrawal fees, each as a count
+           (u32, REMOVED if not set) and that many name id (u32), fee (f64) entries.
+
+Each BOOKS record is one set_books call and each FEES record one set_fees call, so replaying the
+records in order rebuilds every generation the table went through, priced with the same fees.
+A record cut off by a crash ends the capture.
+"""
+import asyncio
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b"SSCAP1\n"
+NAME = 0
+BOOKS = 1
+FEES = 2
+REMOVED = 0xFFFFFFFF
+
+_KIND = struct.Struct("<B")
+_NAME = struct.Struct("<IH")
+_BOOKS = struct.Struct("<dII")
+_BOOK = struct.Struct("<III")
+_FEES = struct.Struct("<dI")
+_COUNT = struct.Struct("<I")
+_FEE = struct.Struct("<Id")
+_LEVELS = np.dtype("<f8")
+
+
+def _levels(orders):
+    if not len(orders):
+        return np.empty((0, 2), dtype=_LEVELS)
+    return np.array(orders, dtype=_LEVELS).reshape(len(orders), -1)[:, :2]
+
+
+class CaptureWriter:
+    """Appends every set_books call of the tables it records to a capture file.
+
+    Attach it with table.recorder = writer. Writes are buffered and flushed at most every
+    flush_interval seconds, so recording a busy feed costs little more than packing the levels.
+    """
+
+    def __init__(self, path, flush_interval=1.0, clock=time.time):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self.records = 0
+        self._names = {}
+        self._file = open(path, "ab")
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        else:
+            # Appending to an earlier capture: its names are reused rather than redefined.
+            for kind, payload in CaptureReader(path).raw():
+                if kind == NAME:
+                    self._names[payload[1]] = payload[0]
+        self._flushed = self.clock()
+
+    def _name(self, name):
+        name_id = self._names.get(name)
+        if name_id is None:
+            name_id = len(self._names)
+            self._names[name] = name_id
+            encoded = name.encode()
+            self._file.write(_KIND.pack(NAME) + _NAME.pack(name_id, len(encoded)) + encoded)
+        return name_id
+
+    def record(self, exchange_name, books, at=None):
+        """Appends books, which map pairs to (bids, asks) orders or None, as set_books takes."""
+        parts = []
+        for pair, orders in books.items():
+            pair_id = self._name(pair)
+            if orders is None:
+                parts.append(_BOOK.pack(pair_id, REMOVED, REMOVED))
+                continue
+            bids, asks = _levels(orders[0]), _levels(orders[1])
+            parts.append(_BOOK.pack(pair_id, len(bids), len(asks)))
+            parts.append(bids.tobytes())
+            parts.append(asks.tobytes())
+
+        exchange_id = self._name(exchange_name)
+        now = self.clock()
+        header = _KIND.pack(BOOKS) + _BOOKS.pack(now if at is None else at, exchange_id,
+                                                 len(books))
+        self._file.write(header + b"".join(parts))
+        self.records += 1
+        if now - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def record_fees(self, exchange_name, taker=None, withdraw=None, at=None):
+        """Appends a set_fees call: fees by symbol and by coin, None for those not set."""
+        parts = []
+        for fees in (taker, withdraw):
+            if fees is None:
+                parts.append(_COUNT.pack(REMOVED))
+                continue
+            parts.append(_COUNT.pack(len(fees)))
+            parts.extend(_FEE.pack(self._name(name), fee) for name, fee in fees.items())
+
+        exchange_id = self._name(exchange_name)
+        now = self.clock()
+        self._file.write(_KIND.pack(FEES) + _FEES.pack(now if at is None else at, exchange_id)
+                         + b"".join(parts))
+        self.records += 1
+        if now - self._flushed >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        self._file.flush()
+        self._flushed = self.clock()
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class CaptureReader:
+    """Reads the books records of a capture file back as (time, exchange, books) tuples."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def raw(self):
+        """Yields (kind, payload) for each complete record: (id, name), (time, exchange, books)
+        or (time, exchange, taker fees, withdrawal fees).
+
+        Books are decoded lazily into (bids, asks) arrays of [price, volume] rows, or None.
+        Fees are dicts by name, or None where that call didn't set them.
+        """
+        with open(self.path, "rb") as capture:
+            data = memoryview(capture.read())
+        if bytes(data[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{self.path} is not a capture file")
+
+        names = {}
+        offset = len(MAGIC)
+        try:
+            while offset < len(data):
+                kind, = _KIND.unpack_from(data, offset)
+                offset += _KIND.size
+                if kind == NAME:
+                    name_id, length = _NAME.unpack_from(data, offset)
+                    offset += _NAME.size
+                    if offset + length > len(data):
+                        return
+                    names[name_id] = bytes(data[offset:offset + length]).decode()
+                    offset += length
+                    yield NAME, (name_id, names[name_id])
+                elif kind == BOOKS:
+                    at, exchange_id, count = _BOOKS.unpack_from(data, offset)
+                    offset += _BOOKS.size
+                    books = {}
+                    for _ in range(count):
+                        pair_id, bid_count, ask_count = _BOOK.unpack_from(data, offset)
+                        offset += _BOOK.size
+                        if bid_count == REMOVED:
+                            books[names[pair_id]] = None
+                            continue
+                        end = offset + (bid_count + ask_count) * 2 * _LEVELS.itemsize
+                        if end > len(data):
+                            return
+                        levels = np.frombuffer(data[offset:end], dtype=_LEVELS).reshape(-1, 2)
+                        books[names[pair_id]] = (levels[:bid_count], levels[bid_count:])
+                        offset = end
+                    yield BOOKS, (at, names[exchange_id], books)
+                elif kind == FEES:
+                    at, exchange_id = _FEES.unpack_from(data, offset)
+                    offset += _FEES.size
+                    fees = []
+                    for _ in range(2):
+                        count, = _COUNT.unpack_from(data, offset)
+                        offset += _COUNT.size
+                        if count == REMOVED:
+                            fees.append(None)
+                            continue
+                        entries = {}
+                        for _ in range(count):
+                            name_id, fee = _FEE.unpack_from(data, offset)
+                            offset += _FEE.size
+                            entries[names[name_id]] = fee
+                        fees.append(entries)
+                    yield FEES, (at, names[exchange_id], fees[0], fees[1])
+                else:
+                    raise ValueError(f"Unknown record kind {kind} at byte {offset - 1} "
+                                     f"of {self.path}")
+        except struct.error:
+            return  # Cut off mid-record.
+
+    def __iter__(self):
+        for kind, payload in self.raw():
+            if kind == BOOKS:
+                yield payload
+
+    def records(self):
+        """Yields (kind, payload) for the BOOKS and FEES records, the ones that change a table."""
+        for kind, payload in self.raw():
+            if kind != NAME:
+                yield kind, payload
+
+
+def _apply(table, kind, payload):
+    if kind == FEES:
+        _, exchange_name, taker, withdraw = payload
+        table.set_fees(exchange_name, taker, withdraw)
+    else:
+        _, exchange_name, books = payload
+        table.set_books(exchange_name, books)
+
+
+def load(path, table):
+    """Replays a whole capture into a table as fast as possible. Returns the books record count."""
+    count = 0
+    for kind, payload in CaptureReader(path).records():
+        _apply(table, kind, payload)
+        count += kind == BOOKS
+    return count
+
+
+async def replay(path, table, speed=1.0, on_record=None, sleep=asyncio.sleep):
+    """Replays a capture into a table, keeping the original spacing between records.
+
+    speed scales time: 10 replays ten times faster, and None doesn't wait at all. on_record is
+    called with the table and the record time after each record is stored, e.g. to search it.
+    """
+    first = started = None
+    count = 0
+    for kind, payload in CaptureReader(path).records():
+        at = payload[0]
+        if kind == FEES:
+            # Fees apply to the books that follow, so they're set as soon as they're read.
+            _apply(table, kind, payload)
+            continue
+        if speed is not None:
+            if first is None:
+                first, started = at, time.monotonic()
+            delay = (at - first) / speed - (time.monotonic() - started)
+            if delay > 0:
+                await sleep(delay)
+        _apply(table, kind, payload)
+        count += 1
+        if on_record is not None:
+            on_record(table, at)
+    return count
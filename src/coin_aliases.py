@@ -0,0 +1,36 @@
+class CoinAliases:
+    """Maps the names exchanges list coins under to one canonical name per coin.
+
+    aliases maps a name to its canonical name everywhere, like XBT to BTC. overrides maps an
+    exchange to aliases that take precedence there, e.g. to rename a coin that shares its ticker
+    with a different coin elsewhere. A name mapped to itself in an override opts that exchange out
+    of a global alias.
+    """
+
+    def __init__(self, aliases=None, overrides=None):
+        self.aliases = dict(aliases or {})
+        self.overrides = {exchange: dict(names) for exchange, names in (overrides or {}).items()}
+
+    def add(self, alias, canonical, exchange=None):
+        if exchange is None:
+            self.aliases[alias] = canonical
+        else:
+            self.overrides.setdefault(exchange, {})[alias] = canonical
+
+    def canonical(self, coin, exchange=None):
+        """Returns the canonical name of a coin as listed on an exchange, or anywhere."""
+        if exchange is not None:
+            names = self.overrides.get(exchange)
+            if names:
+                canonical = names.get(coin)
+                if canonical is not None:
+                    return canonical
+        return self.aliases.get(coin, coin)
+
+    def names(self, canonical, exchange=None):
+        """Returns every name an exchange may list a canonical coin under, itself first."""
+        names = [canonical] if self.canonical(canonical, exchange) == canonical else []
+        for alias in list(self.aliases) + list(self.overrides.get(exchange, ())):
+            if alias not in names and self.canonical(alias, exchange) == canonical:
+                names.append(alias)
+        return names
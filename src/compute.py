@@ -0,0 +1,83 @@
+import asyncio
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.metrics import METRICS
+
+
+class ComputeExecutor:
+    """Runs CPU-bound work in a bounded thread pool so the event loop stays free for I/O.
+
+    NumPy releases the GIL for the heavy lifting in book normalization and pricing, so threads
+    overlap with the loop without pickling anything. exclusive() adds backpressure: while a job
+    under a key is running, new ones are skipped or join it instead of queueing up.
+    """
+
+    def __init__(self, workers=2, executor=None):
+        self.workers = workers
+        self.executor = executor or ThreadPoolExecutor(workers, thread_name_prefix="compute")
+        self._owns_executor = executor is None
+        self._running = {}
+
+    async def run(self, func, *args, **kwargs):
+        """Runs func(*args, **kwargs) in the pool and returns its result."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def busy(self, key):
+        return key in self._running
+
+    async def exclusive(self, key, make, coalesce=False):
+        """Awaits make(), a coroutine function, unless a job under key is still running.
+
+        Then it returns None without starting another, or with coalesce, that job's result.
+        """
+        running = self._running.get(key)
+        if running is not None:
+            if coalesce:
+                METRICS.inc("compute_coalesced_total", key=key)
+                return await asyncio.shield(running)
+            METRICS.inc("compute_skipped_total", key=key)
+            logging.debug(f"Skipping {key}, the last one is still running")
+            return None
+
+        task = asyncio.ensure_future(make())
+        self._running[key] = task
+        task.add_done_callback(lambda _: self._running.pop(key, None))
+        return await task
+
+    def close(self):
+        if self._owns_executor:
+            self.executor.shutdown(wait=False)
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up, and reports it when it's stalled.
+
+    Every interval it sleeps and checks how much longer than the interval that took: time the
+    loop spent running something that didn't yield. Lags above threshold are logged as stalls.
+    """
+
+    def __init__(self, interval=0.25, threshold=0.1, clock=time.monotonic):
+        self.interval = interval
+        self.threshold = threshold
+        self.clock = clock
+        self.stalls = 0
+        self.worst = 0.0
+
+    def record(self, lag):
+        lag = max(0.0, lag)
+        self.worst = max(self.worst, lag)
+        METRICS.observe("loop_lag_seconds", lag)
+        if lag > self.threshold:
+            self.stalls += 1
+            METRICS.inc("loop_stalls_total")
+            logging.warning(f"Event loop stalled for {lag:.3f}s")
+
+    async def run(self):
+        while True:
+            started = self.clock()
+            await asyncio.sleep(self.interval)
+            self.record(self.clock() - started - self.interval)
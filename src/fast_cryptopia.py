@@ -1,52 +1,41 @@
 import asyncio
-import itertools
 
 import more_itertools
-import time
 from ccxt.async import cryptopia
 
+from src.bulk_book_cache import BulkBookCache
 
-class FastCryptopia(cryptopia):
+
+class FastCryptopia(BulkBookCache, cryptopia):
     REFRESH_SECONDS = 2
+    CHUNK_SIZE = 1000
 
     def __init__(self, *args, **kwargs):
         super(FastCryptopia, self).__init__(*args, **kwargs)
-        self._order_books = None
-        self._fetching = asyncio.Event()
-        self._last_fetch = 0
         self.has["fetchOrderBooks"] = True
-
-    @staticmethod
-    def _convert_order_books(response):
-        for data in response:
-            data["Market"] = data["Market"].replace("_", "/")
-            for order in itertools.chain(data["Buy"], data["Sell"]):
-                order["Label"] = order["Label"].replace("_", "/")
-        return response
+        self._parsed = {}
+        self._parsed_from = None
 
     async def fetch_order_book(self, symbol, params={}):
-        # FIXME: need to keep updating periodically.
-        if not self._order_books:  # or time.time() > self._last_fetch + self.REFRESH_SECONDS:
-            self._fetching.clear()
-            self._order_books = self.fetch_order_books(params)
-            self._order_books = await self._order_books
-            self._last_fetch = time.time()
-            self._fetching.set()
-        else:
-            await self._fetching.wait()
-        orderbooks = self._order_books
-        book = self.parse_order_book(orderbooks[symbol], None, 'Buy', 'Sell', 'Price', 'Volume')
+        orderbooks = await self.cached_order_books(params)
+        if orderbooks is not self._parsed_from:
+            # A new generation: the books parsed from the previous one are out of date.
+            self._parsed, self._parsed_from = {}, orderbooks
+        # Books are only parsed when someone asks for them, and once per generation.
+        book = self._parsed.get(symbol)
+        if book is None:
+            book = self.parse_order_book(orderbooks[symbol], self.book_timestamp(symbol),
+                                         'Buy', 'Sell', 'Price', 'Volume')
+            self._parsed[symbol] = book
         return book
 
     async def fetch_order_books(self, params):
         await self.load_markets()
         symbols = [symbol.replace("/", "_") for symbol in self.symbols]
-        result = {}
-        for chunk in more_itertools.chunked(symbols, 1000):
-            ids = "-".join(chunk)
-            response = await self.publicGetMarketOrderGroupsIdsCount(self.extend({
-                'ids': ids, "count": 55
-            }, params))
-            books = self._convert_order_books(response["Data"])
-            result.update({data["Market"]: data for data in books})
-        return result
+        # Chunks go out together; ccxt's rate limiter still spaces the requests themselves.
+        responses = await asyncio.gather(*[
+            self.publicGetMarketOrderGroupsIdsCount(self.extend({
+                'ids': "-".join(chunk), "count": 55
+            }, params)) for chunk in more_itertools.chunked(symbols, self.CHUNK_SIZE)])
+        return {data["Market"].replace("_", "/"): data
+                for response in responses for data in response["Data"]}
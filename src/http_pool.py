@@ -0,0 +1,93 @@
+import asyncio
+import logging
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from src.metrics import METRICS
+
+
+class HttpPool:
+    """One aiohttp session shared by every exchange, and the requests they have in flight.
+
+    Exchanges attached to the pool send their HTTP requests through its connector, which keeps
+    connections alive between requests, caches DNS lookups for dns_ttl seconds and opens at most
+    limit_per_host connections to any one host, so a burst of book fetches queues for a
+    connection instead of opening hundreds. Identical GETs in flight at once share one request
+    and its result or error. Every request's latency is recorded by host in a histogram.
+    """
+
+    def __init__(self, limit=100, limit_per_host=8, dns_ttl=300, keepalive=30, timeout=None):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_ttl = dns_ttl
+        self.keepalive = keepalive
+        self.timeout = timeout
+        self._session = None
+        self._in_flight = {}
+
+    @property
+    def session(self):
+        """The shared session, opened on first use from within the event loop."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host,
+                                             ttl_dns_cache=self.dns_ttl,
+                                             keepalive_timeout=self.keepalive)
+            timeout = aiohttp.ClientTimeout(total=self.timeout) if self.timeout else None
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+        return self._session
+
+    def attach(self, exchange):
+        """Makes a ccxt async exchange send its requests through the pool.
+
+        The exchange still builds, signs and parses its requests; only its session is swapped
+        for the shared one, which it won't close.
+        """
+        fetch = exchange.fetch
+        exchange.own_session = False
+
+        async def pooled_fetch(url, method="GET", headers=None, body=None):
+            exchange.session = self.session
+            return await self.request(fetch, url, method, headers, body)
+
+        exchange.fetch = pooled_fetch
+        return exchange
+
+    async def request(self, fetch, url, method="GET", headers=None, body=None):
+        """Awaits fetch(url, method, headers, body), joining an identical GET already in flight."""
+        if method != "GET" or body is not None:
+            return await self._timed(fetch, url, method, headers, body)
+
+        key = (url, tuple(sorted((headers or {}).items())))
+        running = self._in_flight.get(key)
+        if running is not None:
+            METRICS.inc("http_coalesced_total", host=urlsplit(url).hostname)
+            return await asyncio.shield(running)
+
+        task = asyncio.ensure_future(self._timed(fetch, url, method, headers, body))
+        self._in_flight[key] = task
+        task.add_done_callback(lambda _: self._done(key, task))
+        return await asyncio.shield(task)
+
+    def _done(self, key, task):
+        self._in_flight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # Retrieved here in case every caller was cancelled meanwhile.
+
+    async def _timed(self, fetch, url, method, headers, body):
+        host = urlsplit(url).hostname
+        started = time.perf_counter()
+        try:
+            return await fetch(url, method, headers, body)
+        except Exception as e:
+            METRICS.inc("http_errors_total", host=host, error=type(e).__name__)
+            logging.debug(f"{e!r} from {method} {url}")
+            raise
+        finally:
+            METRICS.histogram("http_request_seconds", time.perf_counter() - started, host=host)
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import logging
+import os
+import time
+
+from src.metrics import METRICS
+
+
+class MarketCache:
+    """Keeps every exchange's markets on disk, so a restart doesn't wait to load them again.
+
+    prime() hands an exchange the markets cached for it, after which load_markets() returns at
+    once for everyone that calls it: populate, the scheduler and bulk fetchers. refresh_forever()
+    reloads the markets of exchanges whose cache is older than ttl seconds, or missing, in the
+    background and writes them back. Cached markets are used however old they are, since stale
+    markets mostly cost a few failed fetches while loading them holds up every book.
+    The market index and fees are rebuilt from the markets rather than cached, as that's cheaper
+    than reading them.
+    """
+
+    def __init__(self, path, ttl=3600, retry=60, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self.retry = retry
+        self.clock = clock
+        self.entries = self._read()
+
+    def _read(self):
+        try:
+            with open(self.path) as cache:
+                entries = json.load(cache)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable market cache {self.path}: {e!r}")
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _write(self):
+        partial = f"{self.path}.tmp"
+        with open(partial, "w") as cache:
+            json.dump(self.entries, cache, default=str)
+        os.replace(partial, self.path)
+
+    def age(self, exchange_name):
+        """Returns how many seconds ago an exchange's markets were cached, or None."""
+        entry = self.entries.get(exchange_name)
+        return None if entry is None else self.clock() - entry["at"]
+
+    def stale(self, exchange_name):
+        age = self.age(exchange_name)
+        return age is None or age >= self.ttl
+
+    def prime(self, exchange):
+        """Gives an exchange its cached markets, unless it has some. Returns whether it did."""
+        entry = self.entries.get(exchange.name)
+        if entry is None or exchange.markets:
+            return False
+        exchange.set_markets(entry["markets"], entry.get("currencies"))
+        METRICS.inc("market_cache_hits_total", exchange=exchange.name)
+        return True
+
+    def store(self, exchange):
+        """Caches an exchange's loaded markets."""
+        self.entries[exchange.name] = {
+            "at": self.clock(),
+            "markets": exchange.markets,
+            "currencies": exchange.currencies or None,
+        }
+        self._write()
+
+    async def refresh(self, exchange):
+        """Loads an exchange's markets from the exchange and caches them.
+
+        An exchange that has no cached markets yet joins the load everyone else is waiting on.
+        """
+        await exchange.load_markets(reload=exchange.name in self.entries)
+        self.store(exchange)
+
+    async def refresh_stale(self, exchanges, on_refresh=None):
+        """Refreshes the exchanges with stale markets. Returns the seconds until one goes stale.
+
+        on_refresh is called with each exchange refreshed, e.g. to reload its fees.
+        """
+        stale = [exchange for exchange in exchanges if self.stale(exchange.name)]
+        results = await asyncio.gather(*[self.refresh(exchange) for exchange in stale],
+                                       return_exceptions=True)
+        failed = False
+        for exchange, result in zip(stale, results):
+            if isinstance(result, Exception):
+                # The cached markets keep serving until the next try.
+                failed = True
+                METRICS.inc("market_cache_failures_total", exchange=exchange.name)
+                logging.warning(f"{result!r} refreshing markets of {exchange.name}")
+            elif on_refresh is not None:
+                on_refresh(exchange)
+
+        # Exchanges that failed are still stale, and are retried sooner than the rest expire.
+        wait = min([self.ttl - self.age(exchange.name) for exchange in exchanges
+                    if not self.stale(exchange.name)], default=self.ttl)
+        return min(wait, self.retry) if failed else wait
+
+    async def refresh_forever(self, exchanges, on_refresh=None):
+        while True:
+            await asyncio.sleep(await self.refresh_stale(exchanges, on_refresh))
@@ -0,0 +1,93 @@
+from collections import defaultdict, deque
+
+from src.rate_table import RateTable
+
+
+class MarketIndex:
+    """Which markets can take part in a roundtrip from one currency within a step limit.
+
+    Coins are nodes and every market on any exchange links its two coins, since coins move
+    between exchanges. A market between a and b can only be traded in a roundtrip of at most
+    max_steps if distance(cur, a) + 1 + distance(b, cur) <= max_steps.
+    That is checked without excluding repeated books, so the index never drops a market a search
+    could use, but markets among coins too far from cur are never fetched.
+    currencies are more coins roundtrips start from; a market is relevant if it is for any.
+    """
+
+    def __init__(self, cur, max_steps, aliases=None, currencies=None):
+        self.aliases = RateTable.ALIASES if aliases is None else aliases
+        self.cur = self.aliases.canonical(cur)
+        self.currencies = [self.cur]
+        for other in currencies or ():
+            other = self.aliases.canonical(other)
+            if other not in self.currencies:
+                self.currencies.append(other)
+        self.max_steps = max_steps
+        self.markets = {}
+        # Distance of each coin from cur, then from each of currencies in the same order.
+        self.distances = {}
+        self._distances = []
+        self._relevant = {}
+
+    def _coins(self, symbol, exchange_name=None):
+        if not symbol or "/" not in symbol:
+            return None
+        coin1, coin2 = symbol.split("/", 1)
+        return (self.aliases.canonical(coin1, exchange_name),
+                self.aliases.canonical(coin2, exchange_name))
+
+    def update(self, exchange_name, symbols):
+        """Records an exchange's markets, rebuilding the index if they changed."""
+        symbols = frozenset(symbols or ())
+        if self.markets.get(exchange_name) == symbols:
+            return False
+        self.markets[exchange_name] = symbols
+        self._rebuild()
+        return True
+
+    def _rebuild(self):
+        neighbors = defaultdict(set)
+        for exchange_name, symbols in self.markets.items():
+            for symbol in symbols:
+                coins = self._coins(symbol, exchange_name)
+                if coins:
+                    neighbors[coins[0]].add(coins[1])
+                    neighbors[coins[1]].add(coins[0])
+
+        self._distances = [self._distances_from(cur, neighbors) for cur in self.currencies]
+        self.distances = self._distances[0]
+        self._relevant = {}
+
+    def _distances_from(self, cur, neighbors):
+        distances = {cur: 0}
+        queue = deque([cur])
+        while queue:
+            coin = queue.popleft()
+            if distances[coin] >= self.max_steps - 1:
+                continue
+            for neighbor in neighbors[coin]:
+                if neighbor not in distances:
+                    distances[neighbor] = distances[coin] + 1
+                    queue.append(neighbor)
+        return distances
+
+    def is_relevant(self, symbol, exchange_name=None):
+        coins = self._coins(symbol, exchange_name)
+        if not coins:
+            return False
+        for distances in self._distances:
+            first = distances.get(coins[0])
+            second = distances.get(coins[1])
+            if first is not None and second is not None \
+                    and first + 1 + second <= self.max_steps:
+                return True
+        return False
+
+    def relevant(self, exchange_name):
+        """Returns the exchange's markets that can take part in a roundtrip."""
+        relevant = self._relevant.get(exchange_name)
+        if relevant is None:
+            relevant = sorted(symbol for symbol in self.markets.get(exchange_name, ())
+                              if self.is_relevant(symbol, exchange_name))
+            self._relevant[exchange_name] = relevant
+        return relevant
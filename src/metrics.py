@@ -0,0 +1,177 @@
+import asyncio
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Metrics:
+    """Counters, gauges and summaries for the arbitrage pipeline, rendered for Prometheus.
+
+    Everything is a no-op until enabled, so instrumented code only pays for one attribute check.
+    Metric names get the sharpshooter_ prefix when rendered. Summaries keep a count, sum and max;
+    histograms also count observations into cumulative buckets of upper bounds.
+    Updates may come from compute threads as well as the event loop.
+    """
+    PREFIX = "sharpshooter_"
+    # Upper bounds in seconds, for latencies from a local cache hit to a slow exchange.
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.types = {}
+        self.values = {}
+        self.buckets = {}
+        self.callbacks = []
+        self._lock = threading.Lock()
+
+    def reset(self):
+        self.types.clear()
+        self.values.clear()
+        self.buckets.clear()
+        self.callbacks.clear()
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled:
+            return
+        self.types.setdefault(name, "counter")
+        key = self._key(name, labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        if not self.enabled:
+            return
+        self.types.setdefault(name, "gauge")
+        self.values[self._key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        if not self.enabled:
+            return
+        self.types.setdefault(name, "summary")
+        key = self._key(name, labels)
+        with self._lock:
+            count, total, peak = self.values.get(key, (0, 0.0, value))
+            self.values[key] = (count + 1, total + value, max(peak, value))
+
+    def histogram(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        """Observes value into buckets, the upper bounds the first observation of name sets."""
+        if not self.enabled:
+            return
+        self.types.setdefault(name, "histogram")
+        bounds = self.buckets.setdefault(name, tuple(buckets))
+        key = self._key(name, labels)
+        with self._lock:
+            counts, count, total = self.values.get(key, ((0,) * len(bounds), 0, 0.0))
+            counts = tuple(bucket + (value <= bound) for bucket, bound in zip(counts, bounds))
+            self.values[key] = (counts, count + 1, total + value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Observes the wall time of the with block in seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def add_callback(self, callback):
+        """Registers a function called before each render, e.g. to set gauges that age."""
+        self.callbacks.append(callback)
+
+    def _collect(self):
+        for callback in self.callbacks:
+            try:
+                callback(self)
+            except Exception as e:
+                logging.warning(f"Metrics callback {callback} failed: {e!r}")
+
+    def render(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        self._collect()
+        by_name = {}
+        for (name, labels), value in list(self.values.items()):
+            by_name.setdefault(name, []).append((labels, value))
+
+        lines = []
+        for name in sorted(by_name):
+            full_name = self.PREFIX + name
+            kind = self.types[name]
+            lines.append(f"# TYPE {full_name} {kind}")
+            for labels, value in sorted(by_name[name]):
+                if kind == "summary":
+                    count, total, peak = value
+                    lines.append(f"{full_name}_count{self._labels(labels)} {count}")
+                    lines.append(f"{full_name}_sum{self._labels(labels)} {total}")
+                    lines.append(f"{full_name}_max{self._labels(labels)} {peak}")
+                elif kind == "histogram":
+                    counts, count, total = value
+                    for bound, bucket in zip(self.buckets[name] + ("+Inf",), counts + (count,)):
+                        le = self._labels(labels + (("le", bound),))
+                        lines.append(f"{full_name}_bucket{le} {bucket}")
+                    lines.append(f"{full_name}_count{self._labels(labels)} {count}")
+                    lines.append(f"{full_name}_sum{self._labels(labels)} {total}")
+                else:
+                    lines.append(f"{full_name}{self._labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"') for _, value in labels)
+        return "{" + ",".join(f'{key}="{value}"'
+                              for (key, _), value in zip(labels, escaped)) + "}"
+
+    def as_dict(self):
+        """Returns every metric as JSON-friendly lists of labels and values by name."""
+        self._collect()
+        result = {}
+        for (name, labels), value in sorted(list(self.values.items())):
+            entry = {"labels": dict(labels)}
+            if self.types[name] == "summary":
+                entry.update(zip(("count", "sum", "max"), value))
+            elif self.types[name] == "histogram":
+                counts, entry["count"], entry["sum"] = value
+                entry["buckets"] = dict(zip(map(str, self.buckets[name]), counts))
+            else:
+                entry["value"] = value
+            result.setdefault(name, []).append(entry)
+        return result
+
+    async def serve(self, host="127.0.0.1", port=9108):
+        """Serves render() over HTTP at /metrics from the running event loop."""
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            parts = request.decode("latin-1").split()
+            if len(parts) >= 2 and parts[1].split("?", 1)[0] == "/metrics":
+                status, body = "200 OK", self.render()
+            else:
+                status, body = "404 Not Found", "Not found\n"
+            body = body.encode()
+            writer.write(f"HTTP/1.0 {status}\r\n"
+                         f"Content-Type: text/plain; version=0.0.4\r\n"
+                         f"Content-Length: {len(body)}\r\n\r\n".encode() + body)
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def dump_periodically(self, path, interval=60):
+        """Writes as_dict() to a JSON file every interval seconds."""
+        while True:
+            await asyncio.sleep(interval)
+            with open(path, "w") as output:
+                json.dump({"time": time.time(), "metrics": self.as_dict()}, output, indent=2)
+
+
+METRICS = Metrics()
@@ -0,0 +1,286 @@
+import numpy as np
+
+
+class Interner:
+    """Assigns stable integer ids to names and keeps a single copy of each name string."""
+
+    def __init__(self):
+        self.ids = {}
+        self.names = []
+
+    def id(self, name):
+        """Returns the id for a name, allocating one on first sight."""
+        index = self.ids.get(name)
+        if index is None:
+            index = len(self.names)
+            self.ids[name] = index
+            self.names.append(name)
+        return index
+
+    def intern(self, name):
+        """Returns the shared copy of a name."""
+        return self.names[self.id(name)]
+
+    def __getitem__(self, index):
+        return self.names[index]
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def __len__(self):
+        return len(self.names)
+
+
+class BookSide:
+    """One direction of a market as contiguous rate and volume arrays, best rate first.
+
+    Behaves like the list of (price, volume) tuples it replaces, so indexing and iteration work
+    as before, but the levels live in a single float64 buffer. fee is the taker fee, taken out of
+    what a fill pays; levels keep the prices the exchange quotes.
+    """
+    __slots__ = ("_levels", "_depth", "fee")
+
+    def __init__(self, levels, fee=0.0):
+        self._levels = levels
+        self._depth = None
+        self.fee = fee
+
+    @classmethod
+    def from_orders(cls, orders, fee=0.0):
+        """Builds a side from ccxt-style [price, volume] orders, dropping empty prices.
+
+        A side left with a single level is a TopOfBook, which holds it without an array.
+        """
+        if not len(orders):
+            return cls(np.empty((2, 0)), fee)
+        if len(orders) == 1 and orders[0][0] is not None and orders[0][0] > 0:
+            return TopOfBook(float(orders[0][0]), float(orders[0][1]), fee)
+        levels = np.array(orders, dtype=np.float64).reshape(len(orders), -1)[:, :2]
+        levels = levels[levels[:, 0] > 0]
+        if len(levels) == 1:
+            return TopOfBook(levels[0, 0].item(), levels[0, 1].item(), fee)
+        return cls(np.ascontiguousarray(levels.T), fee)
+
+    def inverted(self, fee=0.0):
+        """Returns this side, taken as asks, as seen buying from the quote currency."""
+        return InvertedBookSide(self, fee)
+
+    def same_levels(self, other):
+        """Returns whether other holds the same levels, ignoring fees."""
+        return len(self) == len(other) and np.array_equal(self.levels, other.levels)
+
+    @property
+    def rate(self):
+        """Returns the best price net of the fee, or None for an empty side."""
+        if not len(self):
+            return None
+        return self.levels[0, 0].item() * (1 - self.fee)
+
+    @property
+    def levels(self):
+        return self._levels
+
+    @property
+    def prices(self):
+        return self.levels[0]
+
+    @property
+    def volumes(self):
+        return self.levels[1]
+
+    @property
+    def depth(self):
+        """Cumulative volume and cumulative notional through each level, computed on first use."""
+        if self._depth is None:
+            prices, volumes = self.levels
+            self._depth = np.stack((np.cumsum(volumes), np.cumsum(prices * volumes)))
+        return self._depth
+
+    def market_price(self, volume):
+        """Returns the average price, limit, and amount of new currency to fill an order.
+
+        The average price and amount are net of the fee; the limit is the worst price filled.
+        """
+        cum_volumes, cum_notional = self.depth
+        index = int(cum_volumes.searchsorted(volume))
+        if index >= len(cum_volumes):
+            return None, None, None
+
+        limit = self.levels[0, index].item()
+        if index:
+            filled = volume - cum_volumes[index - 1].item()
+            total_price = cum_notional[index - 1].item() + filled * limit
+        else:
+            total_price = volume * limit
+        avg_price = total_price / volume
+        if self.fee:
+            avg_price *= 1 - self.fee
+        return avg_price, limit, volume * avg_price
+
+    def __reduce__(self):
+        # Ship only the levels; cumulative depth is cheaper to rebuild than to pickle.
+        return type(self), (self.levels, self.fee)
+
+    def __len__(self):
+        return self.levels.shape[1]
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __getitem__(self, index):
+        levels = self.levels
+        if isinstance(index, slice):
+            return list(zip(levels[0, index].tolist(), levels[1, index].tolist()))
+        return float(levels[0, index]), float(levels[1, index])
+
+    def __iter__(self):
+        levels = self.levels
+        return zip(levels[0].tolist(), levels[1].tolist())
+
+    def __repr__(self):
+        return f"{type(self).__name__}({list(self)!r})"
+
+
+class InvertedBookSide(BookSide):
+    """The buying side of a market seen from the quote currency, computed on first use.
+
+    Buying at an ask converts quote to base at 1 / ask, with ask * volume of quote available.
+    """
+    __slots__ = ("_asks",)
+
+    def __init__(self, asks, fee=0.0):
+        super(InvertedBookSide, self).__init__(None, fee)
+        self._asks = asks
+
+    @property
+    def asks(self):
+        return self._asks
+
+    def __reduce__(self):
+        return type(self), (self._asks, self.fee)
+
+    def __len__(self):
+        return len(self._asks)
+
+    @property
+    def levels(self):
+        if self._levels is None:
+            prices, volumes = self._asks.levels
+            self._levels = np.stack((1 / prices, prices * volumes))
+        return self._levels
+
+
+class _SingleLevel:
+    """Prices a side with one level from its top (price, volume) without building arrays."""
+    __slots__ = ()
+
+    @property
+    def rate(self):
+        return self.top[0] * (1 - self.fee)
+
+    @property
+    def levels(self):
+        if self._levels is None:
+            price, volume = self.top
+            self._levels = np.array([[price], [volume]])
+        return self._levels
+
+    def market_price(self, volume):
+        price, available = self.top
+        if volume > available:
+            return None, None, None
+        avg_price = price * (1 - self.fee) if self.fee else price
+        return avg_price, price, volume * avg_price
+
+    def __len__(self):
+        return 1
+
+    def __getitem__(self, index):
+        if index in (0, -1):
+            return self.top
+        return super(_SingleLevel, self).__getitem__(index)
+
+    def __iter__(self):
+        return iter((self.top,))
+
+
+class TopOfBook(_SingleLevel, BookSide):
+    """A side with a single level, kept as two floats until something asks for its arrays.
+
+    Books fetched in bulk often quote only their best price, and a NumPy buffer costs several
+    times what the level itself does.
+    """
+    __slots__ = ("price", "volume")
+
+    def __init__(self, price, volume, fee=0.0):
+        super(TopOfBook, self).__init__(None, fee)
+        self.price = price
+        self.volume = volume
+
+    @property
+    def top(self):
+        return self.price, self.volume
+
+    def inverted(self, fee=0.0):
+        return InvertedTopOfBook(self, fee)
+
+    def same_levels(self, other):
+        if isinstance(other, TopOfBook):
+            return self.top == other.top
+        return super(TopOfBook, self).same_levels(other)
+
+    def __reduce__(self):
+        return type(self), (self.price, self.volume, self.fee)
+
+
+class InvertedTopOfBook(_SingleLevel, InvertedBookSide):
+    """An InvertedBookSide of a TopOfBook, pricing its one level without arrays."""
+    __slots__ = ()
+
+    @property
+    def top(self):
+        ask = self._asks.price
+        return 1 / ask, ask * self._asks.volume
+
+
+def market_prices(sides, amounts):
+    """Prices many amounts against many book sides at once.
+
+    amounts is either one amount per side or a (sides, n) array of amounts for each side.
+    Returns (average price, limit, amount out) arrays shaped like amounts, with NaN wherever a
+    side is too thin to fill the order. Like BookSide.market_price, prices are net of fees.
+    """
+    amounts = np.asarray(amounts, dtype=np.float64)
+    column = amounts.ndim == 1
+    amounts = amounts.reshape(len(sides), -1)
+
+    width = max((len(side) for side in sides), default=0)
+    prices = np.zeros((len(sides), width + 1))
+    cum_volumes = np.full((len(sides), width + 1), np.inf)
+    cum_notional = np.zeros((len(sides), width + 1))
+    cum_volumes[:, 0] = 0
+    for row, side in enumerate(sides):
+        depth = len(side)
+        prices[row, 1:depth + 1] = side.prices
+        cum_volumes[row, 1:depth + 1], cum_notional[row, 1:depth + 1] = side.depth
+
+    # Column 0 is an empty level, so index is the first level whose cumulative volume covers
+    # the amount and index - 1 is everything fully consumed before it.
+    index = (cum_volumes[:, :, None] < amounts[:, None, :]).sum(axis=1)
+    filled = (index <= np.array([len(side) for side in sides])[:, None]) & (amounts > 0)
+    index = np.clip(index, 1, max(width, 1))
+    rows = np.arange(len(sides))[:, None]
+    limit = prices[rows, index]
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        total_price = (cum_notional[rows, index - 1]
+                       + (amounts - cum_volumes[rows, index - 1]) * limit)
+        avg_price = np.where(filled, total_price / amounts, np.nan)
+    fees = np.array([side.fee for side in sides], dtype=np.float64)
+    if fees.any():
+        avg_price *= (1 - fees)[:, None]
+    limit = np.where(filled, limit, np.nan)
+    output = avg_price * amounts
+    if column:
+        return avg_price[:, 0], limit[:, 0], output[:, 0]
+    return avg_price, limit, output
@@ -0,0 +1,250 @@
+import asyncio
+import functools
+import logging
+import os
+import pickle
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from src.metrics import METRICS
+from src.rate_graph import RateGraph, SearchStats
+from src.trade import Trade
+
+# The last snapshot each worker process unpickled, so every step of a search shares it.
+_worker_graph = (None, None)
+
+
+def _expand_share(name, size, exchanges, coins, width, work, step, max_steps, min_profit):
+    """Runs in a worker: expands its share of one step of a search, for each currency in work.
+
+    work maps each currency searched to its share of that search's frontier, along with the
+    first hops to take from it on the first step. Returns the candidates and (lane, chain)
+    roundtrips found for each currency, with the work it took.
+    The snapshot is read from the shared memory block called name the first time a worker sees
+    it; later steps of the same search reuse the graph built from it.
+    """
+    global _worker_graph
+    if _worker_graph[0] != name:
+        from src.rate_table import RateTable
+        shared = shared_memory.SharedMemory(name)
+        try:
+            data, withdraw_fees = pickle.loads(shared.buf[:size])
+        finally:
+            shared.close()
+        table = RateTable()
+        table.data, table.withdraw_fees = data, withdraw_fees
+        _worker_graph = (name, RateGraph(table.snapshot(), exchanges, coins, width))
+    graph = _worker_graph[1]
+    graph.stats = SearchStats()
+    results = {}
+    for cur, (frontier, first_hops) in work.items():
+        candidates = defaultdict(list)
+        found = list(graph.expand(cur, frontier, step, max_steps, candidates,
+                                  first_hops=set(first_hops) if first_hops is not None else None,
+                                  min_profit=min_profit))
+        results[cur] = (dict(candidates), found)
+    return results, graph.stats
+
+
+class _SharedSearch:
+    """The parent's side of one search over worker processes.
+
+    It holds the shared snapshot, each currency's frontier and the chains found so far.
+    calls() deals the next step out into one call per worker, and absorb() merges what the
+    workers return into the frontier after it. stats holds the SearchStats of each call, a list
+    for each step.
+    """
+
+    def __init__(self, snapshot, inventories, partitions, max_steps, exchanges, coins,
+                 min_profit, width, workers):
+        payload = pickle.dumps((snapshot.data, snapshot.withdraw_fees), pickle.HIGHEST_PROTOCOL)
+        self.shared = shared_memory.SharedMemory(f"ss{uuid.uuid4().hex[:24]}", create=True,
+                                                 size=max(len(payload), 1))
+        self.shared.buf[:len(payload)] = payload
+        self.size = len(payload)
+        self.max_steps = max_steps
+        self.exchanges = exchanges
+        self.coins = coins
+        self.min_profit = min_profit
+        self.width = width
+        self.workers = workers
+        self.lanes = RateGraph.lanes(inventories)
+        # Each currency's first hops, dealt out to split the first step, when there's only the
+        # one partial chain of each lane to extend.
+        self.partitions = partitions
+        self.frontiers = {cur: RateGraph.start(cur, [inventories[index][1] for index in indexes])
+                          for cur, indexes in self.lanes.items()} if max_steps > 0 else {}
+        self.step = 0
+        self.found = [[] for _ in inventories]
+        self.stats = []
+
+    def calls(self):
+        """Returns a call per worker's share of the next step, or none once the search is done.
+
+        The first step is split by first hop. After it, frontier nodes are dealt out heaviest
+        first, so shares hold about as many partials.
+        """
+        if self.step >= self.max_steps:
+            return []
+        if self.step == 0:
+            shares = max(map(len, self.partitions.values()), default=0)
+            return [self._call({cur: (frontier, self.partitions[cur][index])
+                                for cur, frontier in self.frontiers.items()
+                                if index < len(self.partitions[cur])})
+                    for index in range(shares)]
+        nodes = sorted(((cur, node, lanes) for cur, frontier in self.frontiers.items()
+                        for node, lanes in frontier.items()),
+                       key=lambda item: sum(map(len, item[2])), reverse=True)
+        shares = min(len(nodes), self.workers)
+        calls = []
+        for index in range(shares):
+            work = defaultdict(dict)
+            for cur, node, lanes in nodes[index::shares]:
+                work[cur][node] = lanes
+            calls.append(self._call({cur: (frontier, None) for cur, frontier in work.items()}))
+        return calls
+
+    def _call(self, work):
+        return (_expand_share, self.shared.name, self.size, self.exchanges, self.coins,
+                self.width, work, self.step, self.max_steps, self.min_profit)
+
+    def absorb(self, results):
+        """Merges the workers' results for a step into the chains found and the next frontier."""
+        merged = {cur: defaultdict(list) for cur in self.frontiers}
+        self.stats.append([stats for _, stats in results])
+        for result, _ in results:
+            for cur, (candidates, found) in result.items():
+                for lane, chain in found:
+                    self.found[self.lanes[cur][lane]].append(chain)
+                for key, kept in candidates.items():
+                    merged[cur][key].extend(kept)
+        width = None if self.min_profit is not None \
+            else self.width if self.width is not None else RateGraph.WIDTH
+        self.frontiers = {cur: RateGraph.next_frontier(candidates, len(self.lanes[cur]), width)
+                          for cur, candidates in merged.items()}
+        self.step += 1
+
+    def close(self):
+        self.shared.close()
+        self.shared.unlink()
+
+
+class ParallelSearch:
+    """Fans each step of a roundtrip search out over worker processes.
+
+    Each search pickles the snapshot's books once into a shared memory block. At every step the
+    parent deals the frontier of partial chains out among the workers, or on the first step
+    the books a roundtrip can start with, sending each only the block's name along with its
+    share. Workers expand their shares independently, and the parent merges what they keep into
+    the next step's frontier, so each worker does a part of the work the search would do in one
+    process, and together they find the same chains. Searches for several inventories share
+    one block and one fan-out per step.
+    roundtrips_async() pickles in the compute executor, if given, so a large table doesn't
+    stall the event loop.
+    """
+
+    def __init__(self, workers=None, executor=None, compute=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = executor or ProcessPoolExecutor(self.workers)
+        self.compute = compute
+        self._owns_executor = executor is None
+
+    @staticmethod
+    def first_hops(snapshot, cur, exchanges=None, coins=None):
+        """Returns the (exchange, from_cur, to_cur) books a roundtrip from cur can start with.
+
+        These are the edges a RateGraph of the snapshot would have leaving cur, read straight
+        from each exchange's row for cur.
+        """
+        hops = []
+        for exchange_name, exchange in snapshot.items():
+            if exchanges and exchange_name not in exchanges:
+                continue
+            for to_cur, book in exchange.get(cur, {}).items():
+                if not book or (coins and to_cur not in coins):
+                    continue
+                rate = book.rate
+                if rate and rate > 0:
+                    hops.append((exchange_name, cur, to_cur))
+        return hops
+
+    def partitions(self, snapshot, cur, exchanges=None, coins=None):
+        """Deals cur's first hops out round-robin into one share per worker."""
+        hops = self.first_hops(snapshot, snapshot.aliases.canonical(cur), exchanges, coins)
+        shares = min(len(hops), self.workers)
+        return [hops[index::shares] for index in range(shares)]
+
+    def _prepare(self, snapshot, inventories, max_steps, exchanges, coins, min_profit, width):
+        """Shares the snapshot and returns the search, which the caller closes once done."""
+        inventories = [(snapshot.aliases.canonical(cur), amount) for cur, amount in inventories]
+        partitions = {cur: self.partitions(snapshot, cur, exchanges, coins)
+                      for cur, _ in inventories}
+        return _SharedSearch(snapshot, inventories, partitions, max_steps, exchanges, coins,
+                             min_profit, width, self.workers)
+
+    def roundtrips(self, snapshot, cur, amount, max_steps=4, exchanges=None, coins=None,
+                   min_profit=None, width=None):
+        """Returns the chains RateGraph.roundtrips finds, sorted by profitability."""
+        return self.inventory_roundtrips(snapshot, [(cur, amount)], max_steps, exchanges, coins,
+                                         min_profit, width)[0]
+
+    def inventory_roundtrips(self, snapshot, inventories, max_steps=4, exchanges=None,
+                             coins=None, min_profit=None, width=None):
+        """Returns the roundtrips of every (cur, amount) in inventories, a sorted list for each."""
+        started = time.time()
+        search = self._prepare(snapshot, inventories, max_steps, exchanges, coins, min_profit,
+                               width)
+        try:
+            calls = search.calls()
+            while calls:
+                futures = [self.executor.submit(*call) for call in calls]
+                search.absorb([future.result() for future in futures])
+                calls = search.calls()
+        finally:
+            search.close()
+        return self._merge(search.found, started)
+
+    async def roundtrips_async(self, snapshot, cur, amount, max_steps=4, exchanges=None,
+                               coins=None, min_profit=None, width=None):
+        """Like roundtrips, but awaits the workers without blocking the event loop."""
+        found = await self.inventory_roundtrips_async(snapshot, [(cur, amount)], max_steps,
+                                                      exchanges, coins, min_profit, width)
+        return found[0]
+
+    async def inventory_roundtrips_async(self, snapshot, inventories, max_steps=4,
+                                         exchanges=None, coins=None, min_profit=None,
+                                         width=None):
+        """Like inventory_roundtrips, but awaits the workers without blocking the event loop."""
+        started = time.time()
+        loop = asyncio.get_event_loop()
+        prepare = functools.partial(self._prepare, snapshot, inventories, max_steps, exchanges,
+                                    coins, min_profit, width)
+        if self.compute is not None:
+            search = await self.compute.run(prepare)
+        else:
+            search = await loop.run_in_executor(None, prepare)
+        try:
+            calls = search.calls()
+            while calls:
+                search.absorb(await asyncio.gather(*[loop.run_in_executor(self.executor, *call)
+                                                     for call in calls]))
+                calls = search.calls()
+        finally:
+            search.close()
+        return self._merge(search.found, started)
+
+    @staticmethod
+    def _merge(found, started):
+        METRICS.observe("search_seconds", time.time() - started, engine="parallel")
+        METRICS.inc("search_roundtrips_found_total", sum(map(len, found)), engine="parallel")
+        logging.debug(f"Parallel search found {sum(map(len, found))} roundtrips "
+                      f"in {time.time() - started:.3f}s")
+        return [sorted(conversions, key=Trade.profitability, reverse=True)
+                for conversions in found]
+
+    def close(self):
+        if self._owns_executor:
+            self.executor.shutdown()
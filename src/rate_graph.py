@@ -0,0 +1,364 @@
+import heapq
+import itertools
+import logging
+import math
+import operator
+import time
+from collections import defaultdict, namedtuple
+
+from src.metrics import METRICS
+from src.trade import Chain, Trade
+
+Edge = namedtuple("Edge", ["exchange", "from_cur", "to_cur", "log_rate", "book"])
+
+
+class SearchStats:
+    """How much work one roundtrip search did, and why branches were cut."""
+    __slots__ = ("expanded", "priced", "unreachable", "unprofitable", "repeats", "no_volume",
+                 "crowded", "found")
+
+    def __init__(self):
+        for name in self.__slots__:
+            setattr(self, name, 0)
+
+    def record(self, metrics, seconds, engine="graph"):
+        metrics.observe("search_seconds", seconds, engine=engine)
+        metrics.inc("search_nodes_expanded_total", self.expanded, engine=engine)
+        metrics.inc("search_books_priced_total", self.priced, engine=engine)
+        for reason in ("unreachable", "unprofitable", "repeats", "no_volume", "crowded"):
+            metrics.inc("search_pruned_total", getattr(self, reason), engine=engine, reason=reason)
+        metrics.inc("search_roundtrips_found_total", self.found, engine=engine)
+
+
+class RateGraph:
+    """Weighted log-rate graph built from a RateTable snapshot.
+
+    Every book is an edge weighted by the log of its top-of-book rate net of the taker fee, so a
+    profitable roundtrip is a positive-weight cycle (a negative cycle in -log space). Coins move
+    between exchanges, so nodes are currencies with parallel edges for each exchange. Moving a
+    coin costs its withdrawal fee, which only lowers what a chain makes, so the top-of-book
+    bounds still hold. The table stores coins under canonical names, so cur has to be canonical.
+
+    Searches keep at most width partial chains into each coin at each step, so their cost grows
+    with the number of books rather than the number of paths through them, and their results
+    are approximate. A width at least the number of paths makes a search exhaustive, like
+    RateTable's "dfs" engine. Searches with min_profit are exhaustive at any width: they keep
+    every partial chain that can still reach it, and prune the rest by that bound instead.
+    """
+    WIDTH = 16
+
+    def __init__(self, snapshot, exchanges=None, coins=None, width=None):
+        self.snapshot = snapshot
+        self.width = width if width is not None else self.WIDTH
+        self.stats = SearchStats()
+        self.edges = defaultdict(list)
+        self._neighbors = {}
+        # (cur, max_steps, dirty) -> (bounds, reach), so searches from one coin share them.
+        self._bounds_cache = {}
+        self._order = itertools.count()
+
+        for exchange_name, exchange in snapshot.items():
+            if exchanges and exchange_name not in exchanges:
+                continue
+
+            for from_cur, row in exchange.items():
+                for to_cur, book in row.items():
+                    if not book or (coins and to_cur not in coins):
+                        continue
+                    rate = book.rate
+                    if not rate or rate <= 0:
+                        continue
+                    self.edges[from_cur].append(
+                        Edge(exchange_name, from_cur, to_cur, math.log(rate), book))
+
+    def neighbors(self, cur):
+        """Returns the edges leaving a currency."""
+        return self.edges.get(cur, ())
+
+    def return_bounds(self, targets, max_steps):
+        """Bounded Bellman-Ford relaxation towards a set of target currencies.
+
+        bounds[k][coin] is the best log rate achievable from coin back to a target in at most
+        k steps, using top-of-book rates. Coins missing from bounds[k] can't get home in k steps.
+        Market fills never beat the top of the book, so these are upper bounds on real chains.
+        """
+        bounds = [{target: 0.0 for target in targets}]
+        for _ in range(max_steps):
+            previous = bounds[-1]
+            current = dict(previous)
+            for from_cur, edges in self.edges.items():
+                if from_cur in targets:
+                    continue
+                best = current.get(from_cur, float("-inf"))
+                for edge in edges:
+                    rest = previous.get(edge.to_cur)
+                    if rest is not None and edge.log_rate + rest > best:
+                        best = edge.log_rate + rest
+                if best > float("-inf"):
+                    current[from_cur] = best
+            bounds.append(current)
+        return bounds
+
+    def dirty_bounds(self, targets, bounds, dirty, max_steps):
+        """Like return_bounds, but for getting home while trading on at least one dirty book.
+
+        dirty holds (exchange, from_cur, to_cur) keys. reach[k] is the set of coins that can get
+        back to a target in at most k steps along a path that uses a dirty book.
+        """
+        reach = [set()]
+        for steps in range(1, max_steps + 1):
+            home = bounds[steps - 1]
+            previous = reach[-1]
+            current = set(previous)
+            for from_cur, edges in self.edges.items():
+                if from_cur in targets or from_cur in current:
+                    continue
+                for edge in edges:
+                    if ((edge.exchange, from_cur, edge.to_cur) in dirty and edge.to_cur in home) \
+                            or (edge.to_cur in previous and edge.to_cur not in targets):
+                        current.add(from_cur)
+                        break
+            reach.append(current)
+        return reach
+
+    def first_hops(self, cur):
+        """Returns the (exchange, from_cur, to_cur) books a roundtrip from cur can start with."""
+        return [(edge.exchange, edge.from_cur, edge.to_cur) for edge in self.neighbors(cur)]
+
+    def roundtrips(self, cur, amount, max_steps=4, dirty=None, first_hops=None, min_profit=None):
+        """Returns the most promising chains of up to max_steps trades from cur back to itself.
+
+        This is a Bellman-Ford relaxation over priced chains: each step extends the partial
+        chains kept so far by every book, prices the trade at the amount they hold and keeps
+        the width best into each coin, ranked by their value so far times the best top-of-book
+        rate home. Branches that can't make it back to cur within the remaining steps are never
+        priced. Every chain that gets home is returned, so the best ones are found without
+        enumerating every path, but unlike the "dfs" engine, not every chain is.
+        If dirty is given, only chains that trade on at least one of those
+        (exchange, from_cur, to_cur) books are returned. If first_hops is given, only chains
+        starting with one of those books are returned, which lets a search be split up.
+        If min_profit is given, only chains at least that profitable are returned, and all of
+        them are: no partial chain that could still reach it is crowded out.
+        """
+        solutions = list(self.iter_roundtrips(cur, amount, max_steps, dirty, first_hops,
+                                              min_profit))
+        logging.debug(f"Graph search from {cur} found {len(solutions)} roundtrips "
+                      f"over {sum(len(e) for e in self.edges.values())} edges")
+        return solutions
+
+    def iter_roundtrips(self, cur, amount, max_steps=4, dirty=None, first_hops=None,
+                        min_profit=None):
+        """Generates the chains roundtrips returns as the search finds them.
+
+        With min_profit, a partial chain is dropped as soon as its value so far times the best
+        top-of-book rate home can't reach 1 + min_profit, before its next book is even priced.
+        """
+        started = time.perf_counter()
+        self.stats = SearchStats()
+        for _, chain in self._search(cur, [amount], max_steps, dirty, first_hops, min_profit):
+            yield chain
+        if METRICS.enabled:
+            self.stats.record(METRICS, time.perf_counter() - started)
+
+    def inventory_roundtrips(self, inventories, max_steps=4, dirty=None, min_profit=None):
+        """Returns the roundtrips of every (cur, amount) in inventories, a list for each.
+
+        Inventories of one currency are searched together, each amount in a lane of its own:
+        every coin the search reaches is expanded once for all of them, against one set of
+        bounds home. Chains are the same as roundtrips finds for each inventory alone, in no
+        particular order.
+        """
+        started = time.perf_counter()
+        self.stats = SearchStats()
+        found = [[] for _ in inventories]
+        for cur, indexes in self.lanes(inventories).items():
+            amounts = [inventories[index][1] for index in indexes]
+            for lane, chain in self._search(cur, amounts, max_steps, dirty, None, min_profit):
+                found[indexes[lane]].append(chain)
+        if METRICS.enabled:
+            self.stats.record(METRICS, time.perf_counter() - started)
+        return found
+
+    @staticmethod
+    def lanes(inventories):
+        """Returns the indexes of (cur, amount) inventories by currency, in the order given.
+
+        Each currency's amounts are searched as the lanes of one search.
+        """
+        lanes = defaultdict(list)
+        for index, (cur, _) in enumerate(inventories):
+            lanes[cur].append(index)
+        return dict(lanes)
+
+    def _bounds(self, cur, max_steps, dirty):
+        key = (cur, max_steps, None if dirty is None else frozenset(dirty))
+        if key not in self._bounds_cache:
+            bounds = self.return_bounds({cur}, max_steps)
+            reach = self.dirty_bounds({cur}, bounds, dirty, max_steps) \
+                if dirty is not None else None
+            self._bounds_cache[key] = (bounds, reach)
+        return self._bounds_cache[key]
+
+    def _width(self, min_profit):
+        # With a floor, every partial that can still clear it is kept, so nothing that pays is
+        # crowded out. Without one, the width best into each coin are.
+        return self.width if min_profit is None else None
+
+    def _search(self, cur, amounts, max_steps, dirty, first_hops, min_profit):
+        # Generates (lane, chain) for chains home from each amount of cur, each in its own lane.
+        if max_steps <= 0:
+            return
+        frontier = self.start(cur, amounts)
+        for step in range(max_steps):
+            candidates = defaultdict(list)
+            yield from self.expand(cur, frontier, step, max_steps, candidates, dirty, first_hops,
+                                   min_profit)
+            frontier = self.next_frontier(candidates, len(amounts), self._width(min_profit))
+
+    @staticmethod
+    def start(cur, amounts):
+        """Returns the frontier a search from cur starts with, a lane for each amount of cur.
+
+        A frontier maps (coin, touched) to a list of partial chains into coin for each lane,
+        touched being whether they trade on a dirty book yet. Partial chains are
+        (log value, amount held, trade, parent), the chain being rebuilt from the parents only
+        once it gets home.
+        """
+        return {(cur, False): [[(0.0, amount, None, None)] for amount in amounts]}
+
+    def expand(self, cur, frontier, step, max_steps, candidates, dirty=None, first_hops=None,
+               min_profit=None):
+        """Runs one step of a search from cur, extending the frontier's chains by every book.
+
+        Generates (lane, chain) for the chains that get home, and adds the partial chains worth
+        keeping to candidates, a defaultdict(list) by (coin, touched, lane) holding min-heaps of
+        (log value + best rate home, tiebreak, partial). Partials are kept apart by touched, so
+        untouched ones don't crowd out those on dirty books, and by lane, so amounts don't crowd
+        each other out. A frontier can be split up and each part expanded separately, as long
+        as their candidates are merged by next_frontier.
+        """
+        stats = self.stats
+        bounds, reach = self._bounds(cur, max_steps, dirty)
+        remaining = max_steps - step - 1
+        reachable = bounds[remaining]
+        # Slack so chains that fill entirely at the top of the book survive rounding in the logs.
+        floor = math.log1p(min_profit) - 1e-9 if min_profit is not None else None
+        width = self._width(min_profit)
+        for (from_cur, touched), lanes in frontier.items():
+            stats.expanded += 1
+            # Which books lead home in time, and whether they touch a dirty one, doesn't depend
+            # on the partial, so it's settled once for every lane.
+            edges = []
+            for edge in self.neighbors(from_cur):
+                home = reachable.get(edge.to_cur)
+                if home is None:
+                    stats.unreachable += 1
+                    continue
+                pair = (edge.exchange, from_cur, edge.to_cur)
+                if first_hops is not None and step == 0 and pair not in first_hops:
+                    continue
+                now_touched = touched
+                if reach is not None and not touched:
+                    now_touched = pair in dirty
+                    if not now_touched and (edge.to_cur == cur
+                                            or edge.to_cur not in reach[remaining]):
+                        continue
+                edges.append((edge, home, pair, now_touched))
+
+            for lane, partials in enumerate(lanes):
+                for partial in partials:
+                    yield from self._extend(partial, lane, cur, edges, candidates, floor, width,
+                                            min_profit)
+
+    @staticmethod
+    def next_frontier(candidates, lanes, width=None):
+        """Returns the frontier of a search's next step from the candidates of its last.
+
+        Candidates merged from expanding parts of a frontier separately can hold more than
+        width partials into a (coin, touched, lane), so only the width best of those are kept.
+        """
+        frontier = {}
+        for (coin, touched, lane), kept in candidates.items():
+            if not kept:
+                continue
+            if width is not None and len(kept) > width:
+                kept = heapq.nlargest(width, kept, key=operator.itemgetter(0))
+            frontier.setdefault((coin, touched), [[] for _ in range(lanes)])[lane] = \
+                [partial for _, _, partial in kept]
+        return frontier
+
+    def _extend(self, partial, lane, cur, edges, candidates, floor, width, min_profit):
+        """Prices a partial chain's next trades, keeping the promising ones in candidates.
+
+        Generates (lane, chain) for those that get home.
+        """
+        stats = self.stats
+        log_value, held, trade, _ = partial
+        held_on = trade.exchange if trade is not None else None
+        for edge, home, pair, now_touched in edges:
+            if floor is not None and log_value + edge.log_rate + home < floor:
+                stats.unprofitable += 1
+                continue
+            if self._uses(partial, pair):
+                # Don't repeat the same trades in a single chain.
+                stats.repeats += 1
+                continue
+            if edge.to_cur != cur:
+                kept = candidates[edge.to_cur, now_touched, lane]
+                if width is not None and len(kept) >= width \
+                        and log_value + edge.log_rate + home <= kept[0][0]:
+                    # Even filling at the top of the book can't beat the worst kept.
+                    stats.crowded += 1
+                    continue
+
+            stats.priced += 1
+            value, limit, next_amount = self.snapshot.price_trade(
+                edge.book, held, pair[1], held_on, edge.exchange)
+            if not value:
+                stats.no_volume += 1
+                continue
+            next_partial = (log_value + math.log(value), next_amount,
+                            Trade(edge.exchange, pair[1], edge.to_cur, next_amount, limit, value),
+                            partial)
+            if edge.to_cur != cur:
+                ranked = (next_partial[0] + home, next(self._order), next_partial)
+                if floor is not None and ranked[0] < floor:
+                    # The book filled below its top, so this can't clear the floor.
+                    stats.unprofitable += 1
+                elif width is None or len(kept) < width:
+                    heapq.heappush(kept, ranked)
+                else:
+                    # This one or the worst kept, whichever ranks lower, drops out.
+                    stats.crowded += 1
+                    if ranked[0] > kept[0][0]:
+                        heapq.heapreplace(kept, ranked)
+                continue
+
+            chain = self._rebuild(next_partial)
+            if min_profit is None or Trade.profitability(chain) >= min_profit:
+                stats.found += 1
+                yield lane, chain
+
+    @staticmethod
+    def _uses(partial, book):
+        """Returns whether a partial chain trades an (exchange, from_cur, to_cur) book at all."""
+        exchange, from_cur, to_cur = book
+        _, _, trade, parent = partial
+        while trade is not None:
+            if trade.exchange == exchange \
+                    and ((trade.from_cur == from_cur and trade.next_cur == to_cur)
+                         or (trade.from_cur == to_cur and trade.next_cur == from_cur)):
+                return True
+            _, _, trade, parent = parent
+        return False
+
+    @staticmethod
+    def _rebuild(partial):
+        trades = []
+        while partial[2] is not None:
+            trades.append(partial[2])
+            partial = partial[3]
+        chain = Chain()
+        for trade in reversed(trades):
+            chain = chain.then(trade)
+        return chain
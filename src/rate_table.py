@@ -1,49 +1,103 @@
 import asyncio
 import collections
-import itertools
+import heapq
 import logging
-from collections import OrderedDict, defaultdict
+import threading
+import time
+from collections import OrderedDict, defaultdict, namedtuple
 from typing import Dict, Tuple
 
+import numpy as np
 from ccxt import RequestTimeout
 from more_itertools import nth
 
-from src.trade import Trade
+from src.book_feed import L2Book
+from src.coin_aliases import CoinAliases
+from src.metrics import METRICS
+from src.order_book import BookSide, InvertedBookSide, Interner, market_prices
+from src.rate_graph import RateGraph
+from src.scheduler import backoff_delay
+from src.sizing import optimal_size
+from src.trade import Chain, Trade
+
+# One immutable state of a RateTable: exchange -> from_cur -> to_cur -> book, each exchange's
+# (from_cur, to_cur) -> version of its last change, and the version of the whole table.
+Generation = namedtuple("Generation", ["data", "book_versions", "version"])
+
+# Prices of every pair on every exchange and what buying on one and selling on another makes.
+# sell and buy are (pair, exchange) arrays of the bid and ask, averaged over the order size if
+# one was given. absdiffs and pctdiffs are (pair, buy exchange, sell exchange) arrays.
+# Missing books, books too thin for the size and same-exchange entries are NaN.
+SpreadMatrix = namedtuple("SpreadMatrix",
+                          ["pairs", "exchanges", "sell", "buy", "absdiffs", "pctdiffs"])
+
+# One cross-exchange trade: buy the base of pair at buy_price on buy_exchange, sell at sell_price.
+Spread = namedtuple("Spread", ["pair", "buy_exchange", "sell_exchange", "buy_price",
+                               "sell_price", "absdiff", "pctdiff"])
 
 
 class RateTable(collections.UserDict):
-    SYNONYMS = {
+    # Coins are stored under these canonical names, whatever an exchange lists them as.
+    ALIASES = CoinAliases({
         "XBT": "BTC",
         "BCC": "BCH",
-    }
-
-    SYNONYMS.update({v: k for k, v in SYNONYMS.items()})
-
-    async def populate(self, exchange, blacklisted=None):
+    })
+
+    def __init__(self, *args, aliases=None, **kwargs):
+        self.aliases = RateTable.ALIASES if aliases is None else aliases
+        self.coins = Interner()
+        self.exchange_ids = Interner()
+        self.frozen = False
+        self.generation = Generation({}, {}, 0)
+        self.updated_at = {}
+        # A CaptureWriter that records every set_books call, if capturing.
+        self.recorder = None
+        # A ComputeExecutor that populate converts books in, off the event loop, if set.
+        self.compute = None
+        # Writers hold this, so books can be stored from the compute threads.
+        self._lock = threading.RLock()
+        # exchange -> symbol -> taker fee, and exchange -> coin -> flat withdrawal fee.
+        self.taker_fees = {}
+        self.withdraw_fees = {}
+        super(RateTable, self).__init__(*args, **kwargs)
+
+    async def populate(self, exchange, blacklisted=None, symbols=None, retries=5):
+        """Loads an exchange's books into the table, or only those for symbols if given.
+
+        Timeouts are retried with jittered exponential backoff; the last one is raised.
+        With a compute executor, the fetched books are converted and stored in its threads.
+        """
         if not blacklisted:
             blacklisted = set()
 
         marginal = self.get(exchange.name)
-        if marginal is None:
-            logging.info(f"Initializing {exchange}...")
-            marginal = {}
-            self[exchange.name] = marginal
-            for attempt in range(5):
+        # An exchange is only registered once its markets load, so a failed first load is
+        # simply tried again on the next call.
+        if marginal is None or not exchange.markets:
+            if marginal is None:
+                logging.info(f"Initializing {exchange}...")
+            for attempt in range(1, retries + 1):
                 try:
                     await exchange.load_markets()
                     break
                 except RequestTimeout:
-                    pass
-
-        pairs = [symbol for symbol in exchange.symbols
+                    if attempt == retries:
+                        raise
+                    await asyncio.sleep(backoff_delay(attempt))
+            self.load_fees(exchange)
+            if marginal is None:
+                marginal = {}
+                self[self.exchange_ids.intern(exchange.name)] = marginal
+
+        pairs = [symbol for symbol in (exchange.symbols if symbols is None else symbols)
                  if symbol and "/" in symbol
                  and symbol.split("/", 1)[0] not in blacklisted
                  and symbol.split("/", 1)[1] not in blacklisted]
 
-        for attempt in range(5):
+        started = time.perf_counter()
+        for attempt in range(1, retries + 1):
             try:
-                if not exchange.hasFetchTickers \
-                        or len(pairs) <= 10 or exchange.has.get("fetchOrderBooks", False):
+                if self.fetches_by_book(exchange, pairs):
                     logging.debug(f"Loading {len(pairs)} markets by book at {exchange}...")
                     books = [exchange.fetch_l2_order_book(symbol) for symbol in pairs]
                     books = await asyncio.gather(*books, return_exceptions=True)
@@ -60,36 +114,313 @@ class RateTable(collections.UserDict):
                             books[pair_name] = pair
                 break
             except (TimeoutError, RequestTimeout):
-                logging.warning("Timeout while requesting tickers from {exchange.name}")
+                logging.warning(f"Timeout while requesting tickers from {exchange.name}")
+                if attempt == retries:
+                    METRICS.inc("populate_failures_total", exchange=exchange.name)
+                    raise
+                await asyncio.sleep(backoff_delay(attempt))
+        METRICS.observe("populate_seconds", time.perf_counter() - started, exchange=exchange.name)
 
         logging.log(level=logging.DEBUG if marginal else logging.INFO,
                     msg=f"Loaded {len(books)} markets at {exchange}.")
 
+        if self.compute is not None:
+            loaded = await self.compute.run(self._store_books, exchange.name, books)
+        else:
+            loaded = self._store_books(exchange.name, books)
+        METRICS.inc("books_loaded_total", loaded, exchange=exchange.name)
+        METRICS.inc("books_failed_total", len(books) - loaded, exchange=exchange.name)
+
+    def _store_books(self, exchange_name, books):
+        orders = {}
         for pair, data in books.items():
-            coin1, coin2 = pair.split("/", 1)
             try:
-                if not coin1 or not coin2 or not data["bids"] or not data["asks"]:
+                if not data["bids"] or not data["asks"]:
                     continue
             except TypeError as e:
                 # logging.warning(f"{e} when processing {pair}; data is {data}")
                 continue
 
-            if coin1 not in marginal:
-                marginal[coin1] = {}
+            orders[pair] = (data["bids"], data["asks"])
+        self.set_books(exchange_name, orders)
+        return len(orders)
+
+    @staticmethod
+    def fetches_by_book(exchange, pairs):
+        """Returns whether populate loads pairs one book at a time rather than from tickers."""
+        return not exchange.hasFetchTickers \
+            or len(pairs) <= 10 or exchange.has.get("fetchOrderBooks", False)
+
+    async def stream(self, exchange_name, feed, symbols, blacklisted=None):
+        """Keeps an exchange's books current from a BookFeed until the feed closes.
+
+        Diffs are applied to the in-memory books as they arrive. When a symbol's sequence skips,
+        its book is removed from the table and a fresh snapshot is requested; diffs for it are
+        ignored until that snapshot lands.
+        """
+        if not blacklisted:
+            blacklisted = set()
+
+        symbols = [symbol for symbol in symbols
+                   if symbol and "/" in symbol
+                   and symbol.split("/", 1)[0] not in blacklisted
+                   and symbol.split("/", 1)[1] not in blacklisted]
+        books = {symbol: L2Book() for symbol in symbols}
+        resyncing = set()
+
+        await feed.subscribe(symbols)
+        async for message in feed.messages():
+            symbol = message.get("symbol")
+            book = books.get(symbol)
+            if book is None:
+                continue
+
+            if not book.apply(message):
+                if book.synced:
+                    self.remove_book(exchange_name, symbol)
+                book.synced = False
+                if symbol not in resyncing:
+                    logging.info(f"Sequence gap in {symbol} at {exchange_name} after "
+                                 f"{book.sequence}, got {message.get('sequence')}; resnapshotting")
+                    resyncing.add(symbol)
+                    await feed.resnapshot(symbol)
+                continue
+
+            resyncing.discard(symbol)
+            bids, asks = book.orders()
+            if bids and asks:
+                self.set_book(exchange_name, symbol, bids, asks)
+            else:
+                # An emptied side mustn't leave its last levels in the table to trade against.
+                self.remove_book(exchange_name, symbol)
 
-            if coin2 not in marginal:
-                marginal[coin2] = {}
+    def load_fees(self, exchange):
+        """Reads an exchange's taker fee for each market and its withdrawal fee for each coin.
+
+        Market fees come from the loaded markets, falling back to the exchange's trading fee, and
+        apply to the books stored from then on.
+        """
+        trading = (exchange.fees or {}).get("trading", {})
+        default = trading.get("taker") if isinstance(trading.get("taker"), (int, float)) else 0.0
+        taker = {}
+        for symbol, market in (exchange.markets or {}).items():
+            fee = market.get("taker")
+            taker[symbol] = fee if isinstance(fee, (int, float)) else default
+
+        withdraw = {}
+        funding = (exchange.fees or {}).get("funding", {}).get("withdraw", {})
+        with self._lock:
+            for coin, fee in funding.items():
+                if isinstance(fee, (int, float)) and fee > 0:
+                    withdraw[self.coins.intern(self.aliases.canonical(coin, exchange.name))] = fee
+        self.set_fees(exchange.name, taker, withdraw)
+
+    def set_fees(self, exchange_name, taker=None, withdraw=None):
+        """Sets an exchange's taker fees by symbol and flat withdrawal fees by canonical coin.
+
+        Taker fees apply to books stored from then on. Withdrawal fees reprice every chain that
+        moves a coin off the exchange, so changing them publishes a generation in which all of
+        the exchange's books changed. A recorder, if set, captures the fees along with the books
+        so replays price the same.
+        """
+        with self._lock:
+            exchange_name = self.exchange_ids.intern(exchange_name)
+            if self.recorder is not None:
+                self.recorder.record_fees(exchange_name, taker, withdraw)
+            if taker is not None:
+                self.taker_fees = dict(self.taker_fees, **{exchange_name: dict(taker)})
+            if withdraw is not None:
+                withdraw = dict(withdraw)
+                changed = withdraw != self.withdraw_fees.get(exchange_name, {})
+                self.withdraw_fees = dict(self.withdraw_fees, **{exchange_name: withdraw})
+                marginal = self.generation.data.get(exchange_name)
+                if changed and marginal:
+                    version = self.generation.version + 1
+                    self._publish(exchange_name, marginal, self._all_books(marginal, version),
+                                  version)
+
+    def withdrawal(self, coin, from_exchange, to_exchange):
+        """Returns the flat amount of coin lost moving it between exchanges, if it has to move."""
+        if from_exchange is None or from_exchange == to_exchange:
+            return 0.0
+        return self.withdraw_fees.get(from_exchange, {}).get(coin, 0.0)
+
+    def transfer(self, amount, coin, from_exchange, to_exchange):
+        """Returns how much of amount of coin arrives after moving it between exchanges."""
+        return amount - self.withdrawal(coin, from_exchange, to_exchange)
+
+    def price_trade(self, book, amount, coin, from_exchange, to_exchange):
+        """Returns the value, limit and amount out of trading amount of coin held on one exchange
+        through a book on another, or Nones if it can't be done.
+
+        The value is net of the taker fee and of withdrawing the coin first, so a chain's value
+        is still the product of its trades' values.
+        """
+        available = self.transfer(amount, coin, from_exchange, to_exchange)
+        if available <= 0:
+            return None, None, None
+        value, limit, next_amount = self.get_market_price(book, available)
+        if value and available != amount:
+            value *= available / amount
+        return value, limit, next_amount
+
+    def set_book(self, exchange_name, pair, bids, asks):
+        """Stores a ccxt-style order book for a pair like "ETH/USD" on an exchange."""
+        self.set_books(exchange_name, {pair: (bids, asks)})
+
+    def remove_book(self, exchange_name, pair):
+        """Drops both directions of a pair's book, e.g. while it waits for a fresh snapshot."""
+        self.set_books(exchange_name, {pair: None})
+
+    def set_books(self, exchange_name, books):
+        """Stores many books for one exchange as a single new generation of the table.
+
+        books maps pairs like "ETH/USD" to (bids, asks) ccxt-style orders, or to None to remove
+        that pair. Coins are stored under their canonical names from aliases, so nothing that
+        reads the table needs to know about synonyms. Published dicts are never modified: the
+        exchange and the rows it touches are copied, updated off to the side and swapped in at
+        once, so snapshots stay consistent.
+        Books carry the taker fee set for their symbol.
+        updated_at records when each exchange last stored books, even if none of them changed,
+        and a recorder, if set, captures the call as given so it can be replayed later.
+        """
+        with self._lock:
+            self._set_books(exchange_name, books)
+
+    def _set_books(self, exchange_name, books):
+        if self.frozen:
+            raise TypeError("Can't modify a RateTable snapshot")
+
+        exchange_name = self.exchange_ids.intern(exchange_name)
+        now = self.updated_at[exchange_name] = time.time()
+        if self.recorder is not None:
+            self.recorder.record(exchange_name, books, now)
+        fees = self.taker_fees.get(exchange_name, {})
+        old = self.data.get(exchange_name)
+        marginal = dict(old or {})
+        copied = set()
+        changed = []
+
+        def row(coin):
+            if coin not in copied:
+                marginal[coin] = dict(marginal.get(coin, {}))
+                copied.add(coin)
+            return marginal[coin]
+
+        for pair, orders in books.items():
+            coin1, coin2 = pair.split("/", 1)
+            if not coin1 or not coin2:
+                continue
+
+            coin1 = self.coins.intern(self.aliases.canonical(coin1, exchange_name))
+            coin2 = self.coins.intern(self.aliases.canonical(coin2, exchange_name))
+            if coin1 == coin2:
+                continue  # e.g. XBT/BTC
+            old_bids = marginal.get(coin1, {}).get(coin2)
+            old_asks = marginal.get(coin2, {}).get(coin1)
+
+            if orders is None:
+                if old_bids is None:
+                    continue
+                del row(coin1)[coin2]
+                del row(coin2)[coin1]
+                changed.append((coin1, coin2))
+                continue
 
             # e.g. ETH/USD:
             # coin1 = ETH
             # coin2 = USD
             # The table is "from -> to", so "I have ETH and I want USD" means selling,
             # which means placing an order at the bid to get a fill.
-            # Going the other way entails buying at 1 / the ask in USD.
-            marginal[coin1][coin2] = [(bid, volume) for bid, volume in data["bids"]
-                                      if bid and bid > 0]
-            marginal[coin2][coin1] = [(1 / ask, ask * volume)
-                                      for ask, volume in data["asks"] if ask and ask > 0]
+            # Going the other way entails buying at 1 / the ask in USD, which is only
+            # computed when something reads that side.
+            fee = fees.get(pair, 0.0)
+            bids = BookSide.from_orders(orders[0], fee)
+            asks = BookSide.from_orders(orders[1])
+            if old_bids is not None and old_asks is not None \
+                    and old_bids.fee == fee and old_asks.fee == fee \
+                    and old_bids.same_levels(bids) and old_asks.asks.same_levels(asks):
+                continue
+
+            row(coin1)[coin2] = bids
+            row(coin2)[coin1] = asks.inverted(fee)
+            changed.append((coin1, coin2))
+
+        if old is not None and not changed:
+            return
+
+        generation = self.generation
+        version = generation.version + 1
+        book_versions = dict(generation.book_versions.get(exchange_name, {}))
+        for coin1, coin2 in changed:
+            book_versions[coin1, coin2] = version
+            book_versions[coin2, coin1] = version
+        self._publish(exchange_name, marginal, book_versions, version)
+
+    def __setitem__(self, exchange_name, marginal):
+        if self.frozen:
+            raise TypeError("Can't modify a RateTable snapshot")
+        with self._lock:
+            generation = self.generation
+            self._publish(exchange_name, marginal,
+                          generation.book_versions.get(exchange_name, {}), generation.version)
+
+    def __delitem__(self, exchange_name):
+        if self.frozen:
+            raise TypeError("Can't modify a RateTable snapshot")
+        with self._lock:
+            generation = self.generation
+            data = dict(generation.data)
+            old = data.pop(exchange_name)
+            # Every book the exchange had changed, so trackers drop the chains trading on them.
+            version = generation.version + 1
+            all_versions = dict(generation.book_versions)
+            all_versions[exchange_name] = self._all_books(old, version)
+            self.generation = Generation(data, all_versions, version)
+
+    @staticmethod
+    def _all_books(marginal, version):
+        return {(from_cur, to_cur): version for from_cur, row in marginal.items() for to_cur in row}
+
+    def _publish(self, exchange_name, marginal, book_versions, version):
+        generation = self.generation
+        data = dict(generation.data)
+        data[exchange_name] = marginal
+        all_versions = dict(generation.book_versions)
+        all_versions[exchange_name] = book_versions
+        self.generation = Generation(data, all_versions, version)
+
+    @property
+    def data(self):
+        return self.generation.data
+
+    @data.setter
+    def data(self, data):
+        generation = getattr(self, "generation", None) or Generation({}, {}, 0)
+        self.generation = generation._replace(data=data)
+
+    @property
+    def version(self):
+        return self.generation.version
+
+    def snapshot(self):
+        """Returns a read-only view of the table as it is now, without copying any books."""
+        snapshot = RateTable.__new__(RateTable)
+        snapshot.__dict__.update(self.__dict__)
+        snapshot.frozen = True
+        snapshot.recorder = None
+        return snapshot
+
+    def copy(self):
+        return self.snapshot()
+
+    __copy__ = copy
+
+    def changed_since(self, version):
+        """Returns the (exchange, from_cur, to_cur) books that changed after a table version."""
+        return {(exchange, from_cur, to_cur)
+                for exchange, book_versions in self.generation.book_versions.items()
+                for (from_cur, to_cur), changed in book_versions.items() if changed > version}
 
     def get_pairs(self):
         """Returns all currency pairs in this table."""
@@ -103,8 +434,11 @@ class RateTable(collections.UserDict):
     def pairwise_diffs(self, from_cur, to_cur, snapshot=None) -> Tuple[Dict, Dict]:
         """Returns pairwise absolute and % differences between exchanges for a currency pair.
 
-        Values represent profit from buying on the row, selling on the column."""
-        snapshot = snapshot or self.copy()  # Prevent changes midway.
+        Values represent profit from buying on the row, selling on the column.
+        best_spreads compares bids against asks for every pair at once."""
+        snapshot = snapshot or self.snapshot()  # Prevent changes midway.
+        from_cur = snapshot.aliases.canonical(from_cur)
+        to_cur = snapshot.aliases.canonical(to_cur)
         absdiffs = {}
         pctdiffs = {}
 
@@ -113,8 +447,8 @@ class RateTable(collections.UserDict):
                 if absdiffs.get(exchange1, {}).get(exchange2, {}):
                     continue
 
-                e1pair = RateTable._synget(snapshot, exchange1, from_cur, to_cur)
-                e2pair = RateTable._synget(snapshot, exchange2, from_cur, to_cur)
+                e1pair = snapshot[exchange1].get(from_cur, {}).get(to_cur)
+                e2pair = snapshot[exchange2].get(from_cur, {}).get(to_cur)
 
                 if not e1pair or not e2pair:
                     continue
@@ -130,7 +464,7 @@ class RateTable(collections.UserDict):
                     pctdiffs[exchange2] = {}
 
                 absdiffs[exchange1][exchange2] = buyone
-                pctdiffs[exchange1][exchange2] = buyone / e1pair
+                pctdiffs[exchange1][exchange2] = buyone / e1pair[0][0]
 
             if exchange1 in absdiffs:
                 absdiffs[exchange1] = OrderedDict(
@@ -148,9 +482,82 @@ class RateTable(collections.UserDict):
                                       reverse=True))
         return absdiffs, pctdiffs
 
+    def spread_matrix(self, size=None, pairs=None, snapshot=None):
+        """Returns a SpreadMatrix of every pair listed on more than one exchange, or of pairs.
+
+        Prices are the best bid and ask, or with a size in units of each pair's base currency,
+        the average price of selling or buying that much through the book, both net of taker
+        fees. Pairs are named like "ETH/USD", using canonical coin names and the base and quote
+        the exchanges list them with.
+        """
+        snapshot = snapshot or self.snapshot()  # Prevent changes midway.
+        exchanges = list(snapshot.keys())
+        sides = {}
+        for column, exchange_name in enumerate(exchanges):
+            exchange = snapshot[exchange_name]
+            for base, row in exchange.items():
+                for quote, bids in row.items():
+                    if isinstance(bids, InvertedBookSide):
+                        continue
+                    asks = exchange[quote][base]
+                    sides.setdefault(f"{base}/{quote}", {})[column] = (bids, asks)
+
+        if pairs is None:
+            pairs = sorted(pair for pair, listed in sides.items() if len(listed) > 1)
+        sell = np.full((len(pairs), len(exchanges)), np.nan)
+        buy = np.full((len(pairs), len(exchanges)), np.nan)
+        cells = [(row, column, bids, asks) for row, pair in enumerate(pairs)
+                 for column, (bids, asks) in sides.get(pair, {}).items()
+                 if len(bids) and len(asks.asks)]
+        if cells:
+            rows, columns, bids, inverted = zip(*cells)
+            asks = [side.asks for side in inverted]
+            # Buying keeps 1 - fee of the base bought, so each unit costs ask / (1 - fee).
+            kept = 1 - np.array([side.fee for side in inverted])
+            if size is None:
+                sell[rows, columns] = [side.rate for side in bids]
+                buy[rows, columns] = np.array([side[0][0] for side in asks]) / kept
+            else:
+                sell[rows, columns] = market_prices(bids, np.full(len(bids), size))[0]
+                buy[rows, columns] = market_prices(asks, np.full(len(asks), size))[0] / kept
+
+        absdiffs = sell[:, None, :] - buy[:, :, None]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            pctdiffs = absdiffs / buy[:, :, None]
+        diagonal = np.arange(len(exchanges))
+        absdiffs[:, diagonal, diagonal] = np.nan
+        pctdiffs[:, diagonal, diagonal] = np.nan
+        return SpreadMatrix(pairs, exchanges, sell, buy, absdiffs, pctdiffs)
+
+    def best_spreads(self, size=None, min_pct=None, limit=None, pairs=None, snapshot=None):
+        """Returns the Spreads of buying a pair on one exchange and selling on another.
+
+        They are sorted by percentage difference, best first. min_pct drops smaller ones and
+        limit keeps only the best. size and pairs are as for spread_matrix.
+        """
+        matrix = self.spread_matrix(size, pairs, snapshot)
+        pctdiffs = matrix.pctdiffs.ravel()
+        candidates = np.flatnonzero(~np.isnan(pctdiffs))
+        if min_pct is not None:
+            candidates = candidates[pctdiffs[candidates] >= min_pct]
+        candidates = candidates[np.argsort(-pctdiffs[candidates], kind="stable")]
+        if limit is not None:
+            candidates = candidates[:limit]
+
+        pair, buy, sell = np.unravel_index(candidates, matrix.pctdiffs.shape)
+        columns = zip([matrix.pairs[index] for index in pair.tolist()],
+                      [matrix.exchanges[index] for index in buy.tolist()],
+                      [matrix.exchanges[index] for index in sell.tolist()],
+                      matrix.buy[pair, buy].tolist(), matrix.sell[pair, sell].tolist(),
+                      matrix.absdiffs.ravel()[candidates].tolist(), pctdiffs[candidates].tolist())
+        return [Spread(*spread) for spread in columns]
+
     @staticmethod
     def get_market_price(book, volume):
         """Returns the average market price, limit, and amount of new currency to fill an order."""
+        if isinstance(book, BookSide):
+            return book.market_price(volume)
+
         total_price = 0
         remaining_volume = volume
         for order_price, order_vol in book:
@@ -162,23 +569,91 @@ class RateTable(collections.UserDict):
                 return avg_price, order_price, volume * avg_price
         return None, None, None
 
-    def best_roundtrips(self, cur, amount, exchanges=None, coins=None, max_steps=4):
+    @staticmethod
+    def get_market_prices(books, amounts):
+        """Batched get_market_price: prices amounts against many books in one NumPy pass.
+
+        Returns arrays of average price, limit and amount out, NaN where a book can't fill.
+        """
+        return market_prices(books, amounts)
+
+    def best_roundtrips(self, cur, amount, exchanges=None, coins=None, max_steps=4,
+                        engine="graph", min_profit=None, limit=None, width=None):
         """Find the most profitable roundtrips from one currency to itself across exchanges.
 
         Returns a list of pairs to trade, sorted by overall profitability.
         Call profitability() on the result to get the profitability as a percentage.
-        """
 
-        conversions = self._all_conversions(cur, cur, amount, [], 0,
-                                            max_steps, exchanges, coins, self.copy())
+        engine selects the search: "graph" keeps the width most promising partial chains into
+        each coin at each step (RateGraph.WIDTH by default), which finds the best roundtrips of
+        large tables at depths "dfs", the original exhaustive search, can't reach. "dfs" finds
+        every chain, and the graph engine finds the same ones when width is that wide.
+        min_profit drops chains less profitable than that, and limit keeps only the best ones.
+        The graph engine prunes with min_profit while searching instead of by width, so with it
+        both engines find the same chains.
+        """
+        snapshot = self.snapshot()
+        cur = self.aliases.canonical(cur)
+        if engine == "graph":
+            conversions = RateGraph(snapshot, exchanges, coins, width).iter_roundtrips(
+                cur, amount, max_steps, min_profit=min_profit)
+        elif engine == "dfs":
+            conversions = self._all_conversions(cur, cur, amount, Chain(), 0,
+                                                max_steps, exchanges, coins, snapshot)
+            if min_profit is not None:
+                conversions = [chain for chain in conversions
+                               if Trade.profitability(chain) >= min_profit]
+        else:
+            raise ValueError(f"Unknown search engine {engine}")
+        if limit is not None:
+            return heapq.nlargest(limit, conversions, key=Trade.profitability)
         return sorted(conversions, key=Trade.profitability, reverse=True)
 
+    def inventory_roundtrips(self, inventories, exchanges=None, coins=None, max_steps=4,
+                             min_profit=None, limit=None, width=None):
+        """best_roundtrips for many (cur, amount) inventories at once, over one search graph.
+
+        Returns a dict from each inventory as given to its chains, sorted by profitability.
+        """
+        snapshot = self.snapshot()
+        inventories = [tuple(inventory) for inventory in inventories]
+        found = RateGraph(snapshot, exchanges, coins, width).inventory_roundtrips(
+            [(self.aliases.canonical(cur), amount) for cur, amount in inventories], max_steps,
+            min_profit=min_profit)
+        roundtrips = {}
+        for inventory, conversions in zip(inventories, found):
+            if limit is not None:
+                roundtrips[inventory] = heapq.nlargest(limit, conversions, key=Trade.profitability)
+            else:
+                roundtrips[inventory] = sorted(conversions, key=Trade.profitability, reverse=True)
+        return roundtrips
+
+    def sized_roundtrips(self, cur, amount, max_amount=None, min_profit=0.0, limit=None,
+                         **kwargs):
+        """Finds roundtrips like best_roundtrips, then sizes each to make the most profit.
+
+        amount is the probe the search prices chains at; keep it small so chains that only pay
+        near the top of the books are found. The search ignores withdrawal fees, since a flat fee
+        that sinks a chain at the probe can be worth paying at a larger size. Each chain is then
+        grown through the depth of its books up to max_amount, in one pass over their levels,
+        and dropped if no size pays once fees are counted. Returns Sized chains, sizes and
+        absolute profits in cur, most profitable first; without max_amount, chains that pay
+        through books of unlimited volume come first, with infinite size and profit.
+        """
+        snapshot = self.snapshot()
+        free_moves = self.snapshot()
+        free_moves.withdraw_fees = {}
+        sized = []
+        for chain in free_moves.best_roundtrips(cur, amount, min_profit=min_profit, **kwargs):
+            best = optimal_size(chain, snapshot, max_amount)
+            if best is not None:
+                sized.append(best)
+        sized.sort(key=lambda best: best.profit, reverse=True)
+        return sized[:limit] if limit is not None else sized
+
     def _all_conversions(self, from_cur, to_cur, amount, trades, step, max_steps,
                          exchanges, coins, snapshot):
-        syn_from = RateTable.SYNONYMS.get(from_cur)
-        syn_to = RateTable.SYNONYMS.get(to_cur)
-        if (from_cur == to_cur or from_cur == syn_to or syn_from == to_cur
-                or (syn_from == syn_to and syn_from)) and trades:
+        if from_cur == to_cur and trades:
             return [trades]
 
         if step >= max_steps:
@@ -189,53 +664,47 @@ class RateTable(collections.UserDict):
             if exchanges and exchange_name not in exchanges:
                 continue
 
-            direct_pairs = exchange.get(from_cur, {}).items()
-            syn_pairs = exchange.get(RateTable.SYNONYMS.get(from_cur), {}).items()
-
-            next_len = len(direct_pairs) + len(syn_pairs)
-            logging.debug(f"On {exchange_name}, {next_len} {from_cur} pairs")
+            pairs = exchange.get(from_cur, {}).items()
+            logging.debug(f"On {exchange_name}, {len(pairs)} {from_cur} pairs")
 
             no_volume = 0
             repeat_trades = 0
-            for next_cur, book in itertools.chain(direct_pairs, syn_pairs):
-                value, limit, next_amount = self.get_market_price(book, amount)
+            held_on = trades[-1].exchange if trades else None
+            for next_cur, book in pairs:
+                value, limit, next_amount = snapshot.price_trade(book, amount, from_cur, held_on,
+                                                                 exchange_name)
 
                 if not value or (coins and next_cur not in coins):
                     no_volume += 1
                     continue
 
                 next_trade = Trade(exchange_name, from_cur, next_cur, next_amount, limit, value)
-                pair = next_trade.get_unique()
-                inv_pair = next_trade.get_unique_inv()
-                pairs = set(t.get_unique() for t in trades)
-                if pair in pairs or inv_pair in pairs:
+                if trades.uses(next_trade.get_unique()):
                     # Don't repeat the same trades in a single chain.
                     repeat_trades += 1
                     continue
 
                 solutions += self._all_conversions(
                     next_cur, to_cur, next_amount,
-                    trades + [next_trade],
+                    trades.then(next_trade),
                     step + 1, max_steps, exchanges, coins, snapshot)
 
             if step == 0:
                 logging.debug(f"Trading {from_cur} on {exchange_name}, {no_volume} no-volume, "
                               f"{repeat_trades} repeats, {len(solutions)} solutions")
+            METRICS.inc("search_pruned_total", no_volume, engine="dfs", reason="no_volume")
+            METRICS.inc("search_pruned_total", repeat_trades, engine="dfs", reason="repeats")
 
         return solutions
 
     @staticmethod
     def _synget(snapshot, exchange, from_cur, to_cur):
+        """Returns an exchange's book from one coin to another, by any of their names."""
         if exchange not in snapshot:
             return None
-
-        row = snapshot[exchange].get(from_cur) or snapshot[exchange].get(
-            RateTable.SYNONYMS.get(from_cur))
-        if not row:
-            return None
-
-        col = row.get(to_cur) or row.get(RateTable.SYNONYMS.get(to_cur))
-        return col
+        canonical = snapshot.aliases.canonical
+        return snapshot[exchange].get(canonical(from_cur, exchange), {}).get(
+            canonical(to_cur, exchange))
 
     def __str__(self):
         super(RateTable, self).__str__()
\ No newline at end of file
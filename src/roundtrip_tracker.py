@@ -0,0 +1,77 @@
+import logging
+import time
+
+from src.rate_graph import RateGraph
+from src.trade import Trade
+
+
+class RoundtripTracker:
+    """Keeps the roundtrips of a currency up to date as books in a RateTable change.
+
+    The first update runs a full search. Later updates drop the cached chains that trade on a
+    changed book and search only for chains that use at least one changed book, since every other
+    chain is priced off books that are exactly as they were. With min_profit, chains below it
+    are never cached; an unchanged chain can't become more profitable, so none are missed.
+    inventories are more (cur, amount) pairs to track alongside cur and amount, all found in the
+    same search. width is as for RateGraph: a search keeps the best chains through each coin,
+    so the cache can also hold chains that a fresh search would have crowded out.
+    """
+
+    def __init__(self, table, cur, amount, max_steps=4, exchanges=None, coins=None,
+                 min_profit=None, inventories=None, width=None):
+        self.table = table
+        self.cur = table.aliases.canonical(cur)
+        self.amount = amount
+        self.inventories = [(self.cur, amount)] + [(table.aliases.canonical(other), size)
+                                                   for other, size in inventories or ()]
+        self.max_steps = max_steps
+        self.exchanges = exchanges
+        self.coins = coins
+        self.min_profit = min_profit
+        self.width = width
+        self.version = None
+        self.chains = {}
+        self.by_book = {}
+
+    def update(self):
+        """Brings the cached roundtrips up to date and returns them by profitability."""
+        started = time.time()
+        snapshot = self.table.snapshot()
+        graph = RateGraph(snapshot, self.exchanges, self.coins, self.width)
+
+        if self.version is None:
+            self.chains.clear()
+            self.by_book.clear()
+            found = graph.inventory_roundtrips(self.inventories, self.max_steps,
+                                               min_profit=self.min_profit)
+            dirty = None
+        else:
+            dirty = snapshot.changed_since(self.version)
+            for key in dirty:
+                self._drop(key)
+            found = graph.inventory_roundtrips(self.inventories, self.max_steps, dirty,
+                                               min_profit=self.min_profit) if dirty else []
+
+        for inventory, chains in enumerate(found):
+            for chain in chains:
+                self._add(inventory, chain)
+        self.version = snapshot.version
+
+        logging.debug(f"Updated {', '.join(sorted({cur for cur, _ in self.inventories}))} "
+                      f"roundtrips with {'all' if dirty is None else len(dirty)} changed books, "
+                      f"{sum(map(len, found))} rescored in {time.time() - started:.3f}s")
+        return sorted(self.chains.values(), key=Trade.profitability, reverse=True)
+
+    def _add(self, inventory, chain):
+        # The same books can make a roundtrip for more than one inventory.
+        key = (inventory, tuple(trade.get_unique() for trade in chain))
+        self.chains[key] = chain
+        for book in key[1]:
+            self.by_book.setdefault(book, set()).add(key)
+
+    def _drop(self, book):
+        for key in self.by_book.pop(book, ()):
+            self.chains.pop(key, None)
+            for other in key[1]:
+                if other != book:
+                    self.by_book.get(other, set()).discard(key)
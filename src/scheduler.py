@@ -0,0 +1,165 @@
+import asyncio
+import logging
+import random
+import time
+
+from ccxt import ExchangeError, RequestTimeout
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0, rng=random):
+    """Returns a jittered exponential delay in seconds before retry number attempt (from 1)."""
+    return min(cap, base * 2 ** (attempt - 1)) * rng.uniform(0.5, 1.5)
+
+
+class ExchangeSchedule:
+    """Refresh state of one exchange: its hot books, request budget and failures."""
+
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self.hot = set()
+        self.next_run = 0.0
+        self.last_full = None
+        self.failures = 0
+        self.requests = 0
+
+
+class PopulateScheduler:
+    """Decides when each exchange's books are refreshed, and which of them.
+
+    An exchange may spend one request every rateLimit milliseconds, as ccxt throttles it anyway.
+    Every pair is refreshed at least every full_interval seconds. In between, the rest of the
+    budget goes to refreshing only the hot books: those in roundtrips that are profitable or close
+    to it, as last passed to mark_hot. Timeouts and exchange errors back off exponentially with
+    jitter. With a MarketIndex, full refreshes only fetch the markets a roundtrip can use.
+    """
+
+    def __init__(self, table, exchanges, blacklisted=None, full_interval=5.0, min_interval=1.0,
+                 backoff_base=1.0, backoff_cap=60.0, rng=None, clock=time.monotonic, index=None):
+        self.table = table
+        self.index = index
+        self.blacklisted = blacklisted
+        self.full_interval = full_interval
+        self.min_interval = min_interval
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.rng = rng or random.Random()
+        self.clock = clock
+        self.schedules = {exchange.name: ExchangeSchedule(exchange) for exchange in exchanges}
+        self._markets_loaded = None
+
+    def mark_hot(self, chains):
+        """Makes the books traded in these chains the ones refreshed between full refreshes."""
+        hot = {name: set() for name in self.schedules}
+        for chain in chains:
+            for trade in chain:
+                schedule = self.schedules.get(trade.exchange)
+                if schedule is None:
+                    continue
+                symbol = self._symbol(schedule.exchange, trade.from_cur, trade.next_cur)
+                if symbol:
+                    hot[trade.exchange].add(symbol)
+        for name, symbols in hot.items():
+            self.schedules[name].hot = symbols
+
+    def _symbol(self, exchange, from_cur, to_cur):
+        # Trades use canonical coin names, which the exchange may list under an alias.
+        symbols = exchange.symbols or ()
+        names = self.table.aliases.names
+        for coin1 in names(from_cur, exchange.name):
+            for coin2 in names(to_cur, exchange.name):
+                for symbol in (f"{coin1}/{coin2}", f"{coin2}/{coin1}"):
+                    if symbol in symbols:
+                        return symbol
+        return None
+
+    def cost(self, exchange, symbols=None):
+        """Returns how many requests populate makes to refresh these symbols, or every pair."""
+        pairs = exchange.symbols if symbols is None else symbols
+        if not self.table.fetches_by_book(exchange, pairs) \
+                or exchange.has.get("fetchOrderBooks", False):
+            return 1
+        return len(pairs)
+
+    def plan(self, schedule, now):
+        """Returns when the exchange refreshes next and which symbols, None meaning every pair."""
+        if schedule.last_full is None:
+            return schedule.next_run, None
+        full_at = schedule.last_full + self.full_interval
+        if not schedule.hot or now >= full_at:
+            return max(schedule.next_run, full_at), None
+        return schedule.next_run, sorted(schedule.hot)
+
+    async def load_markets(self):
+        """Loads every exchange's markets once, so the market index starts out complete."""
+        if self._markets_loaded is None:
+            self._markets_loaded = asyncio.ensure_future(self._load_markets())
+        await asyncio.shield(self._markets_loaded)
+
+    async def _load_markets(self):
+        exchanges = [schedule.exchange for schedule in self.schedules.values()]
+        results = await asyncio.gather(*[exchange.load_markets() for exchange in exchanges],
+                                       return_exceptions=True)
+        for exchange, result in zip(exchanges, results):
+            if isinstance(result, Exception):
+                logging.warning(f"{result!r} loading markets from {exchange.name}")
+            elif self.index is not None:
+                self.index.update(exchange.name, exchange.symbols)
+
+    async def run_exchange(self, exchange):
+        schedule = self.schedules[exchange.name]
+        if self.index is not None:
+            await self.load_markets()
+        while True:
+            at, _ = self.plan(schedule, self.clock())
+            await asyncio.sleep(max(0.0, at - self.clock()))
+            _, symbols = self.plan(schedule, self.clock())
+            await self.refresh(schedule, symbols)
+
+    async def refresh(self, schedule, symbols):
+        exchange = schedule.exchange
+        fetch = symbols
+        if symbols is None and self.index is not None and exchange.name in self.index.markets:
+            fetch = self.index.relevant(exchange.name)
+        started = self.clock()
+        try:
+            # One attempt per refresh: retrying is this scheduler's backoff, not populate's.
+            await self.table.populate(exchange, blacklisted=self.blacklisted, symbols=fetch,
+                                      retries=1)
+        except Exception as e:
+            # Anything else is a bug, but it shouldn't stop the exchange refreshing for good.
+            expected = isinstance(e, (TimeoutError, RequestTimeout, ExchangeError))
+            schedule.failures += 1
+            delay = backoff_delay(schedule.failures, self.backoff_base, self.backoff_cap,
+                                  self.rng)
+            logging.error(f"{e!r} refreshing {exchange.name}, failure {schedule.failures}, "
+                          f"retrying in {delay:.1f}s", exc_info=not expected)
+            schedule.next_run = self.clock() + delay
+            return
+
+        finished = self.clock()
+        if self.index is not None:
+            self.index.update(exchange.name, exchange.symbols)
+        cost = self.cost(exchange, fetch)
+        schedule.failures = 0
+        schedule.requests += cost
+        if symbols is None:
+            schedule.last_full = started
+        spacing = cost * (exchange.rateLimit or 0) / 1000
+        schedule.next_run = finished + max(self.min_interval, spacing)
+
+    def state(self):
+        """Returns each exchange's upcoming refresh, soonest first."""
+        now = self.clock()
+        queue = []
+        for name, schedule in self.schedules.items():
+            at, symbols = self.plan(schedule, now)
+            queue.append({
+                "exchange": name,
+                "next_in": max(0.0, at - now),
+                "refresh": "full" if symbols is None else "hot",
+                "hot_books": len(schedule.hot),
+                "failures": schedule.failures,
+                "requests": schedule.requests,
+                "last_full_age": None if schedule.last_full is None else now - schedule.last_full,
+            })
+        return sorted(queue, key=lambda entry: entry["next_in"])
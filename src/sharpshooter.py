@@ -1,11 +1,24 @@
 import asyncio
+import functools
 import logging
+import time
 
+import aiohttp
 import ccxt.async as ccxt
 from ccxt import RequestTimeout, ExchangeError
 
+from src.bulk_book_cache import BulkBookCache
+from src.capture import CaptureWriter
+from src.compute import ComputeExecutor, LoopLagMonitor
 from src.fast_cryptopia import FastCryptopia
+from src.http_pool import HttpPool
+from src.market_cache import MarketCache
+from src.market_index import MarketIndex
+from src.metrics import METRICS
+from src.parallel_search import ParallelSearch
 from src.rate_table import RateTable
+from src.roundtrip_tracker import RoundtripTracker
+from src.scheduler import PopulateScheduler
 from src.trade import Trade
 
 BLACKLISTED = set([
@@ -27,65 +40,215 @@ BLACKLISTED = set([
 
 
 class Sharpshooter:
+    """Watches exchanges' books and reports roundtrips that pay at least the arbitrage threshold.
+
+    Roundtrip searches are approximate, as RateGraph's are: they keep at most width partial
+    chains into each coin at each step, so they don't find every chain. Partial chains that can
+    still pay the watch threshold are never crowded out, though, so every chain that does is
+    reported. A width of None uses RateGraph.WIDTH.
+    """
     def __init__(self, exchanges, starting_currency, blacklisted=None,
-                 arbitrage_threshold_pcent=0.025):
+                 arbitrage_threshold_pcent=0.025, feeds=None, search_workers=None,
+                 watch_margin_pcent=0.01, metrics_port=None, metrics_dump=None,
+                 capture=None, compute_workers=2, lag_threshold=0.1, market_cache=None,
+                 market_ttl=3600, limit_per_host=8, inventories=None, width=None):
         self.blacklisted = blacklisted or BLACKLISTED
         self.exchange_rates = RateTable()
         self.exchanges = exchanges
+        # Every exchange's requests share these connections, and identical ones share a request.
+        self.http = HttpPool(limit_per_host=limit_per_host)
+        for exchange in exchanges:
+            self.http.attach(exchange)
+        self.feeds = feeds or {}
         self.starting_currency = starting_currency
+        # More (currency, amount) balances whose roundtrips are searched along with it.
+        self.inventories = [tuple(starting_currency)]
+        self.inventories += [tuple(other) for other in inventories or ()]
         self.arbitrage_threshold = arbitrage_threshold_pcent
+        # Roundtrips within this margin below the threshold are tracked so their books stay hot.
+        self.watch_threshold = arbitrage_threshold_pcent - watch_margin_pcent
+        self.max_steps = 3
+        self.width = width
+        currency, amount = starting_currency
+        self.roundtrips = RoundtripTracker(self.exchange_rates, currency, amount,
+                                           max_steps=self.max_steps,
+                                           min_profit=self.watch_threshold,
+                                           inventories=self.inventories[1:], width=width)
+        # Book conversion and searches run here, so the event loop only waits on the network.
+        self.compute = ComputeExecutor(compute_workers)
+        self.exchange_rates.compute = self.compute
+        self.search = ParallelSearch(search_workers, compute=self.compute) \
+            if search_workers else None
+        self.lag_monitor = LoopLagMonitor(threshold=lag_threshold)
+        self.metrics_port = metrics_port
+        self.metrics_dump = metrics_dump
+        # Path of a capture file recording every book stored, for replaying offline.
+        self.capture = capture
+        # Markets are loaded from this file at startup and refreshed into it in the background.
+        self.market_cache = MarketCache(market_cache, ttl=market_ttl) if market_cache else None
+        if metrics_port or metrics_dump:
+            METRICS.enabled = True
+            METRICS.add_callback(self.record_staleness)
+        self.scheduler = PopulateScheduler(self.exchange_rates, exchanges,
+                                           blacklisted=self.blacklisted,
+                                           index=MarketIndex(currency, self.max_steps,
+                                                             currencies=self.currencies()))
 
     def run_forever(self):
         loop = asyncio.get_event_loop()
+        if self.capture:
+            self.exchange_rates.recorder = CaptureWriter(self.capture)
+        if self.market_cache is not None:
+            self.prime_markets()
+            asyncio.ensure_future(self.market_cache.refresh_forever(self.exchanges,
+                                                                    self.markets_refreshed))
         for exchange in self.exchanges:
-            asyncio.ensure_future(self.populate_task(exchange))
+            if isinstance(exchange, BulkBookCache):
+                exchange.start_refreshing()
+            feed = self.feeds.get(exchange.name)
+            if feed is not None:
+                asyncio.ensure_future(self.stream_task(exchange, feed))
+            else:
+                asyncio.ensure_future(self.scheduler.run_exchange(exchange))
         asyncio.ensure_future(self.print_complex_arbs_task())
-        loop.run_forever()
+        asyncio.ensure_future(self.lag_monitor.run())
+        if self.metrics_port:
+            loop.run_until_complete(METRICS.serve(port=self.metrics_port))
+        if self.metrics_dump:
+            asyncio.ensure_future(METRICS.dump_periodically(self.metrics_dump))
+        try:
+            loop.run_forever()
+        finally:
+            self.close()
+
+    def close(self):
+        """Closes the shared HTTP session, the compute threads, search workers and capture."""
+        self.compute.close()
+        if self.search:
+            self.search.close()
+        asyncio.get_event_loop().run_until_complete(self.http.close())
+        if self.exchange_rates.recorder is not None:
+            self.exchange_rates.recorder.close()
+
+    def prime_markets(self):
+        primed = [exchange.name for exchange in self.exchanges
+                  if self.market_cache.prime(exchange)]
+        if primed:
+            logging.info(f"Loaded cached markets of {', '.join(sorted(primed))}")
+
+    def markets_refreshed(self, exchange):
+        self.exchange_rates.load_fees(exchange)
+        if self.scheduler.index is not None:
+            self.scheduler.index.update(exchange.name, exchange.symbols)
 
     def run_once(self):
-        populate = asyncio.ensure_future(
-            asyncio.gather(*[self.exchange_rates.populate(exchange, blacklisted=self.blacklisted)
-                             for exchange in self.exchanges]))
-        asyncio.get_event_loop().run_until_complete(populate)
-        return list(self.complex_arbs())
+        try:
+            if self.market_cache is not None:
+                self.prime_markets()
+            populate = asyncio.ensure_future(asyncio.gather(*[
+                self.exchange_rates.populate(exchange, blacklisted=self.blacklisted)
+                for exchange in self.exchanges]))
+            asyncio.get_event_loop().run_until_complete(populate)
+            if self.market_cache is not None:
+                for exchange in self.exchanges:
+                    if exchange.markets and self.market_cache.stale(exchange.name):
+                        self.market_cache.store(exchange)
+            return list(self.complex_arbs())
+        finally:
+            self.close()
 
     def simple_arbs(self, from_cur, to_cur):
         return self.exchange_rates.pairwise_diffs(from_cur, to_cur)
 
+    def currencies(self):
+        return [currency for currency, _ in self.inventories]
+
     def complex_arbs(self):
-        currency, amount = self.starting_currency
-        logging.debug(f"Checking {currency} roundtrips...")
-        roundtrips = self.exchange_rates.best_roundtrips(currency, amount, max_steps=3)
+        logging.debug(f"Checking {', '.join(self.currencies())} roundtrips...")
+        roundtrips = self.roundtrips.update()
+        self.scheduler.mark_hot(roundtrips)
+        return self._profitable(roundtrips)
+
+    async def complex_arbs_async(self):
+        """Like complex_arbs, but searches in worker processes off the event loop.
+
+        Every inventory is searched at once, over one copy of the snapshot shared with the
+        workers.
+        """
+        logging.debug(f"Checking {', '.join(self.currencies())} roundtrips "
+                      f"in {self.search.workers} processes...")
+        results = await self.search.inventory_roundtrips_async(
+            self.exchange_rates.snapshot(), self.inventories, max_steps=self.max_steps,
+            min_profit=self.watch_threshold, width=self.width)
+        roundtrips = [chain for chains in results for chain in chains]
+        self.scheduler.mark_hot(roundtrips)
+        return list(self._profitable(roundtrips))
+
+    def _profitable(self, roundtrips):
         roundtrips = sorted(roundtrips, key=Trade.num_exchanges)
 
-        profitable = 0
+        canonical = self.exchange_rates.aliases.canonical
+        profitable = {canonical(currency): 0 for currency in self.currencies()}
         for index, best_conversion in enumerate(roundtrips):
             profit = Trade.profitability(best_conversion)
             if profit < self.arbitrage_threshold:
                 continue
 
-            profitable += 1
+            currency = best_conversion[0].from_cur
+            profitable[currency] = profitable.get(currency, 0) + 1
             yield (best_conversion, profit)
 
-        logging.debug(f"Found {len(roundtrips)} {currency} roundtrips, "
-                      f"{profitable} above the profit threshold")
+        for currency, count in profitable.items():
+            METRICS.set("opportunities", count, currency=currency)
+            METRICS.inc("opportunities_total", count, currency=currency)
+        logging.debug(f"Found {len(roundtrips)} {', '.join(profitable)} roundtrips near the "
+                      f"threshold, {sum(profitable.values())} above the profit threshold")
+
+    def record_staleness(self, metrics):
+        now = time.time()
+        for exchange, updated_at in self.exchange_rates.updated_at.items():
+            metrics.set("book_age_seconds", now - updated_at, exchange=exchange)
 
     @staticmethod
     def print_arbs(arbs):
         for best_conversion, profit in arbs:
             print(f"{best_conversion} for {profit * 100}% profit")
 
-    async def print_complex_arbs_task(self):
+    async def search_once(self):
+        """Searches off the event loop and prints the arbs, unless the last search is running.
+
+        Returns the arbs found, or None if this round was skipped.
+        """
+        if self.search:
+            search = self.complex_arbs_async
+        else:
+            search = functools.partial(self.compute.run, lambda: list(self.complex_arbs()))
+        try:
+            arbs = await self.compute.exclusive("search", search)
+        except Exception as e:
+            logging.exception(f"Search failed: {e!r}")
+            return None
+        if arbs is not None:
+            self.print_arbs(arbs)
+        return arbs
+
+    async def print_complex_arbs_task(self, interval=1):
+        # Searches start on a fixed beat; one that overruns makes the next beats skip, not queue.
         while True:
-            self.print_arbs(self.complex_arbs())
-            await asyncio.sleep(1)
+            asyncio.ensure_future(self.search_once())
+            await asyncio.sleep(interval)
 
-    async def populate_task(self, exchange):
+    async def stream_task(self, exchange, feed):
         while True:
             try:
-                await self.exchange_rates.populate(exchange, blacklisted=self.blacklisted)
-            except (TimeoutError, RequestTimeout, ExchangeError) as e:
+                await exchange.load_markets()
+                self.exchange_rates.load_fees(exchange)
+                await self.exchange_rates.stream(exchange.name, feed, exchange.symbols,
+                                                 blacklisted=self.blacklisted)
+            except (TimeoutError, RequestTimeout, ExchangeError, aiohttp.ClientError) as e:
                 logging.error(e)
+            finally:
+                await feed.close()
             await asyncio.sleep(5)
 
 
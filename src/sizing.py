@@ -0,0 +1,108 @@
+import math
+from collections import namedtuple
+
+from src.trade import Chain, Trade
+
+# A roundtrip repriced at the amount that makes it the most, and how much that is.
+Sized = namedtuple("Sized", ["chain", "size", "profit"])
+
+
+def _withdrawals(chain, snapshot):
+    fees = []
+    held_on = None
+    for trade in chain:
+        fees.append(snapshot.withdrawal(trade.from_cur, held_on, trade.exchange))
+        held_on = trade.exchange
+    return fees
+
+
+def optimal_size(chain, snapshot, max_amount=None):
+    """Returns the Sized chain that makes the most absolute profit, or None if no size profits.
+
+    Each book turns its input into output along a piecewise-linear curve: one rate per level,
+    net of the taker fee, until that level's volume is used up. Composing the curves for every
+    hop gives the chain's curve, whose slope at any size is the product of the rates each hop is
+    filling at. Starting from nothing, the size grows to the next level boundary of any hop at a
+    time, until the slope drops to 1 and more size only loses money, a book runs out or
+    max_amount is reached, so every level is visited at most once.
+    Withdrawal fees are flat amounts lost before a hop, so the first units through each transfer
+    buy nothing; the walk carries on through them and keeps the best size it saw.
+    A chain that still pays on levels of unlimited volume, like the tickers populate stores,
+    has no best size without max_amount: it comes back as is, with infinite size and profit.
+    """
+    books = [snapshot[trade.exchange][trade.from_cur][trade.next_cur] for trade in chain]
+    rates = [book.prices * (1 - book.fee) for book in books]
+    volumes = [book.volumes for book in books]
+    dead = _withdrawals(chain, snapshot)
+    level = [0] * len(books)
+    used = [0.0] * len(books)
+
+    size = output = 0.0
+    best_size = best_profit = 0.0
+    while max_amount is None or size < max_amount:
+        # Slope of each hop's input per unit of size, and how far size can grow before some
+        # hop moves to its next level or finishes paying for a withdrawal.
+        slope = 1.0
+        step = math.inf
+        feeding = []
+        exhausted = False
+        for hop in range(len(books)):
+            feeding.append(slope)
+            if dead[hop] > 0:
+                step = min(step, dead[hop] / slope)
+                slope = 0.0
+                break
+            if level[hop] >= len(rates[hop]):
+                exhausted = True
+                break
+            step = min(step, (volumes[hop][level[hop]] - used[hop]) / slope)
+            slope *= rates[hop][level[hop]]
+
+        paying = any(fee > 0 for fee in dead)
+        if exhausted or (slope <= 1 and not paying):
+            break
+        if max_amount is not None:
+            step = min(step, max_amount - size)
+        if math.isinf(step):
+            # Unlimited depth at a profit: only max_amount could bound the size.
+            return Sized(chain, math.inf, math.inf)
+
+        for hop, feed in enumerate(feeding):
+            amount = feed * step
+            if dead[hop] > 0:
+                dead[hop] = 0.0 if amount >= dead[hop] * (1 - 1e-12) else dead[hop] - amount
+                break
+            remaining = volumes[hop][level[hop]] - used[hop]
+            if amount >= remaining * (1 - 1e-12):
+                level[hop] += 1
+                used[hop] = 0.0
+            else:
+                used[hop] += amount
+        size += step
+        output += slope * step
+        if output - size > best_profit:
+            best_size, best_profit = size, output - size
+
+    if best_profit <= 0:
+        return None
+    sized = reprice(chain, snapshot, best_size)
+    if sized is None:
+        return None
+    return Sized(sized, best_size, sized.value * best_size - best_size)
+
+
+def reprice(chain, snapshot, amount):
+    """Returns the chain's trades priced again from amount, or None if a book can't fill them."""
+    repriced = Chain()
+    held_on = None
+    for trade in chain:
+        book = snapshot[trade.exchange][trade.from_cur][trade.next_cur]
+        value, limit, next_amount = snapshot.price_trade(book, amount, trade.from_cur, held_on,
+                                                         trade.exchange)
+        if not value:
+            return None
+        repriced = repriced.then(
+            Trade(trade.exchange, trade.from_cur, trade.next_cur, next_amount, limit, value))
+        amount = next_amount
+        held_on = trade.exchange
+    return repriced
@@ -0,0 +1,85 @@
+import io
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from src import backtest
+from src.backtest import OHLC, RunningMaxima
+
+
+def random_bars(seed, bars=3000):
+    rng = np.random.default_rng(seed)
+    opens = 10000 * np.exp(np.cumsum(rng.normal(0, 0.002, bars)))
+    highs = opens * (1 + rng.uniform(0, 0.004, bars))
+    lows = opens * (1 - rng.uniform(0, 0.004, bars))
+    closes = rng.uniform(lows, highs)
+    return OHLC(1500000000 + 60 * np.arange(bars), opens, highs, lows, closes)
+
+
+def reference(ohlc, window, target, funds):
+    """The original per-bar loop."""
+    average = backtest.sma(ohlc.opens, window)
+    position = None
+    trades = 0
+    for tick, price in enumerate(ohlc.opens):
+        if average[tick] >= price and funds > 0 and position is None:
+            position = (funds / price, price)
+            funds = 0
+        elif position and ohlc.highs[tick] > position[1] + target / position[0]:
+            funds += position[0] * ohlc.highs[tick]
+            position = None
+            trades += 1
+    if position:
+        funds += position[0] * ohlc.closes[-1]
+    return funds, trades
+
+
+class BacktestTest(unittest.TestCase):
+    def test_batched_run_matches_the_bar_loop(self):
+        for seed in range(3):
+            ohlc = random_bars(seed)
+            result = backtest.sweep(ohlc, [1, 5, 10, 40], [20, 100, 500], [1000, 10000])
+            for window, target, funds, final, trades in zip(*result):
+                expected = reference(ohlc, window, target, funds)
+                self.assertAlmostEqual(expected[0], final, places=6)
+                self.assertEqual(expected[1], trades)
+
+    def test_fills_describe_the_trades(self):
+        ohlc = random_bars(4, bars=500)
+        fills = []
+        final, trades = backtest.run(ohlc, [10], [100], [10000], fills)
+        sides = [fill.side for _, fill in fills]
+        self.assertEqual(["buy", "sell"] * trades[0], sides[:2 * trades[0]])
+        for (_, buy), (_, sell) in zip(fills[::2], fills[1::2]):
+            self.assertLess(buy.tick, sell.tick)
+            self.assertGreater(sell.price * sell.qty - buy.price * buy.qty, 100 - 1e-6)
+
+    def test_running_maxima(self):
+        rng = np.random.default_rng(5)
+        values = rng.uniform(0, 1, 1000)
+        maxima = RunningMaxima(values, block=16)
+        starts = rng.integers(0, 1100, 300)
+        thresholds = rng.uniform(0.9, 1.0, 300)
+        expected = []
+        for start, threshold in zip(starts, thresholds):
+            hits = np.flatnonzero(values[start:] > threshold)
+            expected.append(start + hits[0] if len(hits) else 1000)
+        self.assertEqual(expected, maxima.first_above(starts, thresholds).tolist())
+
+    def test_binary_bars_and_process_pool(self):
+        ohlc = random_bars(6, bars=800)
+        csv = io.StringIO("\n".join(",".join(str(value) for value in row)
+                                    for row in zip(*ohlc)))
+        loaded = backtest.load_csv(csv)
+        np.testing.assert_array_equal(ohlc.timestamps, loaded.timestamps)
+        np.testing.assert_allclose(ohlc.highs, loaded.highs)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "bars.npy")
+            backtest.save_binary(loaded, path)
+            serial = backtest.sweep(loaded, [5, 10, 20], [50, 100], [10000])
+            pooled = backtest.sweep(path, [5, 10, 20], [50, 100], [10000], workers=2)
+        np.testing.assert_array_equal(serial.final, pooled.final)
+        np.testing.assert_array_equal(serial.trades, pooled.trades)
@@ -0,0 +1,93 @@
+import asyncio
+import unittest
+
+from src.book_feed import L2Book, WebSocketFeed
+from src.rate_table import RateTable
+from src.test.mock_feed import MockFeedServer
+
+
+def snapshot(symbol, sequence, bids, asks):
+    return {"type": "snapshot", "symbol": symbol, "sequence": sequence, "bids": bids, "asks": asks}
+
+
+def diff(symbol, sequence, bids=(), asks=()):
+    return {"type": "diff", "symbol": symbol, "sequence": sequence,
+            "bids": list(bids), "asks": list(asks)}
+
+
+class BookFeedTest(unittest.TestCase):
+    def setUp(self):
+        super(BookFeedTest, self).setUp()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        super(BookFeedTest, self).tearDown()
+
+    def stream(self, table, server, symbols):
+        async def run():
+            await server.start()
+            feed = WebSocketFeed(server.url)
+            try:
+                await table.stream("Mock", feed, symbols)
+            finally:
+                await feed.close()
+                await server.stop()
+        self.loop.run_until_complete(asyncio.wait_for(run(), 10))
+
+    def test_l2_book_applies_diffs_in_sequence(self):
+        book = L2Book()
+        self.assertFalse(book.apply(diff("ETH/USD", 1, bids=[[700, 1]])))
+        self.assertTrue(book.apply(snapshot("ETH/USD", 5, [[750, 2], [740, 1]], [[760, 3]])))
+        self.assertTrue(book.apply(diff("ETH/USD", 6, bids=[[740, 0], [745, 4]], asks=[[755, 1]])))
+        self.assertTrue(book.apply(diff("ETH/USD", 4, bids=[[999, 1]])))
+        self.assertEqual(([[750, 2], [745, 4]], [[755, 1], [760, 3]]), book.orders())
+        self.assertFalse(book.apply(diff("ETH/USD", 8, bids=[[1, 1]])))
+        self.assertEqual(6, book.sequence)
+
+    def test_stream_applies_diffs(self):
+        table = RateTable()
+        server = MockFeedServer([
+            snapshot("ETH/USD", 1, [[750, 2]], [[760, 3]]),
+            snapshot("LTC/USD", 1, [[100, 2]], [[110, 3]]),
+            diff("ETH/USD", 2, bids=[[755, 1]]),
+            diff("ETH/USD", 3, bids=[[750, 0]], asks=[[758, 1]]),
+        ])
+        self.stream(table, server, ["ETH/USD"])
+        self.assertEqual([(755, 1)], list(table["Mock"]["ETH"]["USD"]))
+        self.assertEqual((1 / 758, 758), table["Mock"]["USD"]["ETH"][0])
+        self.assertNotIn("LTC", table["Mock"])
+        self.assertEqual([{"op": "subscribe", "symbols": ["ETH/USD"]}], server.requests)
+
+    def test_stream_resnapshots_after_gap(self):
+        table = RateTable()
+        server = MockFeedServer([
+            snapshot("ETH/USD", 1, [[750, 2]], [[760, 3]]),
+            diff("ETH/USD", 2, bids=[[751, 1]]),
+            diff("ETH/USD", 4, bids=[[900, 1]]),
+            diff("ETH/USD", 5, bids=[[901, 1]]),
+        ], snapshots={"ETH/USD": snapshot("ETH/USD", 5, [[752, 2]], [[762, 3]])})
+        self.stream(table, server, ["ETH/USD"])
+        self.assertEqual([{"op": "subscribe", "symbols": ["ETH/USD"]},
+                          {"op": "snapshot", "symbol": "ETH/USD"}], server.requests)
+        self.assertEqual([(752, 2)], list(table["Mock"]["ETH"]["USD"]))
+
+    def test_emptied_side_leaves_the_table(self):
+        table = RateTable()
+        server = MockFeedServer([
+            snapshot("ETH/USD", 1, [[750, 2]], [[760, 3]]),
+            diff("ETH/USD", 2, asks=[[760, 0]]),
+        ])
+        self.stream(table, server, ["ETH/USD"])
+        self.assertNotIn("ETH", table["Mock"]["USD"])
+        self.assertNotIn("USD", table["Mock"]["ETH"])
+
+    def test_gapped_book_leaves_the_table(self):
+        table = RateTable()
+        server = MockFeedServer([
+            snapshot("ETH/USD", 1, [[750, 2]], [[760, 3]]),
+            diff("ETH/USD", 3, bids=[[900, 1]]),
+        ])
+        self.stream(table, server, ["ETH/USD"])
+        self.assertNotIn("USD", table["Mock"]["ETH"])
+        self.assertEqual({("Mock", "ETH", "USD"), ("Mock", "USD", "ETH")}, table.changed_since(1))
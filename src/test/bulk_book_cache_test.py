@@ -0,0 +1,89 @@
+import asyncio
+import unittest
+
+from src.bulk_book_cache import BulkBookCache
+
+
+class BulkExchange:
+    def __init__(self):
+        self.fetches = 0
+        self.fail = False
+
+    async def fetch_order_books(self, params):
+        self.fetches += 1
+        fetch = self.fetches
+        await asyncio.sleep(0.01)
+        if self.fail:
+            raise TimeoutError("Bulk fetch timed out")
+        return {"ETH/BTC": {"generation": fetch}}
+
+
+class CachedBulkExchange(BulkBookCache, BulkExchange):
+    REFRESH_SECONDS = 0.05
+
+
+class BulkBookCacheTest(unittest.TestCase):
+    def setUp(self):
+        super(BulkBookCacheTest, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        self.exchange = CachedBulkExchange()
+
+    def tearDown(self):
+        self.exchange.stop_refreshing()
+        self.loop.close()
+        super(BulkBookCacheTest, self).tearDown()
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_concurrent_callers_share_one_fetch(self):
+        async def scenario():
+            return await asyncio.gather(*[self.exchange.cached_order_books() for _ in range(10)])
+
+        books = self.run_async(scenario())
+        self.assertEqual(1, self.exchange.fetches)
+        self.assertTrue(all(book is books[0] for book in books))
+        self.assertIsNotNone(self.exchange.book_timestamp("ETH/BTC"))
+        self.assertIsNone(self.exchange.book_timestamp("LTC/BTC"))
+
+    def test_serves_stale_books_while_refreshing(self):
+        async def scenario():
+            first = await self.exchange.cached_order_books()
+            stamp = self.exchange.book_timestamp("ETH/BTC")
+            await asyncio.sleep(0.06)
+            stale = await self.exchange.cached_order_books()
+            again = await self.exchange.cached_order_books()
+            await self.exchange.refresh_order_books()
+            fresh = await self.exchange.cached_order_books()
+            return first, stale, again, fresh, stamp
+
+        first, stale, again, fresh, stamp = self.run_async(scenario())
+        self.assertIs(first, stale)
+        self.assertIs(first, again)
+        self.assertEqual(2, fresh["ETH/BTC"]["generation"])
+        self.assertEqual(2, self.exchange.fetches)
+        self.assertGreater(self.exchange.book_timestamp("ETH/BTC"), stamp)
+
+    def test_failed_refresh_keeps_previous_generation(self):
+        async def scenario():
+            first = await self.exchange.cached_order_books()
+            self.exchange.fail = True
+            kept = await self.exchange.refresh_order_books()
+            return first, kept
+
+        first, kept = self.run_async(scenario())
+        self.assertIs(first, kept)
+
+    def test_first_fetch_failure_raises(self):
+        self.exchange.fail = True
+        with self.assertRaises(TimeoutError):
+            self.run_async(self.exchange.cached_order_books())
+
+    def test_background_refresh(self):
+        async def scenario():
+            self.exchange.start_refreshing()
+            await asyncio.sleep(0.2)
+            self.exchange.stop_refreshing()
+
+        self.run_async(scenario())
+        self.assertGreaterEqual(self.exchange.fetches, 3)
@@ -0,0 +1,126 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from src.bench.market import generate_market, load_table
+from src.capture import CaptureReader, CaptureWriter, load, replay
+from src.rate_table import RateTable
+
+
+class CaptureTest(unittest.TestCase):
+    def setUp(self):
+        super(CaptureTest, self).setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "capture.bin")
+
+    def tearDown(self):
+        self.directory.cleanup()
+        super(CaptureTest, self).tearDown()
+
+    def record(self, table, *calls):
+        with CaptureWriter(self.path) as writer:
+            table.recorder = writer
+            for exchange_name, books in calls:
+                table.set_books(exchange_name, books)
+        table.recorder = None
+
+    def test_replay_rebuilds_the_table(self):
+        market = generate_market(seed=5, coins=8, exchanges=2, cycles=2)
+        original = RateTable()
+        with CaptureWriter(self.path) as writer:
+            original.recorder = writer
+            load_table(original, market)
+            original.remove_book("Exchange0", "C1/C0")
+        original.recorder = None
+
+        replayed = RateTable()
+        self.assertEqual(3, load(self.path, replayed))
+        self.assertEqual(original.version, replayed.version)
+        self.assertNotIn("C1", replayed["Exchange0"]["C0"])
+        expected = original.best_roundtrips("C0", 0.01, max_steps=3)
+        actual = replayed.best_roundtrips("C0", 0.01, max_steps=3)
+        self.assertEqual([list(chain) for chain in expected], [list(chain) for chain in actual])
+
+    def test_replay_keeps_fees(self):
+        original = RateTable()
+        with CaptureWriter(self.path) as writer:
+            original.recorder = writer
+            original.set_fees("A", {"ETH/BTC": 0.002}, {"ETH": 0.01})
+            original.set_book("A", "ETH/BTC", [(0.05, 10)], [(0.05, 10)])
+            original.set_book("B", "ETH/BTC", [(0.06, 10)], [(0.06, 10)])
+            original.set_fees("B", {"ETH/BTC": 0.003})
+            original.set_book("B", "ETH/BTC", [(0.06, 20)], [(0.06, 20)])
+        original.recorder = None
+
+        fees = [payload for kind, payload in CaptureReader(self.path).records() if kind == 2]
+        self.assertEqual([("A", {"ETH/BTC": 0.002}, {"ETH": 0.01}),
+                          ("B", {"ETH/BTC": 0.003}, None)],
+                         [payload[1:] for payload in fees])
+
+        replayed = RateTable()
+        self.assertEqual(3, load(self.path, replayed))
+        self.assertEqual(original.taker_fees, replayed.taker_fees)
+        self.assertEqual(original.withdraw_fees, replayed.withdraw_fees)
+        expected = original.best_roundtrips("BTC", 0.1, max_steps=2)
+        actual = replayed.best_roundtrips("BTC", 0.1, max_steps=2)
+        self.assertEqual([list(chain) for chain in expected], [list(chain) for chain in actual])
+
+    def test_records_keep_levels_and_names(self):
+        self.record(RateTable(),
+                    ("A", {"ETH/BTC": ([[0.05, 2, 123]], [[0.06, 1], [0.07, 3]])}),
+                    ("B", {"ETH/BTC": ([], [[0.06, 1]]), "LTC/BTC": None}))
+        records = list(CaptureReader(self.path))
+        self.assertEqual(["A", "B"], [exchange for _, exchange, _ in records])
+        bids, asks = records[0][2]["ETH/BTC"]
+        self.assertEqual([[0.05, 2]], bids.tolist())
+        self.assertEqual([[0.06, 1], [0.07, 3]], asks.tolist())
+        self.assertEqual([], records[1][2]["ETH/BTC"][0].tolist())
+        self.assertIsNone(records[1][2]["LTC/BTC"])
+
+    def test_appends_reuse_names(self):
+        self.record(RateTable(), ("A", {"ETH/BTC": ([[0.05, 2]], [[0.06, 1]])}))
+        size = os.path.getsize(self.path)
+        self.record(RateTable(), ("A", {"ETH/BTC": ([[0.05, 2]], [[0.06, 1]])}))
+        self.assertEqual(2, len(list(CaptureReader(self.path))))
+        names = [kind for kind, _ in CaptureReader(self.path).raw() if kind == 0]
+        self.assertEqual(2, len(names))
+        self.assertLess(os.path.getsize(self.path) - size, size)
+
+    def test_truncated_record_ends_the_capture(self):
+        self.record(RateTable(), ("A", {"ETH/BTC": ([[0.05, 2]], [[0.06, 1]])}),
+                    ("A", {"ETH/BTC": ([[0.05, 3]], [[0.06, 1]])}))
+        with open(self.path, "r+b") as capture:
+            capture.truncate(os.path.getsize(self.path) - 5)
+        self.assertEqual(1, len(list(CaptureReader(self.path))))
+
+    def test_replay_keeps_scaled_spacing(self):
+        with CaptureWriter(self.path) as writer:
+            writer.record("A", {"ETH/BTC": ([[0.05, 2]], [[0.06, 1]])}, at=100.0)
+            writer.record("A", {"ETH/BTC": ([[0.05, 3]], [[0.06, 1]])}, at=110.0)
+        delays = []
+        seen = []
+
+        async def sleep(delay):
+            delays.append(delay)
+
+        loop = asyncio.new_event_loop()
+        table = RateTable()
+        try:
+            count = loop.run_until_complete(replay(
+                self.path, table, speed=100, sleep=sleep,
+                on_record=lambda table, at: seen.append((at, table.version))))
+        finally:
+            loop.close()
+        self.assertEqual(2, count)
+        self.assertEqual([(100.0, 1), (110.0, 2)], seen)
+        self.assertEqual(1, len(delays))
+        self.assertAlmostEqual(0.1, delays[0], places=2)
+
+    def test_snapshots_do_not_record(self):
+        table = RateTable()
+        table.recorder = CaptureWriter(self.path)
+        try:
+            self.assertIsNone(table.snapshot().recorder)
+        finally:
+            table.recorder.close()
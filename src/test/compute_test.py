@@ -0,0 +1,101 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from src.compute import ComputeExecutor, LoopLagMonitor
+from src.rate_table import RateTable
+
+
+class BookExchange:
+    def __init__(self, name, books):
+        self.name = name
+        self.books = books
+        self.symbols = list(books)
+        self.markets = {symbol: {} for symbol in books}
+        self.fees = {}
+        self.has = {}
+        self.hasFetchTickers = False
+
+    async def load_markets(self):
+        return self.markets
+
+    async def fetch_l2_order_book(self, symbol):
+        bids, asks = self.books[symbol]
+        return {"bids": bids, "asks": asks}
+
+
+class ComputeTest(unittest.TestCase):
+    def setUp(self):
+        super(ComputeTest, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.compute = ComputeExecutor(workers=2)
+
+    def tearDown(self):
+        self.compute.close()
+        self.loop.close()
+        super(ComputeTest, self).tearDown()
+
+    def test_runs_off_the_loop_thread(self):
+        thread = self.loop.run_until_complete(self.compute.run(threading.current_thread))
+        self.assertIsNot(threading.current_thread(), thread)
+
+    def test_exclusive_skips_or_coalesces(self):
+        release = threading.Event()
+        calls = []
+
+        def work():
+            calls.append(1)
+            release.wait(5)
+            return len(calls)
+
+        async def scenario():
+            first = asyncio.ensure_future(
+                self.compute.exclusive("search", lambda: self.compute.run(work)))
+            await asyncio.sleep(0.01)
+            self.assertTrue(self.compute.busy("search"))
+            skipped = await self.compute.exclusive("search", lambda: self.compute.run(work))
+            joined = asyncio.ensure_future(self.compute.exclusive(
+                "search", lambda: self.compute.run(work), coalesce=True))
+            await asyncio.sleep(0.01)
+            release.set()
+            return await first, skipped, await joined
+
+        self.assertEqual((1, None, 1), self.loop.run_until_complete(scenario()))
+        self.assertEqual(1, len(calls))
+        self.assertFalse(self.compute.busy("search"))
+        self.assertEqual(2, self.loop.run_until_complete(
+            self.compute.exclusive("search", lambda: self.compute.run(work))))
+
+    def test_populate_stores_books_in_the_pool(self):
+        table = RateTable()
+        table.compute = self.compute
+        threads = []
+        store = table._store_books
+
+        def recording(*args):
+            threads.append(threading.current_thread())
+            return store(*args)
+
+        table._store_books = recording
+        exchange = BookExchange("Mock", {"ETH/BTC": ([(0.05, 1)], [(0.06, 1)])})
+        self.loop.run_until_complete(table.populate(exchange))
+        self.assertEqual([(0.05, 1)], list(table["Mock"]["ETH"]["BTC"]))
+        self.assertEqual(1, len(threads))
+        self.assertIsNot(threading.current_thread(), threads[0])
+
+    def test_lag_monitor_reports_stalls(self):
+        monitor = LoopLagMonitor(interval=0.01, threshold=0.05)
+
+        async def stall():
+            task = asyncio.ensure_future(monitor.run())
+            await asyncio.sleep(0.02)
+            time.sleep(0.1)
+            await asyncio.sleep(0.03)
+            task.cancel()
+
+        with self.assertLogs(level="WARNING"):
+            self.loop.run_until_complete(stall())
+        self.assertEqual(1, monitor.stalls)
+        self.assertGreaterEqual(monitor.worst, 0.08)
@@ -0,0 +1,75 @@
+import asyncio
+import unittest
+
+from src.fast_cryptopia import FastCryptopia
+
+
+class StubbedCryptopia(FastCryptopia):
+    """Answers Cryptopia's bulk book endpoint from memory, counting requests and parses."""
+    CHUNK_SIZE = 2
+
+    def __init__(self, *args, **kwargs):
+        super(StubbedCryptopia, self).__init__(*args, **kwargs)
+        self.requests = []
+        self.parses = 0
+        self.price = 0.05
+
+    async def load_markets(self, reload=False):
+        self.symbols = ["ETH/BTC", "LTC/BTC", "XMR/BTC"]
+        return {}
+
+    async def publicGetMarketOrderGroupsIdsCount(self, params={}):
+        self.requests.append(params["ids"])
+        return {"Data": [{
+            "Market": market,
+            "Buy": [{"Label": market, "Price": self.price, "Volume": 2.0}],
+            "Sell": [{"Label": market, "Price": 0.1, "Volume": 3.0}],
+        } for market in params["ids"].split("-")]}
+
+    def parse_order_book(self, *args, **kwargs):
+        self.parses += 1
+        return super(StubbedCryptopia, self).parse_order_book(*args, **kwargs)
+
+
+class FastCryptopiaTest(unittest.TestCase):
+    def setUp(self):
+        super(FastCryptopiaTest, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        self.exchange = StubbedCryptopia()
+
+    def tearDown(self):
+        self.loop.close()
+        super(FastCryptopiaTest, self).tearDown()
+
+    def run_async(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_fetches_books_in_chunks(self):
+        books = self.run_async(self.exchange.fetch_order_books({}))
+        self.assertEqual(["ETH_BTC-LTC_BTC", "XMR_BTC"], self.exchange.requests)
+        self.assertEqual(["ETH/BTC", "LTC/BTC", "XMR/BTC"], sorted(books))
+        self.assertEqual("ETH_BTC", books["ETH/BTC"]["Market"])
+
+    def test_parses_each_book_once_per_generation(self):
+        first = self.run_async(self.exchange.fetch_order_book("ETH/BTC"))
+        again = self.run_async(self.exchange.fetch_order_book("ETH/BTC"))
+        self.assertIs(first, again)
+        self.assertEqual(1, self.exchange.parses)
+        self.assertEqual([[0.05, 2.0]], first["bids"])
+        self.assertEqual([[0.1, 3.0]], first["asks"])
+        # The cached raw book is left as fetched.
+        raw = self.exchange._order_books["ETH/BTC"]
+        self.assertEqual("ETH_BTC", raw["Buy"][0]["Label"])
+
+        async def refetch():
+            await self.exchange.refresh_order_books()
+            return await self.exchange.fetch_order_book("ETH/BTC")
+
+        self.exchange.price = 0.06
+        fresh = self.run_async(refetch())
+        self.assertEqual(2, self.exchange.parses)
+        self.assertEqual([[0.06, 2.0]], fresh["bids"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import asyncio
+import unittest
+
+from aiohttp import web
+from ccxt import RateLimitExceeded
+
+from src.http_pool import HttpPool
+from src.metrics import METRICS
+
+
+class StandInServer:
+    """A local exchange API that answers after latency seconds, and 429s under /limited."""
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.hits = {}
+        self.active = 0
+        self.most_active = 0
+        self.connections = set()
+        self.url = None
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/book/{symbol:.+}", self.book)
+        app.router.add_get("/limited", self.limited)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}"
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def _serve(self, request):
+        self.hits[request.path] = self.hits.get(request.path, 0) + 1
+        self.connections.add(request.transport.get_extra_info("peername"))
+        self.active += 1
+        self.most_active = max(self.most_active, self.active)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.active -= 1
+
+    async def book(self, request):
+        await self._serve(request)
+        return web.json_response({"symbol": request.match_info["symbol"],
+                                  "bids": [[1.0, 2.0]], "asks": [[1.1, 2.0]]})
+
+    async def limited(self, request):
+        await self._serve(request)
+        return web.json_response({"error": "Too many requests"}, status=429)
+
+
+class JsonExchange:
+    """Fetches like a ccxt async exchange: through self.session, raising ccxt errors."""
+
+    def __init__(self, name, url):
+        self.name = name
+        self.url = url
+        self.session = None
+        self.own_session = True
+
+    async def fetch(self, url, method="GET", headers=None, body=None):
+        async with self.session.request(method, url, headers=headers, data=body) as response:
+            if response.status == 429:
+                raise RateLimitExceeded(f"{self.name} {url}")
+            return await response.json()
+
+    async def fetch_l2_order_book(self, symbol):
+        return await self.fetch(f"{self.url}/book/{symbol}")
+
+
+class HttpPoolTest(unittest.TestCase):
+    def setUp(self):
+        super(HttpPoolTest, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.server = StandInServer()
+        self.loop.run_until_complete(self.server.start())
+        self.pool = HttpPool(limit_per_host=3)
+        METRICS.enabled = True
+
+    def tearDown(self):
+        METRICS.enabled = False
+        METRICS.reset()
+        self.loop.run_until_complete(self.pool.close())
+        self.loop.run_until_complete(self.server.stop())
+        self.loop.close()
+        super(HttpPoolTest, self).tearDown()
+
+    def gather(self, *requests):
+        return self.loop.run_until_complete(
+            asyncio.gather(*requests, return_exceptions=True))
+
+    def test_limits_connections_per_host(self):
+        exchanges = [self.pool.attach(JsonExchange(name, self.server.url)) for name in "ab"]
+        books = self.gather(*[exchange.fetch_l2_order_book(f"C{index}/BTC")
+                              for exchange in exchanges for index in range(10)])
+        self.assertEqual([f"C{index}/BTC" for index in range(10)] * 2,
+                         [book["symbol"] for book in books])
+        self.assertLessEqual(self.server.most_active, 3)
+        # Both exchanges share the same kept-alive connections.
+        self.assertLessEqual(len(self.server.connections), 3)
+        self.assertIs(exchanges[0].session, exchanges[1].session)
+        self.assertFalse(exchanges[0].own_session)
+
+    def test_coalesces_identical_requests(self):
+        exchanges = [self.pool.attach(JsonExchange(name, self.server.url)) for name in "ab"]
+        books = self.gather(*[exchange.fetch_l2_order_book("ETH/BTC")
+                              for exchange in exchanges for _ in range(5)])
+        self.assertEqual(10, len(books))
+        self.assertTrue(all(book["symbol"] == "ETH/BTC" for book in books))
+        self.assertEqual(1, self.server.hits["/book/ETH/BTC"])
+
+        # Once it has finished, the next request goes out again.
+        self.gather(exchanges[0].fetch_l2_order_book("ETH/BTC"))
+        self.assertEqual(2, self.server.hits["/book/ETH/BTC"])
+
+    def test_shares_rate_limit_errors(self):
+        exchange = self.pool.attach(JsonExchange("a", self.server.url))
+        results = self.gather(*[exchange.fetch(f"{self.server.url}/limited") for _ in range(4)])
+        self.assertTrue(all(isinstance(result, RateLimitExceeded) for result in results))
+        self.assertEqual(1, self.server.hits["/limited"])
+        errors = METRICS.as_dict()["http_errors_total"]
+        self.assertEqual([{"labels": {"host": "127.0.0.1", "error": "RateLimitExceeded"},
+                           "value": 1}], errors)
+
+    def test_records_latency(self):
+        exchange = self.pool.attach(JsonExchange("a", self.server.url))
+        self.gather(*[exchange.fetch_l2_order_book(f"C{index}/BTC") for index in range(4)])
+        latency, = METRICS.as_dict()["http_request_seconds"]
+        self.assertEqual(4, latency["count"])
+        self.assertGreaterEqual(latency["sum"], 4 * self.server.latency)
+        self.assertEqual(0, latency["buckets"]["0.005"])
+
+
+if __name__ == "__main__":
+    unittest.main()
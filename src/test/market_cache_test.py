@@ -0,0 +1,113 @@
+import asyncio
+import os
+import tempfile
+import unittest
+
+from ccxt import RequestTimeout
+
+from src.market_cache import MarketCache
+
+
+class MarketExchange:
+    """Serves markets like a ccxt exchange, counting the loads that reach the exchange."""
+
+    def __init__(self, name, symbols, fail=False):
+        self.name = name
+        self.listed = symbols
+        self.fail = fail
+        self.markets = None
+        self.currencies = {}
+        self.symbols = None
+        self.fetches = 0
+
+    def set_markets(self, markets, currencies=None):
+        self.markets = markets
+        self.currencies = currencies or {}
+        self.symbols = sorted(markets)
+        return markets
+
+    async def load_markets(self, reload=False):
+        if self.markets and not reload:
+            return self.markets
+        self.fetches += 1
+        if self.fail:
+            raise RequestTimeout(self.name)
+        return self.set_markets({symbol: {"symbol": symbol, "taker": 0.002}
+                                 for symbol in self.listed}, {"BTC": {"id": "BTC"}})
+
+
+class MarketCacheTest(unittest.TestCase):
+    def setUp(self):
+        super(MarketCacheTest, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, "markets.json")
+        self.now = 1000.0
+
+    def tearDown(self):
+        self.dir.cleanup()
+        self.loop.close()
+        super(MarketCacheTest, self).tearDown()
+
+    def cache(self, **kwargs):
+        return MarketCache(self.path, clock=lambda: self.now, **kwargs)
+
+    def test_primes_from_disk_without_loading(self):
+        exchange = MarketExchange("a", ["ETH/BTC", "LTC/BTC"])
+        cache = self.cache()
+        self.assertFalse(cache.prime(exchange))
+        self.loop.run_until_complete(cache.refresh(exchange))
+        self.assertEqual(1, exchange.fetches)
+
+        restarted = MarketExchange("a", ["ETH/BTC", "LTC/BTC"])
+        self.assertTrue(self.cache().prime(restarted))
+        self.loop.run_until_complete(restarted.load_markets())
+        self.assertEqual(0, restarted.fetches)
+        self.assertEqual(["ETH/BTC", "LTC/BTC"], restarted.symbols)
+        self.assertEqual(0.002, restarted.markets["ETH/BTC"]["taker"])
+        self.assertEqual({"BTC": {"id": "BTC"}}, restarted.currencies)
+
+    def test_refreshes_stale_markets(self):
+        cache = self.cache(ttl=100)
+        exchanges = [MarketExchange("a", ["ETH/BTC"]), MarketExchange("b", ["LTC/BTC"])]
+        refreshed = []
+        wait = self.loop.run_until_complete(cache.refresh_stale(exchanges, refreshed.append))
+        self.assertEqual(exchanges, refreshed)
+        self.assertEqual(100, wait)
+
+        self.now += 60
+        exchanges[1].listed = ["LTC/BTC", "XMR/BTC"]
+        wait = self.loop.run_until_complete(cache.refresh_stale(exchanges))
+        self.assertEqual([1, 1], [exchange.fetches for exchange in exchanges])
+        self.assertEqual(40, wait)
+
+        self.now += 40
+        self.loop.run_until_complete(cache.refresh_stale(exchanges))
+        self.assertEqual([2, 2], [exchange.fetches for exchange in exchanges])
+        self.assertEqual(["LTC/BTC", "XMR/BTC"], sorted(self.cache().entries["b"]["markets"]))
+
+    def test_failed_refresh_keeps_cached_markets(self):
+        exchange = MarketExchange("a", ["ETH/BTC"])
+        cache = self.cache(ttl=100, retry=10)
+        self.loop.run_until_complete(cache.refresh(exchange))
+
+        self.now += 500
+        exchange.fail = True
+        wait = self.loop.run_until_complete(cache.refresh_stale([exchange]))
+        self.assertEqual(10, wait)
+        restarted = MarketExchange("a", [])
+        self.assertTrue(self.cache().prime(restarted))
+        self.assertEqual(["ETH/BTC"], restarted.symbols)
+
+    def test_ignores_corrupt_cache(self):
+        with open(self.path, "w") as cache:
+            cache.write("{not json")
+        cache = self.cache()
+        self.assertEqual({}, cache.entries)
+        self.loop.run_until_complete(cache.refresh(MarketExchange("a", ["ETH/BTC"])))
+        self.assertIn("a", self.cache().entries)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+
+from src.market_index import MarketIndex
+
+
+class MarketIndexTest(unittest.TestCase):
+    def test_drops_markets_too_far_from_start(self):
+        index = MarketIndex("BTC", max_steps=3)
+        self.assertTrue(index.update("A", ["ETH/BTC", "LTC/ETH", "DOGE/LTC", "ETH/USD"]))
+        self.assertTrue(index.update("B", ["USD/XBT", "NEO/DOGE"]))
+        self.assertEqual(["ETH/BTC", "ETH/USD"], index.relevant("A"))
+        self.assertEqual(["USD/XBT"], index.relevant("B"))
+        self.assertFalse(index.is_relevant("NEO/DOGE"))
+        self.assertFalse(index.is_relevant("GNT/GNO"))
+
+    def test_longer_roundtrips_reach_further(self):
+        index = MarketIndex("BTC", max_steps=5)
+        index.update("A", ["ETH/BTC", "LTC/ETH", "DOGE/LTC", "NEO/DOGE"])
+        self.assertEqual(["ETH/BTC", "LTC/ETH"], index.relevant("A"))
+
+    def test_rebuilds_only_when_markets_change(self):
+        index = MarketIndex("BTC", max_steps=2)
+        index.update("A", ["ETH/BTC"])
+        self.assertEqual(["ETH/BTC"], index.relevant("A"))
+        self.assertFalse(index.update("A", ["ETH/BTC"]))
+        self.assertTrue(index.update("A", ["ETH/BTC", "LTC/ETH"]))
+        self.assertEqual(["ETH/BTC"], index.relevant("A"))
+        self.assertEqual([], index.relevant("B"))
+
+    def test_markets_relevant_to_any_currency(self):
+        index = MarketIndex("BTC", max_steps=3, currencies=["DOGE", "XBT"])
+        self.assertEqual(["BTC", "DOGE"], index.currencies)
+        index.update("A", ["ETH/BTC", "LTC/ETH", "DOGE/LTC", "NEO/DOGE", "GNT/GNO"])
+        self.assertEqual(["DOGE/LTC", "ETH/BTC", "NEO/DOGE"], index.relevant("A"))
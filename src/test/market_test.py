@@ -0,0 +1,26 @@
+import unittest
+
+from src.bench.market import generate_market, load_table
+from src.rate_table import RateTable
+from src.trade import Trade
+
+
+class MarketTest(unittest.TestCase):
+    def test_clean_market_has_no_arbitrage(self):
+        table = load_table(RateTable(), generate_market(seed=1, coins=8, cycles=0))
+        self.assertEqual([], table.best_roundtrips("C0", 0.01, max_steps=3, min_profit=0.0))
+
+    def test_planted_cycles_are_the_best_roundtrips(self):
+        market = generate_market(seed=2, coins=8, cycles=2, edge=0.05)
+        table = load_table(RateTable(), market)
+        best = table.best_roundtrips("C0", 0.01, max_steps=3, limit=2)
+        planted = sorted((exchange, path) for exchange, path in market.cycles)
+        found = sorted((chain[0]["exchange"], [t["from_cur"] for t in chain] + ["C0"])
+                       for chain in best)
+        self.assertEqual(planted, found)
+        for chain in best:
+            self.assertAlmostEqual(1.05 ** 3 - 1, Trade.profitability(chain), places=3)
+
+    def test_generation_is_seeded(self):
+        self.assertEqual(generate_market(seed=3, coins=6), generate_market(seed=3, coins=6))
+        self.assertNotEqual(generate_market(seed=3, coins=6), generate_market(seed=4, coins=6))
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import os
+import tempfile
+import unittest
+
+from src.metrics import METRICS, Metrics
+from src.test.rate_table_test import random_table
+
+
+class MetricsTest(unittest.TestCase):
+    def tearDown(self):
+        METRICS.enabled = False
+        METRICS.reset()
+        super(MetricsTest, self).tearDown()
+
+    def test_disabled_records_nothing(self):
+        metrics = Metrics()
+        metrics.inc("books_loaded_total", 3, exchange="A")
+        metrics.observe("populate_seconds", 0.5, exchange="A")
+        self.assertEqual({}, metrics.values)
+        self.assertEqual("\n", metrics.render())
+
+    def test_render_prometheus_text(self):
+        metrics = Metrics(enabled=True)
+        metrics.inc("books_loaded_total", 3, exchange="A")
+        metrics.inc("books_loaded_total", 2, exchange="A")
+        metrics.set("book_age_seconds", 1.5, exchange='Q"uote')
+        metrics.observe("populate_seconds", 0.5, exchange="A")
+        metrics.observe("populate_seconds", 1.5, exchange="A")
+        self.assertEqual(
+            '# TYPE sharpshooter_book_age_seconds gauge\n'
+            'sharpshooter_book_age_seconds{exchange="Q\\"uote"} 1.5\n'
+            '# TYPE sharpshooter_books_loaded_total counter\n'
+            'sharpshooter_books_loaded_total{exchange="A"} 5\n'
+            '# TYPE sharpshooter_populate_seconds summary\n'
+            'sharpshooter_populate_seconds_count{exchange="A"} 2\n'
+            'sharpshooter_populate_seconds_sum{exchange="A"} 2.0\n'
+            'sharpshooter_populate_seconds_max{exchange="A"} 1.5\n', metrics.render())
+        self.assertEqual({"count": 2, "sum": 2.0, "max": 1.5, "labels": {"exchange": "A"}},
+                         metrics.as_dict()["populate_seconds"][0])
+
+    def test_render_histogram(self):
+        metrics = Metrics(enabled=True)
+        for latency in (0.05, 0.2, 3.0):
+            metrics.histogram("http_request_seconds", latency, buckets=(0.1, 1.0), host="a")
+        self.assertEqual(
+            '# TYPE sharpshooter_http_request_seconds histogram\n'
+            'sharpshooter_http_request_seconds_bucket{host="a",le="0.1"} 1\n'
+            'sharpshooter_http_request_seconds_bucket{host="a",le="1.0"} 2\n'
+            'sharpshooter_http_request_seconds_bucket{host="a",le="+Inf"} 3\n'
+            'sharpshooter_http_request_seconds_count{host="a"} 3\n'
+            'sharpshooter_http_request_seconds_sum{host="a"} 3.25\n', metrics.render())
+        self.assertEqual({"count": 3, "sum": 3.25, "buckets": {"0.1": 1, "1.0": 2},
+                          "labels": {"host": "a"}},
+                         metrics.as_dict()["http_request_seconds"][0])
+
+    def test_search_records_work(self):
+        METRICS.enabled = True
+        table = random_table(1)
+        found = table.best_roundtrips("C0", 3, max_steps=3, min_profit=0.01)
+        values = METRICS.as_dict()
+        self.assertEqual(len(found), values["search_roundtrips_found_total"][0]["value"])
+        self.assertEqual(1, values["search_seconds"][0]["count"])
+        reasons = {entry["labels"]["reason"] for entry in values["search_pruned_total"]}
+        self.assertEqual({"unreachable", "unprofitable", "repeats", "no_volume", "crowded"},
+                         reasons)
+
+    def test_serves_metrics_over_http(self):
+        metrics = Metrics(enabled=True)
+        metrics.inc("books_loaded_total", exchange="A")
+        loop = asyncio.new_event_loop()
+
+        async def fetch(path):
+            server = await metrics.serve(port=0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                writer.write(f"GET {path} HTTP/1.0\r\n\r\n".encode())
+                response = await reader.read()
+                writer.close()
+                return response.decode()
+            finally:
+                server.close()
+                await server.wait_closed()
+
+        try:
+            response = loop.run_until_complete(fetch("/metrics"))
+            missing = loop.run_until_complete(fetch("/other"))
+        finally:
+            loop.close()
+        self.assertTrue(response.startswith("HTTP/1.0 200 OK"))
+        self.assertIn('sharpshooter_books_loaded_total{exchange="A"} 1', response)
+        self.assertTrue(missing.startswith("HTTP/1.0 404"))
+
+    def test_periodic_dump(self):
+        metrics = Metrics(enabled=True)
+        metrics.set("opportunities", 2, currency="ETH")
+        loop = asyncio.new_event_loop()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.json")
+
+            async def dump():
+                task = asyncio.ensure_future(metrics.dump_periodically(path, interval=0.01))
+                await asyncio.sleep(0.05)
+                task.cancel()
+
+            loop.run_until_complete(dump())
+            loop.close()
+            with open(path) as dumped:
+                self.assertEqual(2, json.load(dumped)["metrics"]["opportunities"][0]["value"])
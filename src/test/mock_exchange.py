@@ -31,6 +31,18 @@ class MockExchange(Exchange):
         self.books[from_cur][to_cur]["asks"] = asks
         return asks
 
+    def snapshot_message(self, symbol, sequence=0):
+        """Returns the current book for a symbol as a streaming feed snapshot message."""
+        to_cur, from_cur = symbol.split("/")
+        book = self.books[from_cur][to_cur]
+        return {
+            "type": "snapshot",
+            "symbol": symbol,
+            "sequence": sequence,
+            "bids": book.get("bids", []),
+            "asks": book.get("asks", []),
+        }
+
     def _add_order(self, existing_orders, price, volume):
         for order in existing_orders:
             if order[0] == price:
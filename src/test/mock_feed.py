@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import json
+
+from aiohttp import WSMsgType, web
+
+
+class MockFeedServer:
+    """Local WebSocket stand-in for an exchange's book feed that replays recorded messages.
+
+    A subscribe request replays every recorded message for the requested symbols in order, and a
+    snapshot request answers with that symbol's entry in snapshots. The server hangs up once the
+    client has been quiet for idle_timeout seconds, which ends the client's message stream.
+    """
+
+    def __init__(self, recorded, snapshots=None, idle_timeout=0.2):
+        self.recorded = recorded
+        self.snapshots = snapshots or {}
+        self.idle_timeout = idle_timeout
+        self.requests = []
+        self.url = None
+        self._runner = None
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f"http://{host}:{port}/"
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle(self, request):
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        while True:
+            try:
+                message = await socket.receive(timeout=self.idle_timeout)
+            except asyncio.TimeoutError:
+                break
+            if message.type != WSMsgType.TEXT:
+                break
+
+            body = json.loads(message.data)
+            self.requests.append(body)
+            if body["op"] == "subscribe":
+                for recorded in self.recorded:
+                    if recorded["symbol"] in body["symbols"]:
+                        await socket.send_str(json.dumps(recorded))
+            elif body["op"] == "snapshot" and body["symbol"] in self.snapshots:
+                await socket.send_str(json.dumps(self.snapshots[body["symbol"]]))
+        await socket.close()
+        return socket
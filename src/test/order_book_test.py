@@ -0,0 +1,86 @@
+import math
+import pickle
+import random
+import unittest
+
+import numpy as np
+
+from src.order_book import BookSide, InvertedBookSide, TopOfBook, market_prices
+from src.rate_table import RateTable
+
+
+def random_side(rng, depth):
+    prices = sorted((rng.uniform(0.5, 2.0) for _ in range(depth)), reverse=True)
+    return BookSide.from_orders([(price, rng.uniform(0.1, 10)) for price in prices])
+
+
+class OrderBookTest(unittest.TestCase):
+    def assertPricesEqual(self, expected, actual):
+        for want, got in zip(expected, actual):
+            if want is None:
+                self.assertTrue(got is None or math.isnan(got))
+            else:
+                self.assertAlmostEqual(want, got)
+
+    def test_market_price_matches_level_walk(self):
+        rng = random.Random(3)
+        for _ in range(50):
+            side = random_side(rng, rng.randint(1, 20))
+            for amount in (0.05, 1, 5, 30, 200):
+                self.assertPricesEqual(RateTable.get_market_price(list(side), amount),
+                                       RateTable.get_market_price(side, amount))
+
+    def test_market_price_on_exact_level_boundary(self):
+        side = BookSide.from_orders([(3, 1), (2, 1), (1, 1)])
+        self.assertEqual((2.5, 2, 5), side.market_price(2))
+        self.assertEqual((None, None, None), side.market_price(3.5))
+
+    def test_inverted_side_is_lazy(self):
+        asks = BookSide.from_orders([(4, 2), (5, 1)])
+        inverted = InvertedBookSide(asks)
+        self.assertEqual(2, len(inverted))
+        self.assertIsNone(inverted._levels)
+        self.assertEqual([(0.25, 8), (0.2, 5)], list(inverted))
+
+    def test_top_of_book_prices_like_an_array_side(self):
+        top = BookSide.from_orders([(4, 2)], fee=0.1)
+        self.assertIsInstance(top, TopOfBook)
+        self.assertIsInstance(BookSide.from_orders([(4, 2), (0, 1)]), TopOfBook)
+        array = BookSide(np.array([[4.0], [2.0]]), fee=0.1)
+        for side, expected in ((top, array), (top.inverted(0.1), InvertedBookSide(array, 0.1))):
+            for amount in (0.5, 2, 8, 9):
+                self.assertPricesEqual(expected.market_price(amount), side.market_price(amount))
+            self.assertAlmostEqual(expected.rate, side.rate)
+            self.assertEqual(list(expected), list(side))
+            self.assertEqual(expected[0], side[0])
+            self.assertIsNone(side._levels)
+            self.assertEqual(expected.levels.tolist(), side.levels.tolist())
+        copy = pickle.loads(pickle.dumps(top.inverted()))
+        self.assertEqual([(0.25, 8)], list(copy))
+        self.assertTrue(top.same_levels(BookSide.from_orders([(4, 2)])))
+        self.assertFalse(top.same_levels(BookSide.from_orders([(4, 2), (3, 1)])))
+
+    def test_batched_prices_match_scalar(self):
+        rng = random.Random(5)
+        sides = [random_side(rng, rng.randint(1, 15)) for _ in range(20)]
+        sides.append(BookSide.from_orders([]))
+        amounts = [[0.5, 3, 12, 80, -1] for _ in sides]
+        avg, limit, out = market_prices(sides, amounts)
+        for row, side in enumerate(sides):
+            for col, amount in enumerate(amounts[row]):
+                expected = side.market_price(amount) if amount > 0 else (None, None, None)
+                self.assertPricesEqual(expected, (avg[row, col], limit[row, col], out[row, col]))
+
+        avg, limit, out = RateTable.get_market_prices(sides, [3] * len(sides))
+        self.assertEqual((len(sides),), avg.shape)
+        self.assertPricesEqual(sides[0].market_price(3), (avg[0], limit[0], out[0]))
+
+    def test_fees_come_out_of_fills(self):
+        side = BookSide.from_orders([(3, 1), (2, 1)], fee=0.1)
+        self.assertEqual((2.5 * 0.9, 2, 5 * 0.9), side.market_price(2))
+        self.assertAlmostEqual(2.7, side.rate)
+        inverted = InvertedBookSide(BookSide.from_orders([(4, 2)]), fee=0.1)
+        self.assertPricesEqual((0.25 * 0.9, 0.25, 1 * 0.9), inverted.market_price(4))
+        avg, limit, out = market_prices([side, inverted], [2, 4])
+        self.assertPricesEqual(side.market_price(2), (avg[0], limit[0], out[0]))
+        self.assertPricesEqual(inverted.market_price(4), (avg[1], limit[1], out[1]))
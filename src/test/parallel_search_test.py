@@ -0,0 +1,145 @@
+import asyncio
+import pickle
+import threading
+import unittest
+from multiprocessing import shared_memory
+
+from src.compute import ComputeExecutor
+from src.order_book import BookSide, InvertedBookSide
+from src.parallel_search import ParallelSearch
+from src.rate_graph import RateGraph
+from src.test.rate_table_test import EXHAUSTIVE, chain_keys, random_table
+
+
+class ParallelSearchTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super(ParallelSearchTest, cls).setUpClass()
+        cls.search = ParallelSearch(workers=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.search.close()
+        super(ParallelSearchTest, cls).tearDownClass()
+
+    def test_matches_graph_engine(self):
+        for seed in range(3):
+            table = random_table(seed)
+            for cur in ("C0", "XBT"):
+                expected = table.best_roundtrips(cur, 3, max_steps=3, width=EXHAUSTIVE)
+                actual = self.search.roundtrips(table.snapshot(), cur, 3, max_steps=3,
+                                                width=EXHAUSTIVE)
+                self.assertEqual(chain_keys(expected), chain_keys(actual))
+                self.assertEqual([t["value"] for t in expected[0]],
+                                 [t["value"] for t in actual[0]])
+
+    def test_workers_price_fees(self):
+        table = random_table(4, fees=True)
+        expected = table.best_roundtrips("C0", 3, max_steps=3, width=EXHAUSTIVE)
+        actual = self.search.roundtrips(table.snapshot(), "C0", 3, max_steps=3,
+                                        width=EXHAUSTIVE)
+        self.assertEqual(chain_keys(expected), chain_keys(actual))
+        self.assertEqual([t["value"] for t in expected[0]], [t["value"] for t in actual[0]])
+
+    def test_async_respects_filters(self):
+        table = random_table(7)
+        loop = asyncio.new_event_loop()
+        try:
+            actual = loop.run_until_complete(self.search.roundtrips_async(
+                table.snapshot(), "C0", 3, max_steps=3, exchanges={"E0"}, width=EXHAUSTIVE))
+        finally:
+            loop.close()
+        expected = table.best_roundtrips("C0", 3, max_steps=3, exchanges={"E0"},
+                                         width=EXHAUSTIVE)
+        self.assertEqual(chain_keys(expected), chain_keys(actual))
+
+    def test_async_shares_the_snapshot_off_the_loop(self):
+        shared = []
+
+        class RecordingSearch(ParallelSearch):
+            def _prepare(self, *args):
+                search = super(RecordingSearch, self)._prepare(*args)
+                shared.append((threading.current_thread(), search.shared.name, search.calls()))
+                return search
+
+        compute = ComputeExecutor(1)
+        search = RecordingSearch(workers=2, executor=self.search.executor, compute=compute)
+        table = random_table(2)
+        inventories = [("C0", 3), ("XBT", 2), ("C0", 40)]
+        loop = asyncio.new_event_loop()
+        try:
+            actual = loop.run_until_complete(search.inventory_roundtrips_async(
+                table.snapshot(), inventories, max_steps=3, width=EXHAUSTIVE))
+        finally:
+            loop.close()
+            compute.close()
+        expected = table.inventory_roundtrips(inventories, max_steps=3, width=EXHAUSTIVE)
+        for inventory, chains in zip(inventories, actual):
+            self.assertEqual(chain_keys(expected[inventory]), chain_keys(chains))
+
+        # Every inventory is searched over one block, and workers are sent its name, never the
+        # pickled books themselves.
+        (thread, name, calls), = shared
+        self.assertIsNot(threading.main_thread(), thread)
+        self.assertTrue(all(len(pickle.dumps(call[1:])) < 2000 for call in calls))
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name)
+
+    def test_matches_graph_engine_at_any_width(self):
+        table = random_table(5, fees=True)
+        for width, min_profit in ((None, None), (3, None), (None, 0.0)):
+            expected = table.best_roundtrips("C0", 3, max_steps=4, width=width,
+                                             min_profit=min_profit)
+            actual = self.search.roundtrips(table.snapshot(), "C0", 3, max_steps=4, width=width,
+                                            min_profit=min_profit)
+            self.assertEqual(chain_keys(expected), chain_keys(actual))
+
+    def test_workers_split_each_step(self):
+        table = random_table(3, coins=12)
+        graph = RateGraph(table.snapshot())
+        alone = graph.roundtrips("C0", 3, max_steps=4)
+        search = ParallelSearch(workers=4, executor=self.search.executor)._prepare(
+            table.snapshot(), [("C0", 3)], 4, None, None, None, None)
+        try:
+            calls = search.calls()
+            while calls:
+                search.absorb([call[0](*call[1:]) for call in calls])
+                calls = search.calls()
+        finally:
+            search.close()
+        self.assertEqual(chain_keys(alone), chain_keys(search.found[0]))
+        # Each call expands and prices only its share of the step, so the busiest worker of
+        # every step does well under half the work of the whole search.
+        self.assertEqual([4, 4, 4, 4], [len(step) for step in search.stats])
+        self.assertEqual(graph.stats.expanded - 1,
+                         sum(stats.expanded for step in search.stats[1:] for stats in step))
+        for reason in ("expanded", "priced"):
+            busiest = sum(max(getattr(stats, reason) for stats in step) for step in search.stats)
+            self.assertLess(busiest, getattr(graph.stats, reason) / 2)
+
+    def test_first_hops_match_graph(self):
+        for seed in range(3):
+            snapshot = random_table(seed).snapshot()
+            for exchanges, coins in ((None, None), ({"E0", "E2"}, {"C1", "C2", "BTC"})):
+                graph = RateGraph(snapshot, exchanges, coins)
+                for cur in ("C0", "BTC", "C3"):
+                    self.assertEqual(graph.first_hops(cur),
+                                     ParallelSearch.first_hops(snapshot, cur, exchanges, coins))
+
+    def test_partitions_cover_first_hops_once(self):
+        table = random_table(1)
+        shares = self.search.partitions(table.snapshot(), "BTC")
+        self.assertEqual(2, len(shares))
+        hops = [hop for share in shares for hop in share]
+        self.assertEqual(len(hops), len(set(hops)))
+        self.assertEqual({"BTC"}, {from_cur for _, from_cur, _ in hops})
+        self.assertEqual(shares, self.search.partitions(table.snapshot(), "XBT"))
+
+    def test_book_sides_pickle_without_caches(self):
+        asks = BookSide.from_orders([(4, 2), (5, 1)])
+        inverted = InvertedBookSide(asks, fee=0.002)
+        inverted.market_price(1)
+        copy = pickle.loads(pickle.dumps(inverted))
+        self.assertIsNone(copy._levels)
+        self.assertEqual(0.002, copy.fee)
+        self.assertEqual(list(inverted), list(copy))
@@ -0,0 +1,314 @@
+import random
+import unittest
+
+import numpy as np
+
+from src.coin_aliases import CoinAliases
+from src.rate_graph import RateGraph
+from src.rate_table import RateTable, Spread
+from src.trade import Trade
+
+
+def random_table(seed, exchanges=3, coins=8, density=0.6, fees=False):
+    rng = random.Random(seed)
+    names = [f"C{index}" for index in range(coins)] + ["XBT", "BTC"]
+    table = RateTable()
+    if fees:
+        fee_rng = random.Random(-seed)
+        for exchange in range(exchanges):
+            table.set_fees(f"E{exchange}",
+                           {f"{coin1}/{coin2}": fee_rng.uniform(0, 0.005)
+                            for coin1 in names for coin2 in names},
+                           {coin: fee_rng.uniform(0, 0.5) for coin in names})
+    for exchange in range(exchanges):
+        for coin1 in names:
+            for coin2 in names:
+                if coin1 >= coin2 or rng.random() > density:
+                    continue
+                mid = rng.uniform(0.5, 2.0)
+                bids = [(mid * (1 - 0.01 * level) * rng.uniform(0.95, 1.05), rng.uniform(1, 50))
+                        for level in range(3)]
+                asks = [(mid * (1 + 0.01 * level) * rng.uniform(0.95, 1.05), rng.uniform(1, 50))
+                        for level in range(3)]
+                table.set_book(f"E{exchange}", f"{coin1}/{coin2}",
+                               sorted(bids, reverse=True), sorted(asks))
+    return table
+
+
+# Wider than the number of paths through any random_table, so the graph engine finds every chain.
+EXHAUSTIVE = 10 ** 6
+
+
+def chain_keys(roundtrips):
+    return sorted(tuple(trade.get_unique() for trade in chain) for chain in roundtrips)
+
+
+class RateTableTest(unittest.TestCase):
+    def test_graph_engine_matches_dfs(self):
+        for seed in range(5):
+            table = random_table(seed)
+            for cur in ("C0", "BTC", "XBT"):
+                dfs = table.best_roundtrips(cur, 3, max_steps=3, engine="dfs")
+                graph = table.best_roundtrips(cur, 3, max_steps=3, engine="graph",
+                                              width=EXHAUSTIVE)
+                self.assertTrue(dfs)
+                self.assertEqual(chain_keys(dfs), chain_keys(graph))
+                self.assertAlmostEqual(Trade.profitability(dfs[0]),
+                                       Trade.profitability(graph[0]))
+
+    def test_engines_agree_net_of_fees(self):
+        for seed in range(3):
+            table = random_table(seed, fees=True)
+            for min_profit in (None, 0.0):
+                dfs = table.best_roundtrips("C0", 3, max_steps=3, engine="dfs",
+                                            min_profit=min_profit)
+                graph = table.best_roundtrips("C0", 3, max_steps=3, min_profit=min_profit,
+                                              width=EXHAUSTIVE)
+                self.assertEqual(chain_keys(dfs), chain_keys(graph))
+                self.assertEqual([Trade.profitability(c) for c in dfs],
+                                 [Trade.profitability(c) for c in graph])
+
+    def test_graph_engine_respects_filters(self):
+        table = random_table(7)
+        for kwargs in ({"exchanges": {"E0"}}, {"coins": {"C0", "C1", "C2", "C3"}}):
+            dfs = table.best_roundtrips("C0", 3, max_steps=3, engine="dfs", **kwargs)
+            graph = table.best_roundtrips("C0", 3, max_steps=3, engine="graph",
+                                          width=EXHAUSTIVE, **kwargs)
+            self.assertEqual(chain_keys(dfs), chain_keys(graph))
+
+    def test_min_profit_prunes_to_the_same_chains(self):
+        for seed in range(5):
+            table = random_table(seed)
+            for min_profit in (-0.5, 0.0, 0.025, 0.2):
+                dfs = table.best_roundtrips("C0", 3, max_steps=3, engine="dfs",
+                                            min_profit=min_profit)
+                graph = table.best_roundtrips("C0", 3, max_steps=3, min_profit=min_profit,
+                                              width=EXHAUSTIVE)
+                self.assertEqual(chain_keys(dfs), chain_keys(graph))
+                self.assertTrue(all(Trade.profitability(c) >= min_profit for c in graph))
+
+    def test_min_profit_finds_every_chain_at_any_width(self):
+        table = random_table(0, exchanges=4, coins=23)
+        for width in (None, 1):
+            dfs = table.best_roundtrips("C0", 3, max_steps=3, engine="dfs", min_profit=0.0)
+            graph = table.best_roundtrips("C0", 3, max_steps=3, min_profit=0.0, width=width)
+            self.assertGreater(len(dfs), 1000)
+            self.assertEqual(chain_keys(dfs), chain_keys(graph))
+
+    def test_narrow_search_keeps_the_best_chains(self):
+        for seed in range(3):
+            table = random_table(seed, fees=seed == 1)
+            dfs = table.best_roundtrips("C0", 3, max_steps=4, engine="dfs")
+            graph = table.best_roundtrips("C0", 3, max_steps=4, width=3)
+            # Crowded out chains are never found, but the best ones are, priced the same.
+            self.assertLess(len(graph), len(dfs) / 2)
+            self.assertLessEqual(set(chain_keys(graph)), set(chain_keys(dfs)))
+            self.assertEqual([Trade.profitability(c) for c in dfs[:3]],
+                             [Trade.profitability(c) for c in graph[:3]])
+
+    def test_limit_keeps_the_best(self):
+        table = random_table(3)
+        every = table.best_roundtrips("C0", 3, max_steps=3)
+        best = table.best_roundtrips("C0", 3, max_steps=3, limit=5)
+        self.assertEqual([Trade.profitability(c) for c in every[:5]],
+                         [Trade.profitability(c) for c in best])
+
+    def test_inventory_roundtrips_match_single_searches(self):
+        inventories = [("C0", 0.5), ("C0", 3), ("C0", 40), ("XBT", 2), ("C2", 5)]
+        for seed in range(4):
+            table = random_table(seed, fees=True)
+            for min_profit in (None, 0.0):
+                found = table.inventory_roundtrips(inventories, max_steps=3,
+                                                   min_profit=min_profit)
+                self.assertEqual(inventories, list(found))
+                for (cur, amount), chains in found.items():
+                    alone = table.best_roundtrips(cur, amount, max_steps=3, min_profit=min_profit)
+                    self.assertEqual(chain_keys(alone), chain_keys(chains))
+                    self.assertEqual([Trade.profitability(c) for c in alone],
+                                     [Trade.profitability(c) for c in chains])
+
+    def test_inventories_of_one_currency_share_a_search(self):
+        table = random_table(2, fees=True)
+        inventories = [("C0", 0.5), ("C0", 3), ("C0", 40)]
+        graph = RateGraph(table.snapshot())
+        found = graph.inventory_roundtrips(inventories, max_steps=3)
+        shared = graph.stats.expanded
+        alone = 0
+        for (cur, amount), chains in zip(inventories, found):
+            self.assertEqual(chain_keys(graph.roundtrips(cur, amount, max_steps=3)),
+                             chain_keys(chains))
+            alone += graph.stats.expanded
+        # Each coin is expanded once for every lane, not once per inventory.
+        self.assertLess(shared, alone / 2)
+
+    def test_finds_three_stage_arb(self):
+        table = RateTable()
+        table.set_book("Mock", "BTC/USD", [(10000, 20000)], [(10000, 20000)])
+        table.set_book("Mock", "ETH/BTC", [(0.05, 1000)], [(0.05, 1000)])
+        table.set_book("Mock", "ETH/USD", [(750, 40)], [(750, 40)])
+        best = table.best_roundtrips("USD", 10000, max_steps=3)[0]
+        self.assertAlmostEqual(0.5, Trade.profitability(best))
+        self.assertEqual(["USD", "BTC", "ETH"], [t["from_cur"] for t in best])
+
+    def test_set_book_stores_both_directions(self):
+        table = RateTable()
+        table.set_book("Mock", "ETH/USD", [(750, 2), (740, 1), (0, 5)], [(760, 3), (None, 1)])
+        self.assertEqual([(750, 2), (740, 1)], list(table["Mock"]["ETH"]["USD"]))
+        self.assertEqual((1 / 760, 760 * 3), table["Mock"]["USD"]["ETH"][0])
+        self.assertEqual(1, len(table["Mock"]["USD"]["ETH"]))
+        self.assertEqual({"ETH": ["USD"], "USD": ["ETH"]}, dict(table.get_pairs()))
+        self.assertIs(table["Mock"]["ETH"]["USD"], RateTable._synget(table, "Mock", "ETH", "USD"))
+
+        # Tickers of inactive markets quote a single missing or zero price.
+        table.set_book("Mock", "LTC/USD", [(None, 5)], [(100, 3)])
+        table.set_book("Mock", "XMR/USD", [(0, 5)], [(None, 3)])
+        self.assertEqual([], list(table["Mock"]["LTC"]["USD"]))
+        self.assertEqual([(0.01, 300)], list(table["Mock"]["USD"]["LTC"]))
+        self.assertEqual([], list(table["Mock"]["XMR"]["USD"]))
+        self.assertEqual([], list(table["Mock"]["USD"]["XMR"]))
+
+    def test_fees_lower_roundtrip_value(self):
+        table = RateTable()
+        table.set_fees("Mock", {"BTC/USD": 0.1, "ETH/BTC": 0.1, "ETH/USD": 0.1})
+        table.set_book("Mock", "BTC/USD", [(10000, 20000)], [(10000, 20000)])
+        table.set_book("Mock", "ETH/BTC", [(0.05, 1000)], [(0.05, 1000)])
+        table.set_book("Mock", "ETH/USD", [(750, 40)], [(750, 40)])
+        best = table.best_roundtrips("USD", 10000, max_steps=3)[0]
+        self.assertAlmostEqual(1.5 * 0.9 ** 3 - 1, Trade.profitability(best))
+        self.assertAlmostEqual(10000 * 1.5 * 0.9 ** 3, best[-1].amount)
+        self.assertEqual([], table.best_roundtrips("USD", 10000, max_steps=3, min_profit=0.1))
+
+    def test_withdrawals_between_exchanges(self):
+        table = RateTable()
+        table.set_fees("A", withdraw={"BTC": 0.1})
+        table.set_book("A", "BTC/USD", [(10000, 20000)], [(10000, 20000)])
+        table.set_book("B", "BTC/USD", [(11000, 20000)], [(11000, 20000)])
+        best = table.best_roundtrips("USD", 10000, max_steps=2)[0]
+        self.assertEqual(["A", "B"], [trade.exchange for trade in best])
+        self.assertAlmostEqual(0.9 * 11000, best[-1].amount)
+        self.assertAlmostEqual(0.9 * 1.1 - 1, Trade.profitability(best))
+        self.assertEqual((None, None, None),
+                         table.price_trade(table["B"]["BTC"]["USD"], 0.05, "BTC", "A", "B"))
+
+    def test_withdrawal_fee_changes_mark_books_changed(self):
+        table = RateTable()
+        table.set_book("A", "BTC/USD", [(10000, 20000)], [(10000, 20000)])
+        table.set_book("B", "BTC/USD", [(11000, 20000)], [(11000, 20000)])
+        version = table.version
+        table.set_fees("A", withdraw={"BTC": 0.1})
+        self.assertEqual({("A", "BTC", "USD"), ("A", "USD", "BTC")},
+                         set(table.changed_since(version)))
+        version = table.version
+        table.set_fees("A", taker={"BTC/USD": 0.001}, withdraw={"BTC": 0.1})
+        table.set_fees("C", withdraw={"BTC": 0.2})
+        self.assertEqual(version, table.version)
+
+    def test_load_fees(self):
+        class Exchange:
+            name = "Mock"
+            markets = {"XBT/USD": {"taker": 0.002}, "ETH/USD": {}}
+            fees = {"trading": {"taker": 0.003}, "funding": {"withdraw": {"XBT": 0.0005,
+                                                                          "ETH": "varies"}}}
+
+        table = RateTable()
+        table.load_fees(Exchange())
+        self.assertEqual({"XBT/USD": 0.002, "ETH/USD": 0.003}, table.taker_fees["Mock"])
+        self.assertEqual({"BTC": 0.0005}, table.withdraw_fees["Mock"])
+        table.set_book("Mock", "XBT/USD", [(10000, 1)], [(10100, 1)])
+        self.assertEqual(0.002, table["Mock"]["USD"]["BTC"].fee)
+        self.assertAlmostEqual(10000 * 0.998, table["Mock"]["BTC"]["USD"].rate)
+
+    def test_coins_are_stored_under_canonical_names(self):
+        aliases = CoinAliases({"XBT": "BTC"}, {"C": {"BAT": "BAT-C", "XBT": "XBT"}})
+        table = RateTable(aliases=aliases)
+        table.set_book("A", "XBT/USD", [(10000, 1)], [(10100, 1)])
+        table.set_book("A", "XBT/BTC", [(1, 1)], [(1, 1)])
+        table.set_book("B", "BTC/USD", [(10200, 1)], [(10300, 1)])
+        table.set_book("C", "BAT/XBT", [(0.1, 1)], [(0.2, 1)])
+        self.assertEqual({"BTC", "USD"}, set(table["A"]))
+        self.assertEqual({"BAT-C", "XBT"}, set(table["C"]))
+        self.assertIs(table["A"]["BTC"]["USD"], RateTable._synget(table, "A", "XBT", "USD"))
+        self.assertEqual(["BTC/USD"], table.spread_matrix().pairs)
+
+        table.remove_book("A", "XBT/USD")
+        self.assertNotIn("USD", table["A"]["BTC"])
+        self.assertEqual(["BTC", "XBT"], aliases.names("BTC"))
+        self.assertEqual(["BTC"], aliases.names("BTC", "C"))
+        self.assertEqual(["BAT-C", "BAT"], aliases.names("BAT-C", "C"))
+
+    def test_pairwise_diffs(self):
+        table = RateTable()
+        table.set_book("A", "ETH/USD", [(750, 2)], [(760, 2)])
+        table.set_book("B", "ETH/USD", [(800, 2)], [(810, 2)])
+        absdiffs, pctdiffs = table.pairwise_diffs("ETH", "USD")
+        self.assertEqual(50, absdiffs["A"]["B"])
+        self.assertAlmostEqual(50 / 750, pctdiffs["A"]["B"])
+        self.assertEqual(-50, absdiffs["B"]["A"])
+
+    def test_spread_matrix(self):
+        table = RateTable()
+        table.set_book("A", "ETH/USD", [(750, 2)], [(760, 2)])
+        table.set_book("B", "ETH/XBT", [(0.08, 1)], [(0.09, 1)])
+        table.set_book("B", "ETH/USD", [(800, 1), (700, 1)], [(810, 1), (820, 1)])
+        table.set_book("C", "ETH/BTC", [(0.1, 1)], [(0.11, 1)])
+        matrix = table.spread_matrix()
+        self.assertEqual(["ETH/BTC", "ETH/USD"], matrix.pairs)
+        self.assertEqual(["A", "B", "C"], matrix.exchanges)
+        usd = matrix.pairs.index("ETH/USD")
+        self.assertEqual(800 - 760, matrix.absdiffs[usd, 0, 1])
+        self.assertAlmostEqual(40 / 760, matrix.pctdiffs[usd, 0, 1])
+        self.assertEqual(750 - 810, matrix.absdiffs[usd, 1, 0])
+        self.assertTrue(np.isnan(matrix.absdiffs[usd, 0, 0]))
+        self.assertTrue(np.isnan(matrix.absdiffs[usd, 2, 0]))
+
+        depth = table.spread_matrix(size=2)
+        self.assertEqual(750 - 815, depth.absdiffs[usd, 1, 0])
+        self.assertTrue(np.isnan(table.spread_matrix(size=3).absdiffs[usd, 0, 1]))
+
+    def test_best_spreads(self):
+        table = RateTable()
+        table.set_book("A", "ETH/USD", [(750, 2)], [(760, 2)])
+        table.set_book("B", "ETH/USD", [(800, 2)], [(810, 2)])
+        table.set_book("A", "LTC/USD", [(100, 2)], [(101, 2)])
+        table.set_book("B", "LTC/USD", [(99, 2)], [(99.5, 2)])
+        best = table.best_spreads()
+        self.assertEqual([("ETH/USD", "A", "B"), ("LTC/USD", "B", "A"), ("LTC/USD", "A", "B"),
+                          ("ETH/USD", "B", "A")],
+                         [(spread.pair, spread.buy_exchange, spread.sell_exchange)
+                          for spread in best])
+        self.assertEqual(Spread("ETH/USD", "A", "B", 760, 800, 40, 40 / 760), best[0])
+        self.assertEqual(best[:2], table.best_spreads(min_pct=0))
+        self.assertEqual(best[:1], table.best_spreads(limit=1))
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            RateTable().best_roundtrips("ETH", 1, engine="magic")
+
+    def test_snapshot_is_isolated_from_later_books(self):
+        table = random_table(4)
+        snapshot = table.snapshot()
+        before = list(snapshot["E0"]["C0"]["C1"])
+        table.set_book("E0", "C0/C1", [(9.0, 1.0)], [(9.5, 1.0)])
+        table.set_book("E9", "C0/C1", [(9.0, 1.0)], [(9.5, 1.0)])
+        self.assertEqual(before, list(snapshot["E0"]["C0"]["C1"]))
+        self.assertEqual([(9.0, 1.0)], list(table["E0"]["C0"]["C1"]))
+        self.assertNotIn("E9", snapshot)
+        self.assertEqual(set(), snapshot.changed_since(snapshot.version))
+        self.assertEqual(snapshot.version + 2, table.version)
+        with self.assertRaises(TypeError):
+            snapshot.set_book("E0", "C0/C1", [(1.0, 1.0)], [(1.1, 1.0)])
+
+    def test_deleting_an_exchange_leaves_snapshots_alone(self):
+        table = random_table(4)
+        snapshot = table.snapshot()
+        version = table.version
+        del table["E0"]
+        self.assertNotIn("E0", table)
+        self.assertIn("E0", snapshot)
+        self.assertIn(("E0", "C0", "C1"), table.changed_since(version))
+        with self.assertRaises(TypeError):
+            snapshot.pop("E1")
+        with self.assertRaises(TypeError):
+            del snapshot["E1"]
+        self.assertIn("E1", snapshot)
+        self.assertEqual(["E1", "E2"], sorted(table))
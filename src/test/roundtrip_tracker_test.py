@@ -0,0 +1,75 @@
+import random
+import unittest
+
+from src.roundtrip_tracker import RoundtripTracker
+from src.test.rate_table_test import EXHAUSTIVE, chain_keys, random_table
+
+
+class RoundtripTrackerTest(unittest.TestCase):
+    def assertSameRoundtrips(self, expected, actual):
+        self.assertEqual(chain_keys(expected), chain_keys(actual))
+        for want, got in zip(sorted(expected, key=lambda c: [t.get_unique() for t in c]),
+                             sorted(actual, key=lambda c: [t.get_unique() for t in c])):
+            self.assertEqual([t["value"] for t in want], [t["value"] for t in got])
+
+    @staticmethod
+    def priced(chains):
+        return [tuple((t.get_unique(), t["amount"], t["value"]) for t in chain) for chain in chains]
+
+    def test_incremental_updates_match_full_search(self):
+        rng = random.Random(11)
+        table = random_table(11)
+        tracker = RoundtripTracker(table, "C0", 3, max_steps=3, width=EXHAUSTIVE)
+        self.assertSameRoundtrips(table.best_roundtrips("C0", 3, max_steps=3, width=EXHAUSTIVE),
+                                  tracker.update())
+
+        for _ in range(10):
+            for _ in range(3):
+                coin1, coin2 = sorted(rng.sample(["C0", "C1", "C2", "C3", "XBT", "BTC"], 2))
+                mid = rng.uniform(0.5, 2.0)
+                table.set_book(f"E{rng.randrange(4)}", f"{coin1}/{coin2}",
+                               [(mid * 0.99, rng.uniform(0.1, 50))], [(mid * 1.01, 20)])
+            self.assertSameRoundtrips(table.best_roundtrips("C0", 3, max_steps=3,
+                                                            width=EXHAUSTIVE),
+                                      tracker.update())
+
+    def test_min_profit_updates_match_full_search(self):
+        rng = random.Random(12)
+        table = random_table(12)
+        tracker = RoundtripTracker(table, "C0", 3, max_steps=3, min_profit=0.05,
+                                   width=EXHAUSTIVE)
+        for _ in range(8):
+            self.assertSameRoundtrips(table.best_roundtrips("C0", 3, max_steps=3, min_profit=0.05,
+                                                            width=EXHAUSTIVE),
+                                      tracker.update())
+            coin1, coin2 = sorted(rng.sample(["C0", "C1", "C2", "XBT", "BTC"], 2))
+            mid = rng.uniform(0.5, 2.0)
+            table.set_book(f"E{rng.randrange(3)}", f"{coin1}/{coin2}",
+                           [(mid * 0.99, 20)], [(mid * 1.01, 20)])
+
+    def test_tracks_several_inventories(self):
+        rng = random.Random(13)
+        table = random_table(13, fees=True)
+        inventories = [("C0", 3), ("C0", 30), ("BTC", 2)]
+        tracker = RoundtripTracker(table, "C0", 3, max_steps=3, inventories=inventories[1:],
+                                   width=EXHAUSTIVE)
+        for _ in range(6):
+            found = table.inventory_roundtrips(inventories, max_steps=3, width=EXHAUSTIVE)
+            expected = [chain for chains in found.values() for chain in chains]
+            # The same books can make a roundtrip at both C0 amounts, so compare amounts too.
+            self.assertEqual(sorted(self.priced(expected)), sorted(self.priced(tracker.update())))
+            coin1, coin2 = sorted(rng.sample(["C0", "C1", "C2", "XBT", "BTC"], 2))
+            mid = rng.uniform(0.5, 2.0)
+            table.set_book(f"E{rng.randrange(3)}", f"{coin1}/{coin2}",
+                           [(mid * 0.99, 20)], [(mid * 1.01, 20)])
+
+    def test_unchanged_books_are_not_dirty(self):
+        table = random_table(2)
+        version = table.version
+        table.set_book("E0", "C0/C1", [(1.0, 5.0)], [(1.1, 5.0)])
+        self.assertEqual({("E0", "C0", "C1"), ("E0", "C1", "C0")}, table.changed_since(version))
+
+        version = table.version
+        table.set_book("E0", "C0/C1", [(1.0, 5.0)], [(1.1, 5.0)])
+        self.assertEqual(version, table.version)
+        self.assertEqual(set(), table.changed_since(version))
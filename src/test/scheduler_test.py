@@ -0,0 +1,177 @@
+import asyncio
+import random
+import unittest
+
+from ccxt import RequestTimeout
+
+from src.market_index import MarketIndex
+from src.rate_table import RateTable
+from src.scheduler import PopulateScheduler, backoff_delay
+from src.trade import Trade
+
+
+class FakeExchange:
+    def __init__(self, name, symbols, rate_limit=500, bulk=False):
+        self.name = name
+        self.symbols = symbols
+        self.rateLimit = rate_limit
+        self.hasFetchTickers = False
+        self.has = {"fetchOrderBooks": bulk}
+
+    async def load_markets(self):
+        return self.symbols
+
+
+class FlakyExchange(FakeExchange):
+    """Times out loading markets the first time, like an exchange that's slow at startup."""
+
+    def __init__(self, name, books):
+        super(FlakyExchange, self).__init__(name, None)
+        self.books = books
+        self.markets = None
+        self.fees = {}
+        self.loads = 0
+
+    async def load_markets(self):
+        self.loads += 1
+        if self.loads == 1:
+            raise RequestTimeout("Timed out")
+        self.markets = {symbol: {} for symbol in self.books}
+        self.symbols = list(self.books)
+        return self.markets
+
+    async def fetch_l2_order_book(self, symbol):
+        bids, asks = self.books[symbol]
+        return {"bids": bids, "asks": asks}
+
+
+class RecordingTable(RateTable):
+    def __init__(self, *args, **kwargs):
+        super(RecordingTable, self).__init__(*args, **kwargs)
+        self.calls = []
+        self.retries = []
+        self.failures = 0
+
+    async def populate(self, exchange, blacklisted=None, symbols=None, retries=5):
+        self.calls.append((exchange.name, symbols))
+        self.retries.append(retries)
+        if self.failures:
+            self.failures -= 1
+            raise RequestTimeout("Timed out")
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        super(SchedulerTest, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        self.clock = FakeClock()
+        self.table = RecordingTable()
+        self.exchange = FakeExchange("A", ["ETH/BTC", "LTC/BTC", "XBT/USD", "ETH/USD"])
+        self.scheduler = PopulateScheduler(self.table, [self.exchange], full_interval=5,
+                                           min_interval=0.1, rng=random.Random(0),
+                                           clock=self.clock)
+        self.schedule = self.scheduler.schedules["A"]
+
+    def tearDown(self):
+        self.loop.close()
+        super(SchedulerTest, self).tearDown()
+
+    def refresh(self):
+        _, symbols = self.scheduler.plan(self.schedule, self.clock.now)
+        self.loop.run_until_complete(self.scheduler.refresh(self.schedule, symbols))
+        return symbols
+
+    def test_backoff_grows_with_jitter(self):
+        rng = random.Random(1)
+        delays = [backoff_delay(attempt, 1, 60, rng) for attempt in range(1, 10)]
+        for attempt, delay in enumerate(delays, 1):
+            cap = min(60, 2 ** (attempt - 1))
+            self.assertTrue(cap * 0.5 <= delay <= cap * 1.5)
+        self.assertGreater(delays[4], delays[0])
+
+    def test_hot_books_between_full_refreshes(self):
+        self.assertIsNone(self.refresh())
+        self.assertEqual(self.clock.now + 4 * 0.5, self.schedule.next_run)
+
+        self.scheduler.mark_hot([[Trade("A", "BTC", "ETH", 1, 1, 1),
+                                  Trade("A", "ETH", "USD", 1, 1, 1),
+                                  Trade("A", "USD", "BTC", 1, 1, 1),
+                                  Trade("B", "BTC", "X", 1, 1, 1)]])
+        self.assertEqual({"ETH/BTC", "ETH/USD", "XBT/USD"}, self.schedule.hot)
+
+        self.clock.now += 2
+        self.assertEqual(["ETH/BTC", "ETH/USD", "XBT/USD"], self.refresh())
+        self.assertEqual(self.clock.now + 3 * 0.5, self.schedule.next_run)
+
+        self.clock.now += 3
+        self.assertIsNone(self.refresh())
+        self.assertEqual(11, self.schedule.requests)
+        self.assertEqual([None, ["ETH/BTC", "ETH/USD", "XBT/USD"], None],
+                         [symbols for _, symbols in self.table.calls])
+
+    def test_waits_for_full_interval_without_hot_books(self):
+        self.refresh()
+        at, symbols = self.scheduler.plan(self.schedule, self.clock.now + 1)
+        self.assertIsNone(symbols)
+        self.assertEqual(self.clock.now + 5, at)
+
+    def test_failures_back_off(self):
+        self.table.failures = 2
+        self.refresh()
+        first = self.schedule.next_run - self.clock.now
+        self.refresh()
+        second = self.schedule.next_run - self.clock.now
+        self.assertEqual(2, self.schedule.failures)
+        self.assertTrue(0.5 <= first <= 1.5 and 1 <= second <= 3)
+        self.refresh()
+        self.assertEqual(0, self.schedule.failures)
+        self.assertEqual("full", self.scheduler.state()[0]["refresh"])
+        # populate doesn't retry with backoff of its own underneath the scheduler's.
+        self.assertEqual([1, 1, 1], self.table.retries)
+
+    def test_failed_first_market_load_is_retried(self):
+        table = RateTable()
+        exchange = FlakyExchange("F", {"ETH/BTC": ([(0.05, 1)], [(0.06, 1)])})
+        scheduler = PopulateScheduler(table, [exchange], rng=random.Random(0), clock=self.clock)
+        schedule = scheduler.schedules["F"]
+        self.loop.run_until_complete(scheduler.refresh(schedule, None))
+        self.assertEqual(1, schedule.failures)
+        self.assertNotIn("F", table)
+
+        self.loop.run_until_complete(scheduler.refresh(schedule, None))
+        self.assertEqual(0, schedule.failures)
+        self.assertEqual(2, exchange.loads)
+        self.assertEqual([(0.05, 1)], list(table["F"]["ETH"]["BTC"]))
+
+    def test_unexpected_errors_back_off(self):
+        async def broken(*args, **kwargs):
+            raise TypeError("'NoneType' object is not iterable")
+
+        self.table.populate = broken
+        with self.assertLogs(level="ERROR"):
+            self.refresh()
+        self.assertEqual(1, self.schedule.failures)
+        self.assertGreater(self.schedule.next_run, self.clock.now)
+
+    def test_bulk_exchanges_cost_one_request(self):
+        bulk = FakeExchange("B", ["ETH/BTC"] * 50, bulk=True)
+        self.assertEqual(1, self.scheduler.cost(bulk))
+        self.assertEqual(4, self.scheduler.cost(self.exchange))
+        self.assertEqual(2, self.scheduler.cost(self.exchange, ["ETH/BTC", "LTC/BTC"]))
+
+    def test_full_refresh_fetches_relevant_markets(self):
+        exchange = FakeExchange("C", ["ETH/BTC", "LTC/ETH", "LTC/BTC", "ETH/USD"])
+        scheduler = PopulateScheduler(self.table, [exchange], rng=random.Random(0),
+                                      clock=self.clock, index=MarketIndex("BTC", 3))
+        self.loop.run_until_complete(scheduler.load_markets())
+        self.loop.run_until_complete(scheduler.refresh(scheduler.schedules["C"], None))
+        self.assertEqual([("C", ["ETH/BTC", "LTC/BTC", "LTC/ETH"])], self.table.calls)
+        self.assertEqual(3, scheduler.schedules["C"].requests)
@@ -1,10 +1,13 @@
+import asyncio
 import logging
 import unittest
 
 import more_itertools
 
+from src.book_feed import WebSocketFeed
 from src.sharpshooter import Sharpshooter
 from src.test.mock_exchange import MockExchange
+from src.test.mock_feed import MockFeedServer
 
 
 class SharpshooterTest(unittest.TestCase):
@@ -27,3 +30,59 @@ class SharpshooterTest(unittest.TestCase):
         self.assertEqual("Mock Exchange", trade[0]["exchange"])
         self.assertEqual(["USD", "BTC", "ETH"], [t["from_cur"] for t in trade])
         self.assertEqual(["BTC", "ETH", "USD"], [t["next_cur"] for t in trade])
+
+    def test_run_once_closes_what_it_opened(self):
+        self.exchange.add_ask("ETH/BTC", 0.05, 1000)
+        self.exchange.add_bid("ETH/BTC", 0.05, 1000)
+        sharpshooter = Sharpshooter([self.exchange], ("BTC", 1))
+        self.assertEqual([], sharpshooter.run_once())
+        self.assertIsNone(sharpshooter.http._session)
+        with self.assertRaises(RuntimeError):
+            sharpshooter.compute.executor.submit(print)
+
+    def test_finds_arb_from_streamed_books(self):
+        for symbol, price, volume in (("BTC/USD", 10000, 20000), ("ETH/BTC", 0.05, 1000),
+                                      ("ETH/USD", 750, 40)):
+            self.exchange.add_ask(symbol, price, volume)
+            self.exchange.add_bid(symbol, price, volume)
+        symbols = ["BTC/USD", "ETH/BTC", "ETH/USD"]
+        server = MockFeedServer([self.exchange.snapshot_message(symbol) for symbol in symbols])
+        shooter = Sharpshooter([self.exchange], ("USD", 10000), arbitrage_threshold_pcent=0.05)
+
+        async def stream():
+            await server.start()
+            feed = WebSocketFeed(server.url)
+            try:
+                await shooter.exchange_rates.stream(self.exchange.name, feed, symbols)
+            finally:
+                await feed.close()
+                await server.stop()
+
+        asyncio.get_event_loop().run_until_complete(stream())
+        trade, profit = more_itertools.one(shooter.complex_arbs())
+        self.assertEqual(0.5, profit)
+        self.assertEqual(["USD", "BTC", "ETH"], [t["from_cur"] for t in trade])
+
+    def test_async_search_shares_one_search_between_inventories(self):
+        for symbol, price, volume in (("BTC/USD", 10000, 20000), ("ETH/BTC", 0.05, 1000),
+                                      ("ETH/USD", 750, 40)):
+            self.exchange.add_ask(symbol, price, volume)
+            self.exchange.add_bid(symbol, price, volume)
+        shooter = Sharpshooter([self.exchange], ("USD", 10000), arbitrage_threshold_pcent=0.05,
+                               search_workers=2, inventories=[("BTC", 1)])
+        searches = []
+        search = shooter.search.inventory_roundtrips_async
+
+        async def recording_search(snapshot, inventories, **kwargs):
+            searches.append(list(inventories))
+            return await search(snapshot, inventories, **kwargs)
+
+        shooter.search.inventory_roundtrips_async = recording_search
+        loop = asyncio.get_event_loop()
+        try:
+            loop.run_until_complete(shooter.exchange_rates.populate(self.exchange))
+            arbs = loop.run_until_complete(shooter.complex_arbs_async())
+        finally:
+            shooter.close()
+        self.assertEqual([[("USD", 10000), ("BTC", 1)]], searches)
+        self.assertEqual([0.5, 0.5], sorted(profit for _, profit in arbs))
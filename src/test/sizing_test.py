@@ -0,0 +1,134 @@
+import math
+import unittest
+
+import numpy as np
+
+from src.rate_table import RateTable
+from src.sizing import optimal_size, reprice
+from src.test.rate_table_test import random_table
+from src.trade import Trade
+
+
+def profit(chain, table, amount):
+    repriced = reprice(chain, table, amount)
+    return -np.inf if repriced is None else repriced.value * amount - amount
+
+
+def triangle(fees=False):
+    """A -> B -> C -> A on one exchange, profitable at the top of every book and losing deeper."""
+    table = RateTable()
+    if fees:
+        table.set_fees("E0", {"B/A": 0.001, "C/B": 0.001, "C/A": 0.001}, {})
+    table.set_book("E0", "B/A", [(1.0, 1)], [(1.0, 5), (1.05, 5), (1.2, 100)])
+    table.set_book("E0", "C/B", [(1.0, 1)], [(1.0, 3), (1.1, 10)])
+    table.set_book("E0", "C/A", [(1.1, 4), (1.0, 4), (0.8, 100)], [(1.2, 1)])
+    return table
+
+
+class SizingTest(unittest.TestCase):
+    def assertBestSize(self, chain, table, sized, max_amount=None):
+        # No size sampled up to well past the optimum does better.
+        top = max_amount or sized.size * 3
+        for amount in np.linspace(top / 500, top, 500):
+            self.assertLessEqual(profit(chain, table, amount), sized.profit + 1e-9)
+        self.assertAlmostEqual(profit(chain, table, sized.size), sized.profit)
+
+    def test_triangle(self):
+        table = triangle()
+        chain = table.best_roundtrips("A", 0.1, max_steps=3)[0]
+        sized = optimal_size(chain, table)
+        self.assertIsNotNone(sized)
+        # Every book fills at a profit up to 3 A; after that C/B's second level costs too much.
+        self.assertAlmostEqual(sized.size, 3.0)
+        self.assertAlmostEqual(sized.profit, 0.3)
+        self.assertBestSize(chain, table, sized)
+
+    def test_triangle_with_fees(self):
+        table = triangle(fees=True)
+        chain = table.best_roundtrips("A", 0.1, max_steps=3)[0]
+        sized = optimal_size(chain, table)
+        self.assertLess(sized.profit, 0.3)
+        self.assertBestSize(chain, table, sized)
+
+    def test_max_amount(self):
+        table = triangle()
+        chain = table.best_roundtrips("A", 0.1, max_steps=3)[0]
+        sized = optimal_size(chain, table, max_amount=1.5)
+        self.assertAlmostEqual(sized.size, 1.5)
+        self.assertAlmostEqual(sized.profit, 0.15)
+
+    def test_unprofitable(self):
+        table = triangle()
+        table.set_book("E0", "C/A", [(0.9, 100)], [(1.2, 1)])
+        chains = table.best_roundtrips("A", 0.1, max_steps=3, min_profit=-0.9)
+        self.assertTrue(chains)
+        for chain in chains:
+            self.assertIsNone(optimal_size(chain, table))
+
+    def test_unlimited_depth(self):
+        # Ticker books have a single level of unlimited volume.
+        table = RateTable()
+        table.set_book("E0", "B/A", [(1.0, 1)], [(1.0, math.inf)])
+        table.set_book("E0", "C/B", [(1.0, 1)], [(1.0, math.inf)])
+        table.set_book("E0", "C/A", [(1.5, math.inf)], [(2.0, 1)])
+        chain = table.best_roundtrips("A", 1, max_steps=3)[0]
+        sized = optimal_size(chain, table)
+        self.assertEqual((math.inf, math.inf), (sized.size, sized.profit))
+        self.assertIs(chain, sized.chain)
+        self.assertAlmostEqual(optimal_size(chain, table, max_amount=10).profit, 5)
+        best = table.sized_roundtrips("A", 1, max_steps=3)[0]
+        self.assertEqual(math.inf, best.size)
+        self.assertAlmostEqual(0.5, Trade.profitability(best.chain))
+
+    def test_withdrawal_fees(self):
+        # Moving B to another exchange costs a flat 0.5 B, so small sizes lose and larger win.
+        table = RateTable()
+        table.set_fees("E0", {}, {"B": 0.5})
+        table.set_book("E0", "B/A", [(1.0, 1)], [(1.0, 20)])
+        table.set_book("E1", "B/A", [(1.2, 10), (1.0, 100)], [(2.0, 1)])
+        chain, = table.best_roundtrips("A", 5, max_steps=2)
+        self.assertLess(profit(chain, table, 1), 0)
+        sized = optimal_size(chain, table)
+        self.assertAlmostEqual(sized.size, 10.5)
+        self.assertAlmostEqual(sized.profit, 10 * 1.2 - 10.5)
+        self.assertBestSize(chain, table, sized)
+
+    def test_finds_chains_that_only_pay_at_size(self):
+        # Moving BTC from A costs 0.1 BTC, about $1000: nothing pays until well past the probe.
+        table = RateTable()
+        table.set_fees("A", {}, {"BTC": 0.1})
+        table.set_book("A", "BTC/USD", [(10000, 100)], [(10000, 100)])
+        table.set_book("B", "BTC/USD", [(11000, 100)], [(11000, 100)])
+        for probe in (100, 1000, 5000):
+            best, = table.sized_roundtrips("USD", probe, max_steps=2)
+            self.assertEqual([("A", "USD", "BTC"), ("B", "BTC", "USD")],
+                             [trade.get_unique() for trade in best.chain])
+            self.assertAlmostEqual(best.size, 1000000)
+            self.assertAlmostEqual(best.profit, 100 * 11000 - 0.1 * 11000 - 1000000)
+
+    def test_random_tables(self):
+        checked = 0
+        for seed in range(4):
+            table = random_table(seed, fees=True)
+            for chain in table.best_roundtrips("C0", 0.5, max_steps=3)[:5]:
+                sized = optimal_size(chain, table)
+                if sized is None:
+                    continue
+                checked += 1
+                self.assertGreater(sized.profit, 0)
+                self.assertBestSize(chain, table, sized)
+        self.assertTrue(checked)
+
+    def test_sized_roundtrips(self):
+        table = random_table(1, fees=True)
+        sized = table.sized_roundtrips("C0", 0.5, max_amount=20, max_steps=3)
+        self.assertTrue(sized)
+        profits = [best.profit for best in sized]
+        self.assertEqual(profits, sorted(profits, reverse=True))
+        for best in sized:
+            self.assertLessEqual(best.size, 20 + 1e-9)
+            self.assertGreater(best.profit, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
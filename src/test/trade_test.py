@@ -0,0 +1,32 @@
+import pickle
+import unittest
+
+from src.trade import Chain, Trade
+
+
+class TradeTest(unittest.TestCase):
+    def test_dict_style_access(self):
+        trade = Trade("Mock", "USD", "BTC", 1.0, 10000.0, 0.0001)
+        self.assertEqual("Mock", trade["exchange"])
+        self.assertEqual(trade.next_cur, trade["next_cur"])
+        self.assertEqual(("Mock", "USD", "BTC"), trade.get_unique())
+        self.assertEqual(("Mock", "BTC", "USD"), trade.get_unique_inv())
+        self.assertEqual("{'exchange': 'Mock', 'from_cur': 'USD', 'next_cur': 'BTC', "
+                         "'amount': '1.00000000', 'limit': '10000.00000000', "
+                         "'value': '0.00010000'}", repr(trade))
+        with self.assertRaises(AttributeError):
+            trade["missing"]
+
+    def test_chain_tracks_value_and_books(self):
+        trades = [Trade("A", "USD", "BTC", 0.5, 20000, 0.5), Trade("B", "BTC", "USD", 1.5, 3, 3)]
+        chain = Chain().then(trades[0])
+        longer = chain.then(trades[1])
+        self.assertEqual(1, len(chain))
+        self.assertEqual(trades, list(longer))
+        self.assertEqual("B", longer[-1]["exchange"])
+        self.assertAlmostEqual(Trade.profitability(trades), Trade.profitability(longer))
+        self.assertEqual(2, Trade.num_exchanges(longer))
+        self.assertTrue(chain.uses(("A", "BTC", "USD")))
+        self.assertTrue(chain.uses(("A", "USD", "BTC")))
+        self.assertFalse(chain.uses(("B", "BTC", "USD")))
+        self.assertEqual(list(longer), list(pickle.loads(pickle.dumps(longer))))
@@ -1,39 +1,84 @@
-from collections import UserDict
+from collections import namedtuple
+from collections.abc import Sequence
 
+_TradeFields = namedtuple("_TradeFields",
+                          ["exchange", "from_cur", "next_cur", "amount", "limit", "value"])
 
-class Trade(UserDict):
-    def __init__(self, exchange, from_cur, next_cur, amount, limit, value):
-        super(Trade, self).__init__(
-            exchange=exchange,
-            from_cur=from_cur,
-            next_cur=next_cur,
-            amount=amount,
-            limit=limit,
-            value=value
-        )
+
+class Trade(_TradeFields):
+    """One conversion in a chain, stored as a plain tuple.
+
+    Fields read as attributes or, like the dict Trade used to be, by name: trade["exchange"].
+    """
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
+
+    def keys(self):
+        return self._fields
+
+    def items(self):
+        return zip(self._fields, self)
 
     @staticmethod
     def profitability(trades):
         """Returns the profitability as a percentage of a given chain."""
+        if isinstance(trades, Chain):
+            return trades.value - 1.0
         profit = 1.0
         for trade in trades or []:
-            profit *= trade["value"]
+            profit *= trade.value
         return profit - 1.0
 
     @staticmethod
     def num_exchanges(trades):
         """Returns the number of exchanges coins traverse in this chain."""
-        exchanges = set()
-        for trade in trades:
-            exchanges.add(trade["exchange"])
-        return len(exchanges)
+        return len({trade.exchange for trade in trades})
 
     def get_unique(self):
         """Get the unique elements of a trade."""
-        return self["exchange"], self["from_cur"], self["next_cur"]
+        return self.exchange, self.from_cur, self.next_cur
 
     def get_unique_inv(self):
-        return self["exchange"], self["next_cur"], self["from_cur"]
+        return self.exchange, self.next_cur, self.from_cur
 
     def __repr__(self):
         return repr({k: f"{v:.8f}" if isinstance(v, float) else v for k, v in self.items()})
+
+
+class Chain(Sequence):
+    """An immutable sequence of trades that keeps its overall value up to date as it grows."""
+    __slots__ = ("trades", "value")
+
+    def __init__(self, trades=(), value=1.0):
+        self.trades = trades
+        self.value = value
+
+    def then(self, trade):
+        """Returns a new chain with trade appended."""
+        return Chain(self.trades + (trade,), self.value * trade.value)
+
+    def uses(self, book):
+        """Returns whether an (exchange, from_cur, to_cur) book is traded in either direction."""
+        exchange, from_cur, to_cur = book
+        for trade in self.trades:
+            if trade.exchange == exchange \
+                    and ((trade.from_cur == from_cur and trade.next_cur == to_cur)
+                         or (trade.from_cur == to_cur and trade.next_cur == from_cur)):
+                return True
+        return False
+
+    def __getitem__(self, index):
+        return self.trades[index]
+
+    def __len__(self):
+        return len(self.trades)
+
+    def __iter__(self):
+        return iter(self.trades)
+
+    def __repr__(self):
+        return repr(list(self.trades))